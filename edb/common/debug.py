@@ -106,6 +106,10 @@ class flags(metaclass=FlagsMeta):
     disable_qcache = Flag(
         doc="Disable server query cache. Parse/Execute will always recompile.")
 
+    server_no_forkserver = Flag(
+        doc="Spawn compiler workers as new processes instead of forking "
+            "them from a preloaded template process.")
+
 
 @contextlib.contextmanager
 def timeit(title='block'):
@@ -68,8 +68,17 @@ class LRUMapping(collections.abc.MutableMapping):
     def __contains__(self, key):
         return key in self._dict
 
+    def peek(self, key, default=None):
+        # Look up the entry without promoting it.
+        return self._dict.get(key, default)
+
     def __len__(self):
         return len(self._dict)
 
     def __iter__(self):
         return iter(self._dict)
+
+    def items(self):
+        # Iterating over the entries must not promote them (and
+        # mutate the dict while it is being iterated over.)
+        return self._dict.items()
@@ -0,0 +1,220 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Counters, gauges and histograms exposed in Prometheus text format."""
+
+
+from __future__ import annotations
+
+import bisect
+import math
+import typing
+
+
+# Seconds; suitable for latencies of compilation and queries.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Registry:
+
+    def __init__(self, *, prefix: str = ''):
+        self._prefix = prefix
+        self._metrics: typing.Dict[str, BaseMetric] = {}
+        self._collectors: typing.List[typing.Callable[[], None]] = []
+
+    def _add(self, metric: BaseMetric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f'duplicate metric {metric.name!r}')
+        self._metrics[metric.name] = metric
+
+    def new_counter(self, name: str, desc: str, *,
+                    labels: typing.Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(self._prefix + name, desc, labels=labels)
+        self._add(metric)
+        return metric
+
+    def new_gauge(self, name: str, desc: str, *,
+                  labels: typing.Tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(self._prefix + name, desc, labels=labels)
+        self._add(metric)
+        return metric
+
+    def new_histogram(self, name: str, desc: str, *,
+                      labels: typing.Tuple[str, ...] = (),
+                      buckets: typing.Sequence[float] = DEFAULT_BUCKETS
+                      ) -> Histogram:
+        metric = Histogram(
+            self._prefix + name, desc, labels=labels, buckets=buckets)
+        self._add(metric)
+        return metric
+
+    def add_collector(self, collector: typing.Callable[[], None]) -> None:
+        """Register a function updating metrics before they are rendered.
+
+        Useful for values that are maintained elsewhere, e.g. the
+        number of connections in a pool.
+        """
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: typing.Callable[[], None]) -> None:
+        self._collectors.remove(collector)
+
+    def generate(self) -> str:
+        for collector in self._collectors:
+            collector()
+
+        buf: typing.List[str] = []
+        for metric in self._metrics.values():
+            metric._render(buf)
+        return ''.join(buf)
+
+
+class BaseMetric:
+
+    _type: str
+
+    def __init__(self, name: str, desc: str, *,
+                 labels: typing.Tuple[str, ...]):
+        self.name = name
+        self.desc = desc
+        self.labels = labels
+        self._values: typing.Dict[typing.Tuple[str, ...], typing.Any] = {}
+
+    def _check_labels(self, labels: typing.Tuple[str, ...]) -> None:
+        if len(labels) != len(self.labels):
+            raise ValueError(
+                f'{self.name}: expected {len(self.labels)} label values, '
+                f'got {len(labels)}')
+
+    def _render_labels(self, labels: typing.Tuple[str, ...],
+                       extra: str = '') -> str:
+        pairs = [
+            f'{name}="{_escape_label(value)}"'
+            for name, value in zip(self.labels, labels)
+        ]
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(pairs) + '}'
+
+    def _render_header(self, buf: typing.List[str]) -> None:
+        buf.append(f'# HELP {self.name} {_escape_help(self.desc)}\n')
+        buf.append(f'# TYPE {self.name} {self._type}\n')
+
+    def _render(self, buf: typing.List[str]) -> None:
+        self._render_header(buf)
+        for labels, value in sorted(self._values.items()):
+            buf.append(
+                f'{self.name}{self._render_labels(labels)} '
+                f'{_format_value(value)}\n')
+
+
+class Counter(BaseMetric):
+
+    _type = 'counter'
+
+    def inc(self, value: float = 1.0, *labels: str) -> None:
+        self._check_labels(labels)
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def set_total(self, value: float, *labels: str) -> None:
+        """Set the value of a counter maintained elsewhere."""
+        self._check_labels(labels)
+        self._values[labels] = value
+
+
+class Gauge(BaseMetric):
+
+    _type = 'gauge'
+
+    def set(self, value: float, *labels: str) -> None:
+        self._check_labels(labels)
+        self._values[labels] = value
+
+    def inc(self, value: float = 1.0, *labels: str) -> None:
+        self._check_labels(labels)
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def dec(self, value: float = 1.0, *labels: str) -> None:
+        self.inc(-value, *labels)
+
+
+class Histogram(BaseMetric):
+
+    _type = 'histogram'
+
+    def __init__(self, name: str, desc: str, *,
+                 labels: typing.Tuple[str, ...],
+                 buckets: typing.Sequence[float]):
+        super().__init__(name, desc, labels=labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        self._check_labels(labels)
+        try:
+            counts, total = self._values[labels]
+        except KeyError:
+            # The last bucket is "+Inf".
+            counts = [0] * (len(self.buckets) + 1)
+            total = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._values[labels] = (counts, total + value)
+
+    def _render(self, buf: typing.List[str]) -> None:
+        self._render_header(buf)
+        for labels, (counts, total) in sorted(self._values.items()):
+            accum = 0
+            for le, count in zip(self.buckets + (math.inf,), counts):
+                accum += count
+                le_label = self._render_labels(
+                    labels, f'le="{_format_value(le)}"')
+                buf.append(f'{self.name}_bucket{le_label} {accum}\n')
+            label_str = self._render_labels(labels)
+            buf.append(f'{self.name}_sum{label_str} {_format_value(total)}\n')
+            buf.append(f'{self.name}_count{label_str} {accum}\n')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    elif value == -math.inf:
+        return '-Inf'
+    elif math.isnan(value):
+        return 'NaN'
+    elif isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    else:
+        return repr(value)
+
+
+def _escape_label(value: str) -> str:
+    return (
+        str(value)
+        .replace('\\', r'\\')
+        .replace('\n', r'\n')
+        .replace('"', r'\"')
+    )
+
+
+def _escape_help(desc: str) -> str:
+    return desc.replace('\\', r'\\').replace('\n', r'\n')
@@ -30,6 +30,13 @@ from . import ast as irast
 from . import typeutils
 
 
+# Types whose views read the files in the data directory of the
+# primary server, such as the saved query statistics.
+PRIMARY_ONLY_TYPES = frozenset({
+    'sys::QueryStats',
+})
+
+
 def get_terminal_references(ir):
     result = set()
     parents = set()
@@ -51,6 +58,57 @@ def get_variables(ir):
     return result
 
 
+def get_schema_object_ids(ir):
+    """Return the IDs of the schema objects the *ir* query refers to."""
+    result = {obj.id for obj in ir.schema_refs}
+
+    def visit_typeref(typeref):
+        result.add(typeref.id)
+        if typeref.material_type is not None:
+            visit_typeref(typeref.material_type)
+        for subtype in typeref.subtypes or ():
+            visit_typeref(subtype)
+        for child in typeref.children or ():
+            visit_typeref(child)
+
+    def flt(node):
+        if isinstance(node, irast.TypeRef):
+            visit_typeref(node)
+        elif isinstance(node, irast.PointerRef):
+            result.add(node.id)
+            if isinstance(node.material_ptr, irast.PointerRef):
+                result.add(node.material_ptr.id)
+        else:
+            return False
+
+        # Don't descend into the sources and targets of pointers and
+        # the like: they are only relevant if they are queried, in
+        # which case there are references to them elsewhere.
+        raise ast.SkipNode
+
+    ast.find_children(ir, flt)
+    return frozenset(result)
+
+
+def is_read_only(ir):
+    """Return True if the *ir* query can run on a read-only replica.
+
+    The query must not modify data and must not depend on the state
+    of the session, which is kept in temporary tables of the backend
+    connection, or on the data directory of the primary server.
+    """
+    def flt(node):
+        return (
+            isinstance(node, irast.MutatingStmt) or
+            (isinstance(node, irast.FunctionCall) and node.session_only) or
+            (isinstance(node, irast.TypeRef) and
+                (node.name_hint.startswith('cfg::') or
+                 node.name_hint in PRIMARY_ONLY_TYPES))
+        )
+
+    return not ast.find_children(ir, flt, terminate_early=True)
+
+
 def is_const(ir):
     flt = lambda n: isinstance(n, irast.Set) and n.expr is None
     ir_sets = ast.find_children(ir, flt)
@@ -55,6 +55,7 @@ ql = common.quote_literal
 DATABASE_ID_NAMESPACE = uuid.UUID('0e6fed66-204b-11e9-8666-cffd58a5240b')
 CONFIG_ID_NAMESPACE = uuid.UUID('a48b38fa-349b-11e9-a6be-4f337f82f5ad')
 CONFIG_ID = uuid.UUID('172097a4-39f4-11e9-b189-9321eb2f4b97')
+QUERY_STATS_ID_NAMESPACE = uuid.UUID('63d5c482-c9b3-11f1-ab1a-02fc00000001')
 
 
 class Context:
@@ -97,6 +98,30 @@ class ExpressionType(dbops.CompositeType):
         ])
 
 
+class SchemaSnapshotTable(dbops.Table):
+    """The latest snapshot of the database schema.
+
+    The hash of the schema is written in the transaction of every
+    DDL command, the snapshot itself is filled in by the server
+    after the commit.  Used to load the schema without introspecting
+    the catalogs.
+    """
+
+    def __init__(self):
+        super().__init__(name=('edgedb', '_schema_snapshot'))
+
+        self.add_columns([
+            dbops.Column(name='_sentinel', type='bool', required=True,
+                         default='TRUE'),
+            dbops.Column(name='version', type='text', required=True),
+            dbops.Column(name='hash', type='bytea', required=True),
+            dbops.Column(name='snapshot', type='bytea'),
+        ])
+
+        self.add_constraint(
+            dbops.PrimaryKey(self.name, columns=('_sentinel',)))
+
+
 class GetObjectMetadata(dbops.Function):
     """Return EdgeDB metadata associated with a backend object."""
     text = '''
@@ -1618,6 +1643,10 @@ async def bootstrap(conn):
         for mcls, table in list(metaclass_tables.items())[1:])
 
     commands.add_commands([
+        dbops.CreateTable(SchemaSnapshotTable()),
+        # Advanced on every schema or system config change; see
+        # edb.server.server.Server.signal_sys_event().
+        dbops.CreateSequence(name=('edgedb', '_sysevent_version')),
         dbops.CreateFunction(GetObjectMetadata()),
         dbops.CreateFunction(GetSharedObjectMetadata()),
         dbops.CreateFunction(RaiseExceptionFunction()),
@@ -1972,6 +2001,96 @@ def _generate_role_views(schema):
     ]
 
 
+def _generate_query_stats_view(schema):
+    QueryStats = schema.get('sys::QueryStats')
+
+    # Every server process periodically saves its statistics to
+    # a query_stats/<frontend_id>.json file in the data directory
+    # (see edb.server.querystats), the view aggregates them.  Only
+    # the files of the servers running on the host of the Postgres
+    # server are read; the statistics of remote servers are not
+    # shown.
+    view_query = f'''
+        WITH
+            data_dir AS
+                (SELECT setting AS dir FROM pg_settings
+                 WHERE name = 'data_directory'),
+
+            stats AS
+                (SELECT
+                    e.value AS v
+                FROM
+                    data_dir d
+                    CROSS JOIN LATERAL
+                        pg_ls_dir(d.dir || '/query_stats', true, false)
+                            AS f(name)
+                    CROSS JOIN LATERAL
+                        jsonb_array_elements(
+                            pg_read_file(
+                                d.dir || '/query_stats/' || f.name
+                            )::jsonb
+                        ) AS e
+                WHERE
+                    f.name LIKE '%.json'),
+
+            totals AS
+                (SELECT
+                    v->>'database' AS database,
+                    v->>'sql_hash' AS sql_hash,
+                    max(v->>'query') AS query,
+                    sum((v->>'calls')::int8)::int8 AS calls,
+                    sum((v->>'cache_hits')::int8)::int8 AS cache_hits,
+                    sum((v->>'compilations')::int8)::int8 AS compilations,
+                    sum((v->>'rows')::int8)::int8 AS rows,
+                    sum((v->>'total_compile_time')::float8)
+                        AS total_compile_time,
+                    max((v->>'max_compile_time')::float8)
+                        AS max_compile_time,
+                    sum((v->>'total_exec_time')::float8)
+                        AS total_exec_time,
+                    max((v->>'max_exec_time')::float8)
+                        AS max_exec_time
+                FROM
+                    stats
+                GROUP BY
+                    v->>'database', v->>'sql_hash')
+
+        SELECT
+            edgedb.uuid_generate_v5(
+                '{QUERY_STATS_ID_NAMESPACE}'::uuid,
+                t.database || '/' || t.sql_hash)
+                                AS id,
+            (SELECT id FROM edgedb.Object
+                 WHERE name = 'sys::QueryStats') AS __type__,
+            t.database          AS database,
+            t.query             AS query,
+            t.sql_hash          AS sql_hash,
+            t.calls             AS calls,
+            t.cache_hits        AS cache_hits,
+            t.compilations      AS compilations,
+            t.rows              AS rows,
+            make_interval(secs => t.total_compile_time)
+                                AS total_compile_time,
+            make_interval(
+                secs => t.total_compile_time
+                         / NULLIF(t.compilations, 0))
+                                AS mean_compile_time,
+            make_interval(secs => t.max_compile_time)
+                                AS max_compile_time,
+            make_interval(secs => t.total_exec_time)
+                                AS total_exec_time,
+            make_interval(
+                secs => t.total_exec_time / NULLIF(t.calls, 0))
+                                AS mean_exec_time,
+            make_interval(secs => t.max_exec_time)
+                                AS max_exec_time
+        FROM
+            totals AS t
+    '''
+
+    return dbops.View(name=tabname(schema, QueryStats), query=view_query)
+
+
 def _lookup_type(qual):
     return f'''(
         SELECT
@@ -2683,6 +2802,9 @@ async def generate_views(conn, schema):
     for role_view in role_views:
         views[role_view.name] = role_view
 
+    query_stats_view = _generate_query_stats_view(schema)
+    views[query_stats_view.name] = query_stats_view
+
     types_view = views[tabname(schema, schema.get('schema::Type'))]
     types_view.query += '\nUNION ALL\n' + '\nUNION ALL\n'.join(f'''
         (
@@ -41,6 +41,32 @@ STD_MODULES = frozenset({'std', 'schema', 'stdgraphql', 'math', 'sys', 'cfg'})
 
 _void = object()
 
+# Schema attributes that are updated by schema changes.
+_MAPS = (
+    '_id_to_data',
+    '_id_to_type',
+    '_name_to_id',
+    '_shortname_to_id',
+    '_globalname_to_id',
+    '_refs_to',
+)
+
+
+class _ChangeLogEntry:
+    """An ID of an object changed by a schema mutation.
+
+    The entries form a chain from the most recent change to the root
+    entry, which has no parent.  Schemas derived from each other share
+    the chain, so the objects changed between them can be found without
+    comparing the schemas in full (see Schema.get_changes_since().)
+    """
+
+    __slots__ = ('parent', 'obj_id')
+
+    def __init__(self, parent, obj_id):
+        self.parent = parent
+        self.obj_id = obj_id
+
 
 class Schema:
 
@@ -52,10 +78,22 @@ class Schema:
         self._globalname_to_id = immu.Map()
         self._refs_to = immu.Map()
         self._generation = 0
+        self._changelog = _ChangeLogEntry(None, None)
+
+    def __getstate__(self):
+        # The change log references every schema this one was
+        # derived from; it is useless in another process.
+        state = self.__dict__.copy()
+        del state['_changelog']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._changelog = _ChangeLogEntry(None, None)
 
     def _replace(self, *, id_to_data=None, id_to_type=None,
                  name_to_id=None, shortname_to_id=None, globalname_to_id=None,
-                 refs_to=None):
+                 refs_to=None, changed_id=None):
         new = Schema.__new__(Schema)
 
         if id_to_data is None:
@@ -90,6 +128,11 @@ class Schema:
 
         new._generation = self._generation + 1
 
+        if changed_id is None:
+            new._changelog = self._changelog
+        else:
+            new._changelog = _ChangeLogEntry(self._changelog, changed_id)
+
         return new
 
     def _update_obj_name(self, obj_id, scls, old_name, new_name):
@@ -183,7 +226,8 @@ class Schema:
                              shortname_to_id=shortname_to_id,
                              globalname_to_id=globalname_to_id,
                              id_to_data=id_to_data,
-                             refs_to=refs_to)
+                             refs_to=refs_to,
+                             changed_id=obj_id)
 
     def _get_obj_field(self, obj_id, field):
         try:
@@ -232,7 +276,8 @@ class Schema:
                              shortname_to_id=shortname_to_id,
                              globalname_to_id=globalname_to_id,
                              id_to_data=id_to_data,
-                             refs_to=refs_to)
+                             refs_to=refs_to,
+                             changed_id=obj_id)
 
     def _unset_obj_field(self, obj_id, field):
         try:
@@ -268,7 +313,27 @@ class Schema:
                              shortname_to_id=shortname_to_id,
                              globalname_to_id=globalname_to_id,
                              id_to_data=id_to_data,
-                             refs_to=refs_to)
+                             refs_to=refs_to,
+                             changed_id=obj_id)
+
+    def _get_field_ref_ids(self, data, field_name):
+        if not data:
+            return None
+
+        try:
+            ref = data[field_name]
+        except KeyError:
+            return None
+
+        if isinstance(ref, so.ObjectCollection):
+            return frozenset(ref.ids(self))
+        elif isinstance(ref, s_expr.Expression):
+            if ref.refs:
+                return frozenset(ref.refs.ids(self))
+            else:
+                return frozenset()
+        else:
+            return frozenset((ref.id,))
 
     def _update_refs_to(self, scls, orig_data, new_data) -> immu.Map:
         scls_type = type(scls)
@@ -280,41 +345,8 @@ class Schema:
 
         with self._refs_to.mutate() as mm:
             for field in objfields:
-                if not new_data:
-                    ids = None
-                else:
-                    try:
-                        ref = new_data[field.name]
-                    except KeyError:
-                        ids = None
-                    else:
-                        if isinstance(ref, so.ObjectCollection):
-                            ids = frozenset(ref.ids(self))
-                        elif isinstance(ref, s_expr.Expression):
-                            if ref.refs:
-                                ids = frozenset(ref.refs.ids(self))
-                            else:
-                                ids = frozenset()
-                        else:
-                            ids = frozenset((ref.id,))
-
-                if not orig_data:
-                    orig_ids = None
-                else:
-                    try:
-                        ref = orig_data[field.name]
-                    except KeyError:
-                        orig_ids = None
-                    else:
-                        if isinstance(ref, so.ObjectCollection):
-                            orig_ids = frozenset(ref.ids(self))
-                        elif isinstance(ref, s_expr.Expression):
-                            if ref.refs:
-                                orig_ids = frozenset(ref.refs.ids(self))
-                            else:
-                                orig_ids = frozenset()
-                        else:
-                            orig_ids = frozenset((ref.id,))
+                ids = self._get_field_ref_ids(new_data, field.name)
+                orig_ids = self._get_field_ref_ids(orig_data, field.name)
 
                 if not ids and not orig_ids:
                     continue
@@ -378,6 +410,7 @@ class Schema:
             shortname_to_id=shortname_to_id,
             globalname_to_id=globalname_to_id,
             refs_to=self._update_refs_to(scls, None, data),
+            changed_id=id,
         )
 
         if (not isinstance(scls, so.UnqualifiedObject)
@@ -409,6 +442,7 @@ class Schema:
             id_to_data=self._id_to_data.delete(obj.id),
             id_to_type=self._id_to_type.delete(obj.id),
             refs_to=refs_to,
+            changed_id=obj.id,
         ))
 
         return self._replace(**updates)
@@ -622,6 +656,104 @@ class Schema:
     def get_objects(self, *, modules=None, type=None):
         return SchemaIterator(self, modules=modules, type=type)
 
+    def get_changes_since(self, base):
+        """Return the changes that turn *base* into this schema.
+
+        The result only contains the changed entries and can be applied
+        to a copy of *base* with apply_changes().  If this schema was
+        derived from *base*, only the entries of the objects changed
+        since *base* are compared, so the cost is proportional to the
+        size of the change; otherwise the modified maps are compared in
+        full.
+        """
+        keys = self._get_changed_keys(base)
+
+        changes = {}
+        for attr in _MAPS:
+            old = getattr(base, attr)
+            new = getattr(self, attr)
+            if old is new:
+                continue
+
+            updated = {}
+            deleted = []
+            if keys is None:
+                for key, value in new.items():
+                    if old.get(key, _void) is not value:
+                        updated[key] = value
+                deleted.extend(key for key in old if key not in new)
+            else:
+                for key in keys[attr]:
+                    value = new.get(key, _void)
+                    if value is _void:
+                        if key in old:
+                            deleted.append(key)
+                    elif old.get(key, _void) is not value:
+                        updated[key] = value
+
+            if updated or deleted:
+                changes[attr] = (updated, deleted)
+
+        return changes
+
+    def _get_changed_keys(self, base):
+        # Return the keys of every map entry that could have been
+        # changed since *base*, or None if this schema was not
+        # derived from *base*.
+        changed_ids = set()
+        entry = self._changelog
+        while entry is not base._changelog:
+            if entry.parent is None:
+                return None
+            changed_ids.add(entry.obj_id)
+            entry = entry.parent
+
+        keys = {attr: set() for attr in _MAPS}
+        for obj_id in changed_ids:
+            keys['_id_to_data'].add(obj_id)
+            keys['_id_to_type'].add(obj_id)
+
+            # The entries of the other maps are derived from the
+            # data of the object before and after the changes.
+            for schema in (base, self):
+                data = schema._id_to_data.get(obj_id)
+                if data is None:
+                    continue
+
+                stype = type(schema._id_to_type[obj_id])
+                name = data.get('name')
+                if name is not None:
+                    if issubclass(stype, so.UnqualifiedObject):
+                        keys['_globalname_to_id'].add((stype, name))
+                    else:
+                        keys['_name_to_id'].add(name)
+                    if issubclass(stype, (s_func.Function, s_oper.Operator)):
+                        keys['_shortname_to_id'].add(
+                            (stype, sn.shortname_from_fullname(name)))
+
+                for field in stype.get_object_fields():
+                    ref_ids = schema._get_field_ref_ids(data, field.name)
+                    if ref_ids:
+                        keys['_refs_to'].update(ref_ids)
+
+        return keys
+
+    def apply_changes(self, changes):
+        new = self._replace()
+        for attr, (updated, deleted) in changes.items():
+            with getattr(self, attr).mutate() as mm:
+                for key in deleted:
+                    mm.pop(key, None)
+                for key, value in updated.items():
+                    mm[key] = value
+                setattr(new, attr, mm.finish())
+
+        updated, deleted = changes.get('_id_to_data', ({}, ()))
+        for obj_id in itertools.chain(updated, deleted):
+            new._changelog = _ChangeLogEntry(new._changelog, obj_id)
+
+        return new
+
     def __repr__(self):
         return (
             f'<{type(self).__name__} gen:{self._generation} at {id(self):#x}>')
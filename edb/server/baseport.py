@@ -18,12 +18,17 @@
 
 
 import collections.abc
+import logging
 import socket
 
+from edb.common import debug
 from edb.common import devmode
 from edb.server import procpool
 
 
+logger = logging.getLogger('edb.server')
+
+
 class Port:
 
     def __init__(self, *, server, loop,
@@ -59,6 +64,13 @@ class Port:
     def get_compiler_worker_name(self):
         raise NotImplementedError
 
+    def get_compiler_worker_args(self):
+        return (
+            dict(host=self._pg_addr),
+            self._pg_data_dir,
+            self._internal_runstate_dir,
+        )
+
     async def new_compiler(self, dbname, dbver):
         compiler_worker = await self._compiler_manager.spawn_worker()
         try:
@@ -68,17 +80,42 @@ class Port:
             raise
         return compiler_worker
 
+    def propagate_schema_delta(self, dbname, base_dbver, dbver, delta):
+        if self._compiler_manager is None:
+            return
+
+        # Worker.call() sends the request right away, so the workers
+        # get the changes before any request to compile something
+        # against the new version of the database.
+        for worker in self._compiler_manager.iter_workers():
+            request = worker.call(
+                'apply_schema_delta', dbname, base_dbver, dbver, delta)
+            self._loop.create_task(
+                self._wait_schema_delta_applied(request, dbname))
+
+    async def _wait_schema_delta_applied(self, request, dbname):
+        try:
+            await request
+        except Exception:
+            # The worker will introspect the new schema when needed.
+            logger.debug(
+                'could not apply schema changes of %r in a compiler',
+                dbname, exc_info=True)
+
     async def start(self):
         if self._serving:
             raise RuntimeError('already serving')
         self._serving = True
 
-        self._compiler_manager = await procpool.create_manager(
+        self._compiler_manager = await self.create_compiler_manager()
+
+    async def create_compiler_manager(self):
+        return await procpool.create_manager(
             runstate_dir=self._internal_runstate_dir,
-            worker_args=(dict(host=self._pg_addr),
-                         self._pg_data_dir),
+            worker_args=self.get_compiler_worker_args(),
             worker_cls=self.get_compiler_worker_cls(),
             name=self.get_compiler_worker_name(),
+            use_forkserver=not debug.flags.server_no_forkserver,
         )
 
     async def stop(self):
@@ -89,43 +126,47 @@ class Port:
         self._serving = False
 
     async def _fix_localhost(self, host, port):
-        # On many systems 'localhost' resolves to _both_ IPv4 and IPv6
-        # addresses, even if the system is not capable of handling
-        # IPv6 connections.  Due to the common nature of this issue
-        # we explicitly disable the AF_INET6 component of 'localhost'.
+        return await fix_localhost(self._loop, host, port)
 
-        if (isinstance(host, str)
-                or not isinstance(host, collections.abc.Iterable)):
-            hosts = [host]
-        else:
-            hosts = list(host)
 
-        try:
-            idx = hosts.index('localhost')
-        except ValueError:
-            # No localhost, all good
-            return hosts
-
-        localhost = await self._loop.getaddrinfo(
-            'localhost',
-            port,
-            family=socket.AF_UNSPEC,
-            type=socket.SOCK_STREAM,
-            flags=socket.AI_PASSIVE,
-            proto=0,
-        )
+async def fix_localhost(loop, host, port):
+    # On many systems 'localhost' resolves to _both_ IPv4 and IPv6
+    # addresses, even if the system is not capable of handling
+    # IPv6 connections.  Due to the common nature of this issue
+    # we explicitly disable the AF_INET6 component of 'localhost'.
 
-        infos = [a for a in localhost if a[0] == socket.AF_INET]
+    if (isinstance(host, str)
+            or not isinstance(host, collections.abc.Iterable)):
+        hosts = [host]
+    else:
+        hosts = list(host)
 
-        if not infos:
-            # "localhost" did not resolve to an IPv4 address,
-            # let create_server handle the situation.
-            return hosts
+    try:
+        idx = hosts.index('localhost')
+    except ValueError:
+        # No localhost, all good
+        return hosts
+
+    localhost = await loop.getaddrinfo(
+        'localhost',
+        port,
+        family=socket.AF_UNSPEC,
+        type=socket.SOCK_STREAM,
+        flags=socket.AI_PASSIVE,
+        proto=0,
+    )
 
-        # Replace 'localhost' with explicitly resolved AF_INET addresses.
-        hosts.pop(idx)
-        for info in reversed(infos):
-            addr, *_ = info[4]
-            hosts.insert(idx, addr)
+    infos = [a for a in localhost if a[0] == socket.AF_INET]
 
+    if not infos:
+        # "localhost" did not resolve to an IPv4 address,
+        # let create_server handle the situation.
         return hosts
+
+    # Replace 'localhost' with explicitly resolved AF_INET addresses.
+    hosts.pop(idx)
+    for info in reversed(infos):
+        addr, *_ = info[4]
+        hosts.insert(idx, addr)
+
+    return hosts
@@ -17,7 +17,9 @@
 #
 
 
+from .persistent_cache import PersistentQueryCache
+from .query_cache import QueryCache
 from .stmt_cache import StatementsCache
 
 
-__all__ = ('StatementsCache',)
+__all__ = ('PersistentQueryCache', 'QueryCache', 'StatementsCache',)
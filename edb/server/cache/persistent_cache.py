@@ -0,0 +1,135 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Compiled queries persisted across server restarts.
+
+Compiled queries of every database are pickled into one file of the
+cache directory together with the hash of the schema snapshot they
+were compiled against (see Compiler._publish_schema_changes()) and
+the version of the server that compiled them.  Persisted queries are
+only loaded if both match the current ones.
+
+Every file is written to a temporary file first and then renamed, and
+is prefixed with a hash of its contents, so a crash in the middle of
+a write or a damaged file never produces bogus queries: such files
+are ignored.
+"""
+
+
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+import typing
+
+
+logger = logging.getLogger('edb.server')
+
+_HASH_LEN = hashlib.sha256().digest_size
+
+
+class PersistentQueryCache:
+
+    def __init__(self, cache_dir: str, version: str, maxsize: int):
+        self._cache_dir = pathlib.Path(cache_dir)
+        self._version = version
+        self._maxsize = maxsize
+
+    def get_version(self) -> str:
+        return self._version
+
+    def _get_path(self, dbname: str) -> pathlib.Path:
+        # Database names can contain characters that are not
+        # allowed in file names.
+        dbhash = hashlib.sha1(dbname.encode()).hexdigest()
+        return self._cache_dir / f'queries-{dbhash}.pickle'
+
+    def load(self, dbname: str,
+             schema_hash: bytes) -> typing.List[typing.Tuple[object, object]]:
+        """Return the persisted (key, query unit) pairs of *dbname*.
+
+        The pairs are ordered from the least to the most recently
+        used query.  Like store(), it should be called in an executor.
+        """
+        path = self._get_path(dbname)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        checksum, payload = data[:_HASH_LEN], data[_HASH_LEN:]
+        if hashlib.sha256(payload).digest() != checksum:
+            logger.warning(
+                'ignoring damaged query cache of database %r', dbname)
+            self.discard(dbname)
+            return []
+
+        try:
+            version, cached_schema_hash, entries = pickle.loads(payload)
+        except Exception:
+            logger.warning(
+                'could not load query cache of database %r', dbname,
+                exc_info=True)
+            self.discard(dbname)
+            return []
+
+        if version != self._version or cached_schema_hash != schema_hash:
+            # The queries were compiled by a different version of
+            # the server or against a different schema.
+            return []
+
+        return entries
+
+    def store(self, dbname: str, schema_hash: bytes,
+              entries: typing.List[typing.Tuple[object, object]]):
+        """Persist the (key, query unit) pairs of *dbname*.
+
+        Only the last *maxsize* (that is, the most recently used)
+        pairs are persisted.  Pickling the queries and writing them
+        can take a while: call it in an executor.
+        """
+        entries = entries[-self._maxsize:]
+        payload = pickle.dumps(
+            (self._version, schema_hash, entries),
+            protocol=pickle.HIGHEST_PROTOCOL)
+
+        path = self._get_path(dbname)
+        # Every frontend of the server writes to the same cache
+        # directory, so the temporary file must have a unique name.
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self._cache_dir, prefix=f'{path.stem}-', suffix='.tmp')
+        try:
+            with open(fd, 'wb') as f:
+                f.write(hashlib.sha256(payload).digest())
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def discard(self, dbname: str):
+        try:
+            self._get_path(dbname).unlink()
+        except FileNotFoundError:
+            pass
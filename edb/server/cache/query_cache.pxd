@@ -0,0 +1,37 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from libc.stdint cimport uint64_t
+
+
+cdef class QueryCache:
+
+    cdef:
+        object _dict
+        int _maxsize
+        object _dbver
+
+        readonly uint64_t hits
+        readonly uint64_t misses
+        readonly uint64_t evictions
+        readonly uint64_t purges
+
+    cpdef get(self, key, dbver)
+    cpdef put(self, key, dbver, value)
+    cpdef purge(self, dbver)
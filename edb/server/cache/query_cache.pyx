@@ -0,0 +1,99 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import collections
+
+
+cdef class QueryCache:
+    """A bounded LRU cache of compiled queries of one database.
+
+    Entries are only valid for the database version (dbver) they were
+    compiled against.  All entries of older versions are purged as
+    soon as a query compiled against a newer version is cached.
+    """
+
+    def __init__(self, *, maxsize):
+        if maxsize <= 0:
+            raise ValueError(
+                f'maxsize is expected to be greater than 0, got {maxsize}')
+
+        # key -> (dbver, value); see StatementsCache for the details
+        # of the LRU implementation.
+        self._dict = collections.OrderedDict()
+        self._maxsize = maxsize
+        self._dbver = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.purges = 0
+
+    cpdef get(self, key, dbver):
+        entry = self._dict.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry[0] != dbver:
+            # The entry was compiled against an older (or, if dbver
+            # is lagging, a newer) version of the schema.
+            del self._dict[key]
+            self.purges += 1
+            self.misses += 1
+            return None
+
+        self._dict.move_to_end(key)  # last=True
+        self.hits += 1
+        return entry[1]
+
+    cpdef put(self, key, dbver, value):
+        if self._dbver is None or dbver > self._dbver:
+            self.purge(dbver)
+        elif dbver < self._dbver:
+            # The query was compiled against a schema that has
+            # changed since; don't cache it.
+            return
+
+        self._dict[key] = (dbver, value)
+        self._dict.move_to_end(key)  # last=True
+
+        while len(self._dict) > self._maxsize:
+            self._dict.popitem(last=False)
+            self.evictions += 1
+
+    cpdef purge(self, dbver):
+        # Drop all entries compiled against other versions.
+        self._dbver = dbver
+        stale = [k for k, entry in self._dict.items() if entry[0] != dbver]
+        for k in stale:
+            del self._dict[k]
+        self.purges += len(stale)
+
+    def get_stats(self):
+        return {
+            'size': len(self._dict),
+            'maxsize': self._maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'purges': self.purges,
+        }
+
+    def __len__(self):
+        return len(self._dict)
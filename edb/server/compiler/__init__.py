@@ -18,7 +18,7 @@
 
 
 from .compiler import Compiler, BaseCompiler, CompilerDatabaseState
-from .compiler import compile_bootstrap_script
+from .compiler import compile_bootstrap_script, get_changed_schema_objects
 from .dbstate import QueryUnit
 from .enums import Capability, CompileStatementMode, ResultCardinality
 from .stdschema import load_std_schema
@@ -28,6 +28,6 @@ __all__ = (
     'Compiler', 'BaseCompiler', 'CompilerDatabaseState',
     'QueryUnit',
     'Capability', 'CompileStatementMode', 'ResultCardinality',
-    'compile_bootstrap_script',
+    'compile_bootstrap_script', 'get_changed_schema_objects',
     'load_std_schema'
 )
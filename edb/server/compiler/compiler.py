@@ -20,14 +20,18 @@
 import collections
 import dataclasses
 import hashlib
+import itertools
 import pathlib
+import time
 import typing
+import uuid
 
 import asyncpg
 import immutables
 
 from edb import errors
 
+from edb.server import buildmeta
 from edb.server import defines
 from edb.pgsql import compiler as pg_compiler
 from edb.pgsql import intromech
@@ -37,16 +41,23 @@ from edb.common import debug
 
 from edb.edgeql import ast as qlast
 from edb.edgeql import compiler as ql_compiler
+from edb.edgeql import parser as ql_parser
 from edb.edgeql import quote as ql_quote
 from edb.edgeql import qltypes
 
 from edb.ir import staeval as ireval
+from edb.ir import utils as irutils
 
+from edb.schema import constraints as s_constr
 from edb.schema import database as s_db
 from edb.schema import ddl as s_ddl
 from edb.schema import delta as s_delta
 from edb.schema import deltas as s_deltas
+from edb.schema import indexes as s_indexes
 from edb.schema import modules as s_mod
+from edb.schema import name as sn
+from edb.schema import objtypes as s_objtypes
+from edb.schema import pointers as s_pointers
 from edb.schema import schema as s_schema
 from edb.schema import types as s_types
 
@@ -61,8 +72,10 @@ from edb.server import config
 from . import dbstate
 from . import enums
 from . import errormech
+from . import normalizer
 from . import sertypes
 from . import status
+from . import schemacache
 from . import stdschema
 
 
@@ -82,9 +95,17 @@ class CompileContext:
     expected_cardinality_one: bool
     stmt_mode: enums.CompileStatementMode
     json_parameters: bool = False
+    first_extra: typing.Optional[int] = None
 
 
 EMPTY_MAP = immutables.Map()
+
+# Schema object fields that don't affect compiled queries.
+QUERY_NEUTRAL_FIELDS = frozenset({
+    'annotations',
+    'own_annotations',
+    'non_inheritable_annotations',
+})
 DEFAULT_MODULE_ALIASES_MAP = immutables.Map(
     {None: defines.DEFAULT_MODULE_ALIAS})
 
@@ -127,22 +148,128 @@ def compile_bootstrap_script(std_schema: s_schema.Schema,
     return new_schema, sql.decode()
 
 
+def get_changed_schema_objects(
+        base_schema: s_schema.Schema, schema: s_schema.Schema,
+        changes: dict) -> typing.FrozenSet[uuid.UUID]:
+    """Return the IDs of the objects affected by schema *changes*.
+
+    Compiled queries that don't depend on any of these objects
+    remain valid for the changed schema.
+    """
+    changed = set()
+
+    updated, deleted = changes.get('_id_to_data', ({}, ()))
+    for obj_id in itertools.chain(updated, deleted):
+        old_data = base_schema._id_to_data.get(obj_id)
+        new_data = updated.get(obj_id)
+        # Collections of references are rebuilt on every change of
+        # the object; compare them by value.
+        if (old_data is not None and new_data is not None and
+                all(f in QUERY_NEUTRAL_FIELDS
+                    for f in itertools.chain(old_data, new_data)
+                    if old_data.get(f) != new_data.get(f))):
+            # E.g. an annotation was added to the object.
+            continue
+
+        changed.add(obj_id)
+        for s in (base_schema, schema):
+            obj = s.get_by_id(obj_id, None)
+            if obj is not None:
+                changed.update(
+                    o.id for o in _get_schema_object_owners(s, obj))
+
+    # A new object can shadow an std object with the same name
+    # in unqualified references, and a new function or operator
+    # changes the resolution of the existing overloads.
+    names = set()
+    for attr in ('_name_to_id', '_shortname_to_id'):
+        updated, deleted = changes.get(attr, ({}, ()))
+        for key in itertools.chain(updated, deleted):
+            if isinstance(key, tuple):
+                names.add(key[1])
+            else:
+                names.add(key)
+
+    for name in names:
+        name, module, shortname = sn.split_name(name)
+        if module is None:
+            continue
+
+        lookup_names = [name]
+        if module != 'std':
+            lookup_names.append(sn.Name(module='std', name=shortname))
+
+        for s in (base_schema, schema):
+            for lookup_name in lookup_names:
+                obj = s.get(lookup_name, None)
+                if obj is not None:
+                    changed.add(obj.id)
+                for func in s.get_functions(lookup_name, ()):
+                    changed.add(func.id)
+                for oper in s.get_operators(lookup_name, ()):
+                    changed.add(oper.id)
+
+    return frozenset(changed)
+
+
+def _get_schema_object_owners(schema: s_schema.Schema, obj):
+    if isinstance(obj, s_objtypes.ObjectType):
+        # Queries on the ancestors of a type cover the type too.
+        yield from obj.get_ancestors(schema).objects(schema)
+        return
+
+    # Pointers, constraints and indexes are parts of their
+    # owner objects.
+    while True:
+        if isinstance(obj, s_pointers.Pointer):
+            obj = obj.get_source(schema)
+        elif isinstance(obj, (s_constr.Constraint, s_indexes.Index)):
+            obj = obj.get_subject(schema)
+        else:
+            return
+
+        if obj is None:
+            return
+        yield obj
+
+
 class BaseCompiler:
 
     _connect_args: dict
     _dbname: typing.Optional[str]
-    _cached_db: typing.Optional[CompilerDatabaseState]
+    _cached_dbs: typing.Dict[str, CompilerDatabaseState]
 
-    def __init__(self, connect_args: dict, data_dir: str):
+    def __init__(self, connect_args: dict, data_dir: str,
+                 schema_cache_dir: typing.Optional[str]=None):
         self._connect_args = connect_args
+        # The database this compiler was connect()-ed to, if any.
         self._dbname = None
-        self._cached_db = None
+        self._cached_dbs = {}
+        self._schema_pickler = None
+        self._schema_cache = None
+        self._snapshot_version = None
 
         if data_dir is not None:
             self._data_dir = pathlib.Path(data_dir)
             self._std_schema = stdschema.load_std_schema(self._data_dir)
             config_spec = config.load_spec_from_schema(self._std_schema)
             config.set_settings(config_spec)
+            # Load the parser tables eagerly: when the compiler is
+            # instantiated in a fork server, the forked workers share
+            # them with the template process.
+            ql_parser.preload()
+
+            self._schema_pickler = schemacache.SchemaPickler(
+                self._std_schema)
+            try:
+                self._snapshot_version = str(buildmeta.get_version())
+            except buildmeta.MetadataError:
+                # Without the build version there is no way to tell
+                # stale schema snapshots apart; don't use them.
+                pass
+            if schema_cache_dir is not None:
+                self._schema_cache = schemacache.SchemaCache(
+                    schema_cache_dir, self._schema_pickler)
         else:
             self._data_dir = None
             self._std_schema = None
@@ -160,54 +287,150 @@ class BaseCompiler:
             con_args=con_args,
             schema=schema)
 
-    async def _get_database(self, dbver: int) -> CompilerDatabaseState:
-        if self._cached_db is not None and self._cached_db.dbver == dbver:
-            return self._cached_db
+    async def _get_database(self, dbname: str,
+                            dbver: int) -> CompilerDatabaseState:
+        db = self._cached_dbs.get(dbname)
+        if db is not None and db.dbver == dbver:
+            return db
 
         assert self._std_schema is not None
 
-        self._cached_db = None
+        self._cached_dbs.pop(dbname, None)
 
         con_args = self._connect_args.copy()
         con_args['user'] = defines.EDGEDB_SUPERUSER
-        con_args['database'] = self._dbname
+        con_args['database'] = dbname
+
+        if self._schema_cache is not None:
+            # Only one compiler process introspects each version
+            # of the database, the others load the result.
+            async with self._schema_cache.lock(dbname):
+                schema = self._schema_cache.load(dbname, dbver)
+                if schema is None:
+                    schema = await self._introspect_schema(con_args)
+                    self._schema_cache.store(dbname, dbver, schema)
+        else:
+            schema = await self._introspect_schema(con_args)
 
+        db = self._wrap_schema(dbver, con_args, schema)
+        self._cached_dbs[dbname] = db
+        return db
+
+    async def _introspect_schema(self, con_args: dict) -> s_schema.Schema:
         con = await asyncpg.connect(**con_args)
         try:
+            schema = await self._load_schema_snapshot(con)
+            if schema is not None:
+                return schema
+
             im = intromech.IntrospectionMech(con)
-            schema = await im.readschema(
+            return await im.readschema(
                 schema=self._std_schema,
                 exclude_modules=s_schema.STD_MODULES)
-
-            db = self._wrap_schema(dbver, con_args, schema)
-            self._cached_db = db
-            return db
         finally:
             await con.close()
 
+    async def _load_schema_snapshot(
+            self, con) -> typing.Optional[s_schema.Schema]:
+        if self._snapshot_version is None:
+            return None
+
+        try:
+            row = await con.fetchrow('''
+                SELECT version, hash, snapshot
+                FROM edgedb._schema_snapshot
+            ''')
+        except asyncpg.UndefinedTableError:
+            return None
+
+        if row is None or row['version'] != self._snapshot_version:
+            # No DDL was executed in this database yet, or the
+            # snapshot was written by a different build.
+            return None
+
+        snapshot = row['snapshot']
+        if snapshot is None:
+            # The server didn't get to save the snapshot after
+            # the last DDL transaction was committed.
+            return None
+        if hashlib.sha256(snapshot).digest() != row['hash']:
+            return None
+
+        try:
+            return self._schema_pickler.loads(snapshot)
+        except Exception:
+            if debug.flags.server:
+                debug.header('Could not load schema snapshot')
+                debug.dump(row['version'])
+            return None
+
+    def _get_schema_snapshot_sql(self, snapshot_hash: bytes) -> bytes:
+        # Only the hash is written in the DDL transaction; the server
+        # fills in the snapshot itself after the commit.
+        return f'''
+            INSERT INTO edgedb._schema_snapshot(version, hash, snapshot)
+            VALUES (
+                {pg_ql(self._snapshot_version)},
+                decode({pg_ql(snapshot_hash.hex())}, 'hex'),
+                NULL
+            )
+            ON CONFLICT (_sentinel) DO
+            UPDATE
+                SET version = excluded.version,
+                    hash = excluded.hash,
+                    snapshot = NULL;
+        '''.encode()
+
+    def _get_sysevent_ver_sql(self) -> bytes:
+        # Databases created by older versions of the server don't
+        # have the sequence.  The sequence is not rolled back with
+        # the transaction; the other servers will only invalidate
+        # their caches needlessly.
+        return b'''
+            SELECT nextval(seq)
+            FROM (
+                SELECT to_regclass('edgedb._sysevent_version') AS seq
+            ) AS q
+            WHERE seq IS NOT NULL;
+        '''
+
     # API
 
     async def connect(self, dbname: str, dbver: int) -> CompilerDatabaseState:
         self._dbname = dbname
-        self._cached_db = None
-        await self._get_database(dbver)
+        self._cached_dbs.pop(dbname, None)
+        await self._get_database(dbname, dbver)
+
+    async def apply_schema_delta(self, dbname: str, base_dbver: int,
+                                 dbver: int, delta: bytes):
+        # Called when another compiler has compiled a DDL command
+        # that changed the schema of the *base_dbver* version of the
+        # database.  If we have that version cached, apply the changes
+        # instead of introspecting the new version later.
+        db = self._cached_dbs.get(dbname)
+        if db is None or db.dbver != base_dbver:
+            return
+
+        changes = self._schema_pickler.loads(delta)
+        schema = db.schema.apply_changes(changes)
+        self._cached_dbs[dbname] = self._wrap_schema(
+            dbver, db.con_args, schema)
 
 
 class Compiler(BaseCompiler):
 
-    def __init__(self, connect_args: dict, data_dir: str):
-        super().__init__(connect_args, data_dir)
+    def __init__(self, connect_args: dict, data_dir: str,
+                 schema_cache_dir: typing.Optional[str]=None):
+        super().__init__(connect_args, data_dir, schema_cache_dir)
 
-        self._current_db_state = None
+        # Compiler states of the explicit transactions compiled by
+        # this compiler, keyed by the current transaction ID.  Any
+        # number of client connections can share one compiler, so
+        # the state of a transaction must not be implied by the last
+        # compiled statement.
+        self._tx_states = {}
         self._bootstrap_mode = False
 
-        if data_dir is not None:
-            self._data_dir = pathlib.Path(data_dir)
-            self._std_schema = stdschema.load_std_schema(self._data_dir)
-        else:
-            self._data_dir = None
-            self._std_schema = None
-
     def _in_testmode(self, ctx: CompileContext):
         current_tx = ctx.state.current_tx()
         session_config = current_tx.get_session_config()
@@ -269,6 +492,7 @@ class Compiler(BaseCompiler):
         # commands indicates that session mode is available
         session_mode = ctx.state.capability & (enums.Capability.TRANSACTION |
                                                enums.Capability.SESSION)
+        ir_start = time.perf_counter()
         ir = ql_compiler.compile_ast_to_ir(
             ql,
             schema=current_tx.get_schema(),
@@ -288,6 +512,7 @@ class Compiler(BaseCompiler):
                     f'the query has cardinality {result_cardinality} '
                     f'which does not match the expected cardinality ONE')
 
+        sql_start = time.perf_counter()
         sql_text, argmap = pg_compiler.compile_ir_to_sql(
             ir,
             pretty=debug.flags.edgeql_compile,
@@ -297,6 +522,7 @@ class Compiler(BaseCompiler):
         sql_bytes = sql_text.encode(defines.EDGEDB_ENCODING)
 
         if single_stmt_mode:
+            describe_start = time.perf_counter()
             if native_out_format:
                 out_type_data, out_type_id = sertypes.TypeSerializer.describe(
                     ir.schema, ir.stype,
@@ -312,6 +538,10 @@ class Compiler(BaseCompiler):
                     named = False
                     for param_name, param_type in ir.params.items():
                         subtypes[int(param_name)] = (param_name, param_type)
+                    if ctx.first_extra is not None:
+                        # Parameters extracted by the normalizer
+                        # are supplied by the server.
+                        subtypes = subtypes[:ctx.first_extra]
                 else:
                     named = True
                     for param_name, param_type in ir.params.items():
@@ -328,6 +558,7 @@ class Compiler(BaseCompiler):
 
             in_type_data, in_type_id = sertypes.TypeSerializer.describe(
                 ir.schema, params_type, {}, {})
+            describe_end = time.perf_counter()
 
             in_type_args = None
             if ctx.json_parameters:
@@ -350,6 +581,14 @@ class Compiler(BaseCompiler):
                 in_type_args=in_type_args,
                 out_type_id=out_type_id.bytes,
                 out_type_data=out_type_data,
+                schema_deps=irutils.get_schema_object_ids(ir),
+                read_only=irutils.is_read_only(ir),
+                timings=(
+                    ('ir', ir_start, sql_start - ir_start),
+                    ('sql', sql_start, describe_start - sql_start),
+                    ('describe', describe_start,
+                     describe_end - describe_start),
+                ),
             )
 
         else:
@@ -793,7 +1032,9 @@ class Compiler(BaseCompiler):
 
         eql = eql.decode()
 
+        parse_start = time.perf_counter()
         statements = edgeql.parse_block(eql)
+        parse_end = time.perf_counter()
         statements_len = len(statements)
 
         if ctx.stmt_mode is enums.CompileStatementMode.SKIP_FIRST:
@@ -815,11 +1056,18 @@ class Compiler(BaseCompiler):
         unit = None
 
         for stmt in statements:
+            # Transaction state as of the end of the current unit.
+            prev_tx = ctx.state.current_tx()
+            prev_implicit = prev_tx.is_implicit()
+            prev_schema = prev_tx.get_schema()
+
             comp: dbstate.BaseQuery = self._compile_dispatch_ql(ctx, stmt)
 
             if unit is not None:
                 if (isinstance(comp, dbstate.TxControlQuery) and
                         comp.single_unit):
+                    self._publish_schema_changes(
+                        ctx, unit, prev_implicit, prev_schema)
                     units.append(unit)
                     unit = None
 
@@ -842,6 +1090,14 @@ class Compiler(BaseCompiler):
                     unit.in_type_data = comp.in_type_data
                     unit.in_type_args = comp.in_type_args
                     unit.in_type_id = comp.in_type_id
+                    unit.first_extra = ctx.first_extra
+                    unit.schema_deps = comp.schema_deps
+                    unit.read_only = comp.read_only
+                    unit.compile_timings = (
+                        ('parse', 0.0, parse_end - parse_start),
+                        *((stage, start - parse_start, duration)
+                          for stage, start, duration in comp.timings),
+                    )
 
                     unit.cacheable = True
 
@@ -877,6 +1133,7 @@ class Compiler(BaseCompiler):
                     unit.tx_savepoint_rollback = True
 
                 if comp.single_unit:
+                    self._publish_schema_changes(ctx, unit)
                     units.append(unit)
                     unit = None
 
@@ -911,6 +1168,7 @@ class Compiler(BaseCompiler):
                 raise errors.InternalServerError('unknown compile state')
 
         if unit is not None:
+            self._publish_schema_changes(ctx, unit)
             units.append(unit)
 
         if single_stmt_mode:
@@ -946,13 +1204,77 @@ class Compiler(BaseCompiler):
 
         return units
 
+    def _publish_schema_changes(self, ctx: CompileContext,
+                                unit: dbstate.QueryUnit,
+                                implicit: typing.Optional[bool]=None,
+                                schema: typing.Optional[s_schema.Schema]=None):
+        if self._schema_pickler is None:
+            return
+
+        if implicit is None:
+            current_tx = ctx.state.current_tx()
+            implicit = current_tx.is_implicit()
+            schema = current_tx.get_schema()
+
+        if not implicit:
+            # The changes will be visible after COMMIT.
+            return
+
+        if not (unit.has_ddl or unit.tx_commit):
+            return
+
+        base_schema = ctx.state.base_schema
+        if schema is base_schema:
+            return
+
+        changes = schema.get_changes_since(base_schema)
+        unit.schema_delta = self._schema_pickler.dumps(changes)
+        unit.changed_schema_objects = get_changed_schema_objects(
+            base_schema, schema, changes)
+        ctx.state.set_base_schema(schema)
+
+        if self._databases_changed(base_schema, schema):
+            return
+
+        # Advance the system event version of the database in the
+        # same transaction: the other servers check it to find the
+        # changes they were not notified of.
+        sql = (self._get_sysevent_ver_sql(),)
+
+        if self._snapshot_version is not None:
+            # Record the hash of the new schema in the same
+            # transaction.  The pickled schema itself is saved by the
+            # server after the commit as a query parameter: inlining
+            # it into the SQL would make Postgres parse the whole
+            # schema as a literal on every DDL.
+            snapshot = self._schema_pickler.dumps(schema)
+            unit.schema_hash = hashlib.sha256(snapshot).digest()
+            unit.schema_snapshot = snapshot
+            sql += (self._get_schema_snapshot_sql(unit.schema_hash),)
+
+        if unit.tx_commit:
+            unit.sql = unit.sql[:-1] + sql + unit.sql[-1:]
+        else:
+            unit.sql += sql
+
+    def _databases_changed(self, base_schema: s_schema.Schema,
+                           schema: s_schema.Schema) -> bool:
+        # CREATE DATABASE and DROP DATABASE cannot be executed in
+        # a transaction block; no other commands can be added to them.
+        def get_dbs(schema):
+            return frozenset(schema.get_objects(type=s_db.Database))
+
+        return get_dbs(base_schema) != get_dbs(schema)
+
     async def _ctx_new_con_state(
-            self, *, dbver: int, json_mode: bool, expect_one: bool,
+            self, *, dbname: str, dbver: int, json_mode: bool,
+            expect_one: bool,
             modaliases,
             session_config: typing.Optional[immutables.Map],
             stmt_mode: typing.Optional[enums.CompileStatementMode],
             capability: enums.Capability,
-            json_parameters: bool=False):
+            json_parameters: bool=False,
+            first_extra: typing.Optional[int]=None):
 
         if session_config is None:
             session_config = EMPTY_MAP
@@ -962,16 +1284,14 @@ class Compiler(BaseCompiler):
         assert isinstance(modaliases, immutables.Map)
         assert isinstance(session_config, immutables.Map)
 
-        db = await self._get_database(dbver)
-        self._current_db_state = dbstate.CompilerConnectionState(
+        db = await self._get_database(dbname, dbver)
+        state = dbstate.CompilerConnectionState(
             dbver,
             db.schema,
             modaliases,
             session_config,
             capability)
 
-        state = self._current_db_state
-
         if json_mode:
             of = pg_compiler.OutputFormat.JSON
         else:
@@ -982,13 +1302,16 @@ class Compiler(BaseCompiler):
             output_format=of,
             expected_cardinality_one=expect_one,
             stmt_mode=stmt_mode,
-            json_parameters=json_parameters)
+            json_parameters=json_parameters,
+            first_extra=first_extra)
 
         return ctx
 
-    async def _ctx_from_con_state(self, *, txid: int, json_mode: bool,
-                                  expect_one: bool,
-                                  stmt_mode: enums.CompileStatementMode):
+    async def _ctx_from_con_state(
+            self, *, txid: int, json_mode: bool,
+            expect_one: bool,
+            stmt_mode: enums.CompileStatementMode,
+            first_extra: typing.Optional[int]=None):
         state = self._load_state(txid)
 
         if json_mode:
@@ -1000,25 +1323,45 @@ class Compiler(BaseCompiler):
             state=state,
             output_format=of,
             expected_cardinality_one=expect_one,
-            stmt_mode=stmt_mode)
+            stmt_mode=stmt_mode,
+            first_extra=first_extra)
 
         return ctx
 
+    def _find_state(self, txid: int):
+        state = self._tx_states.get(txid)
+        if state is not None:
+            return state
+
+        for state in self._tx_states.values():
+            if state.can_rollback_to_savepoint(txid):
+                return state
+
+        return None
+
     def _load_state(self, txid: int):
-        if self._current_db_state is None:  # pragma: no cover
+        state = self._find_state(txid)
+        if state is None:  # pragma: no cover
             raise errors.InternalServerError(
-                f'failed to lookup transaction with id={txid}')
+                f'failed to lookup transaction or savepoint with id={txid}')
 
-        if self._current_db_state.current_tx().id == txid:
-            return self._current_db_state
+        if state.current_tx().id != txid:
+            state.rollback_to_savepoint(txid)
+            self._save_state(state)
 
-        if self._current_db_state.can_rollback_to_savepoint(txid):
-            self._current_db_state.rollback_to_savepoint(txid)
-            return self._current_db_state
+        return state
 
-        raise errors.InternalServerError(
-            f'failed to lookup transaction or savepoint with id={txid}'
-        )  # pragma: no cover
+    def _save_state(self, state: dbstate.CompilerConnectionState):
+        # Transaction ID can change after COMMIT, ROLLBACK or ROLLBACK TO
+        # SAVEPOINT; re-key the state, or forget it completely if
+        # the transaction block is over.
+        for txid, st in tuple(self._tx_states.items()):
+            if st is state:
+                del self._tx_states[txid]
+
+        current_tx = state.current_tx()
+        if not current_tx.is_implicit():
+            self._tx_states[current_tx.id] = state
 
     # API
 
@@ -1052,8 +1395,21 @@ class Compiler(BaseCompiler):
             'expected a ROLLBACK or ROLLBACK TO SAVEPOINT command'
         )  # pragma: no cover
 
+    def _compile_query(self, *,
+                       ctx: CompileContext,
+                       eql: bytes) -> typing.List[dbstate.QueryUnit]:
+        try:
+            return self._compile(ctx=ctx, eql=eql)
+        except errors.QueryError as e:
+            if ctx.first_extra is None:
+                raise
+            # The error could be caused by a parameter extracted from
+            # the query; its position is in the normalized text anyway.
+            raise normalizer.NormalizationError(str(e)) from e
+
     async def compile_eql(
             self,
+            dbname: str,
             dbver: int,
             eql: bytes,
             sess_modaliases: typing.Optional[immutables.Map],
@@ -1062,9 +1418,12 @@ class Compiler(BaseCompiler):
             expect_one: bool,
             stmt_mode: enums.CompileStatementMode,
             capability: enums.Capability,
-            json_parameters: bool=False) -> typing.List[dbstate.QueryUnit]:
+            json_parameters: bool=False,
+            first_extra: typing.Optional[int]=None
+    ) -> typing.List[dbstate.QueryUnit]:
 
         ctx = await self._ctx_new_con_state(
+            dbname=dbname,
             dbver=dbver,
             json_mode=json_mode,
             expect_one=expect_one,
@@ -1072,9 +1431,13 @@ class Compiler(BaseCompiler):
             session_config=sess_config,
             stmt_mode=enums.CompileStatementMode(stmt_mode),
             capability=capability,
-            json_parameters=json_parameters)
+            json_parameters=json_parameters,
+            first_extra=first_extra)
 
-        return self._compile(ctx=ctx, eql=eql)
+        try:
+            return self._compile_query(ctx=ctx, eql=eql)
+        finally:
+            self._save_state(ctx.state)
 
     async def compile_eql_in_tx(
             self,
@@ -1082,19 +1445,35 @@ class Compiler(BaseCompiler):
             eql: bytes,
             json_mode: bool,
             expect_one: bool,
-            stmt_mode: enums.CompileStatementMode
+            stmt_mode: enums.CompileStatementMode,
+            first_extra: typing.Optional[int]=None
     ) -> typing.List[dbstate.QueryUnit]:
 
         ctx = await self._ctx_from_con_state(
             txid=txid,
             json_mode=json_mode,
             expect_one=expect_one,
-            stmt_mode=enums.CompileStatementMode(stmt_mode))
-
-        return self._compile(ctx=ctx, eql=eql)
+            stmt_mode=enums.CompileStatementMode(stmt_mode),
+            first_extra=first_extra)
 
-    async def interpret_backend_error(self, dbver, fields):
-        db = await self._get_database(dbver)
+        try:
+            return self._compile_query(ctx=ctx, eql=eql)
+        finally:
+            self._save_state(ctx.state)
+
+    async def discard_tx_state(self, txid: int):
+        # Called when a transaction block is finished without
+        # compiling its COMMIT or ROLLBACK on this compiler (e.g. it
+        # was rolled back after an error, or the client has
+        # disconnected.)
+        state = self._find_state(txid)
+        if state is not None:
+            for key, st in tuple(self._tx_states.items()):
+                if st is state:
+                    del self._tx_states[key]
+
+    async def interpret_backend_error(self, dbname, dbver, fields):
+        db = await self._get_database(dbname, dbver)
         return errormech.interpret_backend_error(db.schema, fields)
 
     async def interpret_backend_error_in_tx(self, txid, fields):
@@ -21,6 +21,7 @@ import dataclasses
 import enum
 import time
 import typing
+import uuid
 
 import immutables
 
@@ -65,6 +66,16 @@ class Query(BaseQuery):
     # Set only when a query is compiled with "json_parameters=True"
     in_type_args: typing.Optional[typing.Tuple[str, ...]] = None
 
+    # IDs of the schema objects the query depends on.
+    schema_deps: typing.Optional[typing.FrozenSet[uuid.UUID]] = None
+
+    # True if the query can run on a read-only replica.
+    read_only: bool = False
+
+    # Stages of the compilation: (stage, perf_counter() at the start
+    # of the stage, duration in seconds).
+    timings: typing.Tuple[typing.Tuple[str, float, float], ...] = ()
+
 
 @dataclasses.dataclass(frozen=True)
 class SimpleQuery(BaseQuery):
@@ -154,6 +165,22 @@ class QueryUnit:
     # Set only when a query is compiled with "json_parameters=True"
     in_type_args: typing.Optional[typing.Tuple[str, ...]] = None
 
+    # Set only when a normalized query is compiled: the index of
+    # the first parameter extracted from the query literals.  These
+    # parameters are not in the "in_type_data" descriptor.
+    first_extra: typing.Optional[int] = None
+
+    # IDs of the schema objects the query of this unit depends on;
+    # the unit stays valid after schema changes that don't touch
+    # any of them.  None means that the unit can't outlive any
+    # schema change.
+    schema_deps: typing.Optional[typing.FrozenSet[uuid.UUID]] = None
+
+    # True if this unit is a single query that neither modifies data
+    # nor depends on the session state, so it can be executed on a
+    # read-only replica of the database (outside of transactions).
+    read_only: bool = False
+
     # Set only when this unit contains a CONFIGURE SYSTEM command.
     system_config: bool = False
     config_requires_restart: bool = False
@@ -163,6 +190,29 @@ class QueryUnit:
     config_ops: typing.Optional[typing.List[config.Operation]] = None
     modaliases: typing.Optional[immutables.Map] = None
 
+    # Set only for units that make the schema changes of a DDL
+    # command or a transaction with DDL commands visible to other
+    # connections.  Contains the pickled changes relative to the
+    # schema of the "dbver" database version, so that other compilers
+    # can apply them instead of introspecting the changed schema.
+    schema_delta: typing.Optional[bytes] = None
+    # IDs of the schema objects affected by the "schema_delta"
+    # changes (see QueryUnit.schema_deps.)
+    changed_schema_objects: typing.Optional[
+        typing.FrozenSet[uuid.UUID]] = None
+    # SHA-256 hash of the schema snapshot persisted by this unit
+    # (see Compiler._publish_schema_changes().)
+    schema_hash: typing.Optional[bytes] = None
+    # The pickled schema of "schema_hash"; the server saves it once
+    # the transaction of the unit is committed.
+    schema_snapshot: typing.Optional[bytes] = None
+
+    # Set only for units of single queries: the stages of the
+    # compilation, as (stage, start, duration) with the start
+    # relative to the beginning of the compilation, in seconds.
+    # Reported in query traces (see edb.server.tracing.)
+    compile_timings: typing.Tuple[typing.Tuple[str, float, float], ...] = ()
+
 
 #############################
 
@@ -321,7 +371,8 @@ class CompilerConnectionState:
 
     _savepoints_log: typing.Mapping[int, Transaction]
 
-    __slots__ = ('_savepoints_log', '_dbver', '_current_tx', '_capability')
+    __slots__ = ('_savepoints_log', '_dbver', '_current_tx', '_capability',
+                 '_base_schema')
 
     def __init__(self, dbver: int,
                  schema: s_schema.Schema,
@@ -329,6 +380,7 @@ class CompilerConnectionState:
                  config: immutables.Map,
                  capability: enums.Capability):
         self._dbver = dbver
+        self._base_schema = schema
         self._savepoints_log = {}
         self._init_current_tx(schema, modaliases, config)
         self._capability = capability
@@ -369,6 +421,14 @@ class CompilerConnectionState:
     def capability(self):
         return self._capability
 
+    @property
+    def base_schema(self) -> s_schema.Schema:
+        # The last schema visible to other connections.
+        return self._base_schema
+
+    def set_base_schema(self, schema: s_schema.Schema):
+        self._base_schema = schema
+
     def current_tx(self) -> Transaction:
         return self._current_tx
 
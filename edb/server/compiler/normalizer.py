@@ -0,0 +1,225 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Query normalization.
+
+Queries that differ only in their literal constants are normalized
+into the same text by replacing the literals with positional query
+parameters, e.g.::
+
+    SELECT User FILTER .name = 'Alice' LIMIT 10
+
+becomes (modulo whitespace)::
+
+    SELECT User FILTER .name = <std::str>$0 LIMIT <std::int64>$1
+
+so that all such queries share one compiled QueryUnit and one
+prepared statement in Postgres.  The extracted parameters are
+numbered after the parameters of the query itself and are not part
+of the input type descriptor the client sees; the server appends
+their values to the arguments sent by the client.
+"""
+
+
+import ast
+import dataclasses
+import math
+import re
+import struct
+import typing
+
+from edb.common import lexer as base_lexer
+from edb.edgeql.parser.grammar import lexer
+from edb.edgeql.parser.grammar import lexutils
+
+
+# Only queries starting with these keywords are normalized.
+_QUERY_KEYWORDS = frozenset((
+    'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'FOR', 'WITH',
+))
+
+# ...and they must not contain any of these: literals in DDL and
+# configuration commands cannot be parameters.
+_NON_QUERY_KEYWORDS = frozenset((
+    'CREATE', 'ALTER', 'DROP', 'CONFIGURE',
+))
+
+_SKIP_TOKENS = frozenset(('WS', 'NL', 'COMMENT', 'EOF'))
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+_int64_packer = struct.Struct('!iq').pack
+_float64_packer = struct.Struct('!id').pack
+_int32_packer = struct.Struct('!i').pack
+
+
+class NormalizationError(Exception):
+    """The normalized query failed to compile.
+
+    Not every literal can be replaced with a parameter, e.g. where a
+    constant is required, so the original query is to be compiled
+    instead.  That compilation also reports the errors of invalid
+    queries in terms of the original query text.
+    """
+
+
+@dataclasses.dataclass(frozen=True)
+class NormalizedQuery:
+
+    # Normalized query text.
+    text: bytes
+
+    # Index of the first extracted parameter.
+    first_extra: int
+
+    # Number of extracted parameters.
+    extra_count: int
+
+    # Values of the extracted parameters encoded in the
+    # Postgres binary format, each prefixed with its length.
+    extra_blob: bytes
+
+
+def _encode_str(val: str) -> bytes:
+    data = val.encode('utf-8')
+    return _int32_packer(len(data)) + data
+
+
+def _encode_bytes(val: bytes) -> bytes:
+    return _int32_packer(len(val)) + val
+
+
+def _extract_literal(tok) -> typing.Optional[typing.Tuple[str, bytes]]:
+    """Return the type and the encoded value of a literal token.
+
+    Literals that can't be represented as a parameter of the same
+    type, or that are invalid, are left in the query as is.  Invalid
+    literals are reported by the parser later.
+    """
+    tok_type = tok.type
+    text = tok.text
+
+    if tok_type == 'ICONST':
+        val = int(text)
+        if not _INT64_MIN <= val <= _INT64_MAX:
+            return None
+        return 'std::int64', _int64_packer(8, val)
+
+    elif tok_type == 'FCONST':
+        val = float(text)
+        if not math.isfinite(val):
+            return None
+        return 'std::float64', _float64_packer(8, val)
+
+    elif tok_type == 'SCONST':
+        match = lexutils.VALID_STRING_RE.match(text)
+        if not match or match.group('err_esc'):
+            return None
+        # Same as in the parser: handle line continuations first.
+        val = re.sub(r'\\\n', '', match.group('body'))
+        return 'std::str', _encode_str(lexutils.unescape_string(val))
+
+    elif tok_type == 'RSCONST':
+        match = lexutils.VALID_RAW_STRING_RE.match(text)
+        if not match:
+            return None
+        return 'std::str', _encode_str(match.group('body'))
+
+    elif tok_type == 'BCONST':
+        match = lexutils.VALID_BYTES_RE.match(text)
+        if not match or match.group('err_esc') or match.group('err'):
+            return None
+        quote = match.group('BQ')
+        val = ast.literal_eval(f'b{quote}{match.group("body")}{quote}')
+        return 'std::bytes', _encode_bytes(val)
+
+    else:
+        return None
+
+
+def normalize(eql: bytes) -> typing.Optional[NormalizedQuery]:
+    """Replace the literals of the *eql* query with parameters.
+
+    Return None if the query can't be normalized or if there is
+    nothing to normalize.
+    """
+    try:
+        source = eql.decode()
+    except UnicodeDecodeError:
+        return None
+
+    lex = lexer.EdgeQLLexer(strip_whitespace=False)
+    lex.setinputstr(source)
+    try:
+        # Don't let the lexer merge tokens; the text of every
+        # token is needed to reconstruct the query.
+        tokens = [tok for tok in lex.lex_highlight()
+                  if tok.type not in _SKIP_TOKENS]
+    except base_lexer.UnknownTokenError:
+        return None
+
+    if not tokens or tokens[0].type not in _QUERY_KEYWORDS:
+        return None
+
+    first_extra = 0
+    for i, tok in enumerate(tokens):
+        tok_type = tok.type
+        if tok_type in _NON_QUERY_KEYWORDS:
+            return None
+        elif tok_type == ';' and i != len(tokens) - 1:
+            # A script rather than a single query.
+            return None
+        elif tok_type == '$' and i + 1 < len(tokens):
+            arg = tokens[i + 1]
+            if arg.type != 'ICONST':
+                # Named parameters can't be combined with the
+                # positional ones.
+                return None
+            first_extra = max(first_extra, int(arg.text) + 1)
+
+    out = []
+    extras = []
+    prev_type = None
+    for tok in tokens:
+        literal = None
+        # Integers and floats after a dot are tuple element
+        # references, and integers after a dollar sign are
+        # parameter references.
+        if prev_type not in {'.', '$'}:
+            literal = _extract_literal(tok)
+
+        if literal is None:
+            out.append(tok.text)
+        else:
+            typename, data = literal
+            out.append(f'<{typename}>${first_extra + len(extras)}')
+            extras.append(data)
+
+        prev_type = tok.type
+
+    if not extras:
+        return None
+
+    return NormalizedQuery(
+        text=' '.join(out).encode(),
+        first_extra=first_extra,
+        extra_count=len(extras),
+        extra_blob=b''.join(extras),
+    )
@@ -0,0 +1,148 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Database schemas shared between compiler processes.
+
+Introspecting the schema of a database is expensive, so only one
+compiler process does it for every version of a database.  The
+introspected schema is pickled into the cache directory, where all
+other compiler processes pick it up.
+
+The std schema is loaded by every compiler anyway, so objects of the
+std schema are pickled by reference (see SchemaPickler.)  This keeps
+the pickles small and lets the unpickled schemas share the std objects.
+"""
+
+
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import io
+import os
+import pathlib
+import pickle
+
+
+LOCK_POLL_INTERVAL = 0.01
+
+
+class _Pickler(pickle.Pickler):
+
+    def __init__(self, file, std_ids):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._std_ids = std_ids
+
+    def persistent_id(self, obj):
+        return self._std_ids.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, file, std_data):
+        super().__init__(file)
+        self._std_data = std_data
+
+    def persistent_load(self, pid):
+        return self._std_data[pid]
+
+
+class SchemaPickler:
+    """Pickle schemas and schema changes referencing the std schema."""
+
+    def __init__(self, std_schema):
+        self._std_data = std_schema._id_to_data
+        self._std_ids = {id(data): obj_id
+                         for obj_id, data in self._std_data.items()}
+
+    def dumps(self, obj) -> bytes:
+        buf = io.BytesIO()
+        _Pickler(buf, self._std_ids).dump(obj)
+        return buf.getvalue()
+
+    def loads(self, data: bytes):
+        return _Unpickler(io.BytesIO(data), self._std_data).load()
+
+
+class SchemaCache:
+
+    def __init__(self, cache_dir: str, pickler: SchemaPickler):
+        self._cache_dir = pathlib.Path(cache_dir)
+        self._pickler = pickler
+
+    def _get_prefix(self, dbname: str) -> str:
+        # Database names can contain characters that are not
+        # allowed in file names.
+        return 'schema-' + hashlib.sha1(dbname.encode()).hexdigest()
+
+    def _get_path(self, dbname: str, dbver: int) -> pathlib.Path:
+        return self._cache_dir / f'{self._get_prefix(dbname)}-{dbver}.pickle'
+
+    @contextlib.asynccontextmanager
+    async def lock(self, dbname: str):
+        """Lock the cached schemas of *dbname* across processes."""
+        path = self._cache_dir / f'{self._get_prefix(dbname)}.lock'
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Don't block the worker's event loop: it could
+                    # be serving other requests.
+                    await asyncio.sleep(LOCK_POLL_INTERVAL)
+                else:
+                    break
+            yield
+        finally:
+            # Closing the file releases the lock.
+            os.close(fd)
+
+    def load(self, dbname: str, dbver: int):
+        try:
+            with open(self._get_path(dbname, dbver), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            return self._pickler.loads(data)
+        except Exception as e:
+            raise RuntimeError(
+                f'could not load cached schema of {dbname!r}') from e
+
+    def store(self, dbname: str, dbver: int, schema):
+        data = self._pickler.dumps(schema)
+
+        path = self._get_path(dbname, dbver)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        # Schemas of the previous versions of the database
+        # won't be requested again.
+        prefix = self._get_prefix(dbname)
+        for old_path in self._cache_dir.glob(f'{prefix}-*.pickle'):
+            old_dbver = int(old_path.stem.rpartition('-')[2])
+            if old_dbver < dbver:
+                try:
+                    old_path.unlink()
+                except FileNotFoundError:
+                    pass
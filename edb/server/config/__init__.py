@@ -19,7 +19,7 @@
 
 from .ops import OpLevel, OpCode, Operation, lookup
 from .ops import spec_to_json, to_json, from_json
-from .ops import value_from_json
+from .ops import value_from_json, value_to_json_value
 from .spec import Spec, Setting, load_spec_from_schema, generate_config_query
 from .types import ConfigType
 
@@ -29,7 +29,7 @@ __all__ = (
     'lookup',
     'Spec', 'Setting',
     'spec_to_json', 'to_json', 'from_json',
-    'value_from_json',
+    'value_from_json', 'value_to_json_value',
     'OpLevel', 'OpCode', 'Operation',
     'ConfigType', 'Port',
     'load_spec_from_schema',
@@ -29,6 +29,8 @@ cdef class DatabaseIndex:
         object _sys_queries
         object _instance_data
 
+        object _persistent_cache
+
     cdef _save_system_overrides(self)
 
 
@@ -36,13 +38,25 @@ cdef class Database:
 
     cdef:
         str _name
-        object _dbver
-        object _eql_to_compiled
+        readonly object _dbver
+        readonly object _eql_to_compiled
+        readonly object _query_hits
+        readonly object _sys_event_ver
         DatabaseIndex _index
 
-    cdef _signal_ddl(self)
+        object _schema_hash
+        bint _queries_changed
+        object _load_queries_task
+
+    cpdef _signal_ddl(self, query_unit)
+    cdef _on_remote_ddl(self)
     cdef _invalidate_caches(self)
+    cdef _invalidate_stale_queries(self, base_dbver, changed)
+    cdef _warm_up(self, stale)
+    cdef _record_query_hit(self, key)
     cdef _cache_compiled_query(self, key, query_unit)
+    cdef _restore_queries(self, entries)
+    cdef _get_persisted_queries(self)
     cdef _new_view(self, user, query_cache)
 
 
@@ -57,6 +71,7 @@ cdef class DatabaseConnectionView:
         object _modaliases
 
         object _eql_to_compiled
+        object _in_tx_dbver
 
         object _txid
         object _in_tx_config
@@ -78,7 +93,7 @@ cdef class DatabaseConnectionView:
     cdef cache_compiled_query(self, bytes eql, bint json_mode,
                               bint expect_one, query_unit)
     cdef lookup_compiled_query(self, bytes eql, bint json_mode,
-                               bint expect_one)
+                               bint expect_one, first_extra)
 
     cdef tx_error(self)
 
@@ -17,7 +17,10 @@
 #
 
 
+import asyncio
+import heapq
 import json
+import logging
 import os.path
 import pickle
 import time
@@ -27,17 +30,29 @@ import immutables
 
 from edb import errors
 from edb.common import lru
+from edb.server import buildmeta
+from edb.server import cache
 from edb.server import defines, config
+from edb.server import metrics
+from edb.server import sysevents
 from edb.server.compiler import dbstate
+from edb.server.pgcon import errors as pgerror
 
 
 __all__ = ('DatabaseIndex', 'DatabaseConnectionView')
 
+logger = logging.getLogger('edb.server')
+
 
 cdef class Database:
 
-    # Global LRU cache of compiled anonymous queries
-    _eql_to_compiled: typing.Mapping[bytes, dbstate.QueryUnit]
+    # Global LRU cache of compiled anonymous queries, as (dbver,
+    # query unit): the unit is valid for the "dbver" version of the
+    # database, which can be more recent than the version it was
+    # compiled against.  The units are shared with the connections
+    # executing them and must not be modified.
+    _eql_to_compiled: typing.Mapping[
+        bytes, typing.Tuple[int, dbstate.QueryUnit]]
 
     def __init__(self, DatabaseIndex index, str name):
         self._name = name
@@ -47,23 +62,121 @@ cdef class Database:
 
         self._eql_to_compiled = lru.LRUMapping(
             maxsize=defines._MAX_QUERIES_CACHE)
+        # Number of cache hits of compiled queries; queries with
+        # the most hits are recompiled in advance after DDL.
+        self._query_hits = lru.LRUMapping(
+            maxsize=defines._MAX_QUERIES_CACHE)
 
-    cdef _signal_ddl(self):
+        # Hash of the persisted snapshot of the current schema; None
+        # if it is not known yet or if there is no such snapshot.
+        self._schema_hash = None
+        self._queries_changed = False
+        # Task loading the persisted queries of the database.
+        self._load_queries_task = None
+        # System event version of the database the caches are known
+        # to be valid for; None if it was not checked since the last
+        # schema change.
+        self._sys_event_ver = None
+
+    cpdef _signal_ddl(self, query_unit):
+        base_dbver = self._dbver
         self._dbver = time.monotonic_ns()  # Advance the version
+        self._sys_event_ver = None
+        self._schema_hash = query_unit.schema_hash
+        self._queries_changed = True
+
+        if (query_unit.schema_delta is not None and
+                query_unit.dbver == base_dbver):
+            # The unit was compiled against the latest version of the
+            # schema; let the compilers apply the changes instead of
+            # introspecting the new version.
+            stale = self._invalidate_stale_queries(
+                base_dbver, query_unit.changed_schema_objects)
+            self._index._server.propagate_schema_delta(
+                self._name, base_dbver, self._dbver,
+                query_unit.schema_delta)
+        else:
+            stale = list(self._eql_to_compiled)
+            self._invalidate_caches()
+
+        self._warm_up(stale)
+        self._index._server.signal_sys_event(
+            'schema-changes', dbname=self._name)
+
+    cdef _on_remote_ddl(self):
+        # The schema was changed by another server; the delta is
+        # not known here, so everything compiled so far is stale.
+        self._dbver = time.monotonic_ns()
+        self._sys_event_ver = None
+        self._schema_hash = None
+        stale = list(self._eql_to_compiled)
         self._invalidate_caches()
+        self._warm_up(stale)
 
     cdef _invalidate_caches(self):
         self._eql_to_compiled.clear()
+        self._queries_changed = True
+
+    cdef _invalidate_stale_queries(self, base_dbver, changed):
+        if changed is None:
+            stale = list(self._eql_to_compiled)
+            self._invalidate_caches()
+            return stale
+
+        stale = []
+        valid = []
+        for key, (dbver, query_unit) in self._eql_to_compiled.items():
+            if (dbver != base_dbver or
+                    query_unit.schema_deps is None or
+                    not query_unit.schema_deps.isdisjoint(changed)):
+                stale.append(key)
+            else:
+                # The query is not affected by the changes; it is
+                # valid for the new version of the schema too.
+                valid.append((key, query_unit))
+
+        for key in stale:
+            del self._eql_to_compiled[key]
+        for key, query_unit in valid:
+            self._eql_to_compiled[key] = (self._dbver, query_unit)
+        return stale
+
+    cdef _warm_up(self, stale):
+        hits = self._query_hits
+        hot = heapq.nlargest(
+            defines._MAX_WARM_UP_QUERIES,
+            (key for key in stale if key in hits),
+            key=hits.peek)
+        if hot:
+            self._index._server.warm_up_queries(self._name, self._dbver, hot)
+
+    cdef _record_query_hit(self, key):
+        self._query_hits[key] = self._query_hits.get(key, 0) + 1
 
     cdef _cache_compiled_query(self, key, compiled: dbstate.QueryUnit):
         assert compiled.cacheable
 
         existing = self._eql_to_compiled.get(key)
-        if existing is not None and existing.dbver > compiled.dbver:
+        if existing is not None and existing[0] > compiled.dbver:
             # We already have a cached query for a more recent DB version.
             return
 
-        self._eql_to_compiled[key] = compiled
+        self._eql_to_compiled[key] = (compiled.dbver, compiled)
+        self._queries_changed = True
+
+    cdef _restore_queries(self, entries):
+        for key, query_unit in entries:
+            if key not in self._eql_to_compiled:
+                # The persisted query was compiled against the
+                # current schema.
+                self._eql_to_compiled[key] = (self._dbver, query_unit)
+
+    cdef _get_persisted_queries(self):
+        return [
+            (key, query_unit)
+            for key, (dbver, query_unit) in self._eql_to_compiled.items()
+            if dbver == self._dbver
+        ]
 
     cdef _new_view(self, user, query_cache):
         return DatabaseConnectionView(self, user=user, query_cache=query_cache)
@@ -71,7 +184,8 @@ cdef class Database:
 
 cdef class DatabaseConnectionView:
 
-    _eql_to_compiled: typing.Mapping[bytes, dbstate.QueryUnit]
+    _eql_to_compiled: typing.Mapping[
+        bytes, typing.Tuple[int, dbstate.QueryUnit]]
 
     def __init__(self, db: Database, *, user, query_cache):
         self._db = db
@@ -89,11 +203,15 @@ cdef class DatabaseConnectionView:
         # DDL command, we use this cache for compiled queries.
         self._eql_to_compiled = lru.LRUMapping(
             maxsize=defines._MAX_QUERIES_CACHE)
+        # Version of the schema as seen by the current transaction;
+        # advanced by every DDL command or rollback to a savepoint.
+        self._in_tx_dbver = 0
 
         self._reset_tx_state()
 
     cdef _invalidate_local_cache(self):
         self._eql_to_compiled.clear()
+        self._in_tx_dbver += 1
 
     cdef _reset_tx_state(self):
         self._txid = None
@@ -154,6 +272,14 @@ cdef class DatabaseConnectionView:
         def __get__(self):
             return self._db._name
 
+    property schema_version:
+        # Changes whenever the schema seen by this connection might
+        # have changed, including by DDL in the current transaction.
+        def __get__(self):
+            if self._in_tx_with_ddl:
+                return (self._db._dbver, self._in_tx_dbver)
+            return (self._db._dbver, None)
+
     cdef in_tx(self):
         return self._in_tx
 
@@ -165,29 +291,49 @@ cdef class DatabaseConnectionView:
 
         assert query_unit.cacheable
 
-        key = (eql, json_mode, expect_one, self._modaliases, self._config)
+        # A normalized query can't be told from a query with the same
+        # text written by the client: only the number of parameters
+        # supplied by the client differs.
+        key = (eql, json_mode, expect_one, query_unit.first_extra,
+               self._modaliases, self.get_session_config())
 
-        if self._in_tx_with_ddl:
-            self._eql_to_compiled[key] = query_unit
+        if self._in_tx_with_ddl or self._in_tx_with_set:
+            # The query was compiled against the schema or the config
+            # of this transaction; it is valid only until they change.
+            self._eql_to_compiled[key] = (self._in_tx_dbver, query_unit)
         else:
             self._db._cache_compiled_query(key, query_unit)
 
     cdef lookup_compiled_query(self, bytes eql, bint json_mode,
-                               bint expect_one):
+                               bint expect_one, first_extra):
         if (self._tx_error or
-                not self._query_cache_enabled or
-                self._in_tx_with_ddl):
+                not self._query_cache_enabled):
             return None
 
-        key = (eql, json_mode, expect_one, self._modaliases, self._config)
+        key = (eql, json_mode, expect_one, first_extra,
+               self._modaliases, self.get_session_config())
 
         if self._in_tx_with_ddl or self._in_tx_with_set:
-            query_unit = self._eql_to_compiled.get(key)
+            query_unit = None
+            entry = self._eql_to_compiled.get(key)
+            if entry is not None:
+                in_tx_dbver, query_unit = entry
+                if in_tx_dbver != self._in_tx_dbver:
+                    query_unit = None
         else:
-            query_unit = self._db._eql_to_compiled.get(key)
-            if query_unit is not None and query_unit.dbver != self.dbver:
-                query_unit = None
-
+            query_unit = None
+            entry = self._db._eql_to_compiled.get(key)
+            if entry is not None:
+                dbver, query_unit = entry
+                if dbver != self.dbver:
+                    query_unit = None
+                else:
+                    self._db._record_query_hit(key)
+
+        if query_unit is None:
+            metrics.query_cache_lookups.inc(1.0, 'miss')
+        else:
+            metrics.query_cache_lookups.inc(1.0, 'hit')
         return query_unit
 
     cdef tx_error(self):
@@ -209,6 +355,9 @@ cdef class DatabaseConnectionView:
         if self._in_tx:
             if query_unit.has_ddl:
                 self._in_tx_with_ddl = True
+                # Queries compiled before this command could refer
+                # to the schema objects it changes.
+                self._invalidate_local_cache()
             if query_unit.has_set:
                 self._in_tx_with_set = True
 
@@ -222,7 +371,7 @@ cdef class DatabaseConnectionView:
             self._invalidate_local_cache()
 
         if not self._in_tx and query_unit.has_ddl:
-            self._db._signal_ddl()
+            self._db._signal_ddl(query_unit)
 
         if query_unit.modaliases is not None:
             self._modaliases = query_unit.modaliases
@@ -235,7 +384,7 @@ cdef class DatabaseConnectionView:
                     '"commit" outside of a transaction')
             self._config = self._in_tx_config
             if self._in_tx_with_ddl:
-                self._db._signal_ddl()
+                self._db._signal_ddl(query_unit)
             self._reset_tx_state()
 
         elif query_unit.tx_rollback:
@@ -290,6 +439,23 @@ cdef class DatabaseIndex:
         self._sys_config = None
         self._sys_config_ver = time.monotonic_ns()
 
+        self._persistent_cache = None
+        if self._server.persistent_query_cache_enabled():
+            try:
+                version = str(buildmeta.get_version())
+            except buildmeta.MetadataError:
+                # Queries compiled by a different version of the
+                # server can't be told apart.
+                logger.warning(
+                    'could not determine the server version; '
+                    'the persistent query cache is disabled')
+            else:
+                cache_dir = os.path.join(datadir, 'query_cache')
+                os.makedirs(cache_dir, exist_ok=True)
+                self._persistent_cache = cache.PersistentQueryCache(
+                    cache_dir, version,
+                    maxsize=defines._MAX_PERSISTED_QUERIES)
+
     def get_sys_query(self, key: str) -> bytes:
         return self._sys_queries[key]
 
@@ -311,6 +477,56 @@ cdef class DatabaseIndex:
     def get_sys_config(self):
         return self._sys_config
 
+    def get_query_hits(self, dbname):
+        """Return the number of cache hits of the compiled queries."""
+        db = self._dbs.get(dbname)
+        if db is None:
+            return {}
+        return dict((<Database>db)._query_hits.items())
+
+    def cache_compiled_query(self, dbname, key, query_unit):
+        db = self._dbs.get(dbname)
+        if (db is not None and query_unit.cacheable and
+                query_unit.dbver == (<Database>db)._dbver):
+            (<Database>db)._cache_compiled_query(key, query_unit)
+
+    def on_remote_schema_change(self, dbname):
+        # None means that any database could have been changed.
+        if dbname is None:
+            dbs = list(self._dbs.values())
+        else:
+            db = self._dbs.get(dbname)
+            dbs = [db] if db is not None else []
+        for db in dbs:
+            (<Database>db)._on_remote_ddl()
+
+    async def check_sys_event_vers(self):
+        """Find the schema changes the server was not notified of.
+
+        DDL transactions advance the system event version of their
+        database; a notification of the change can be lost.
+        """
+        for dbname, db in list(self._dbs.items()):
+            dbver = (<Database>db)._dbver
+            try:
+                conn = await self._server.acquire_pgcon(dbname)
+            except pgerror.BackendError:
+                # The database could have been dropped.
+                continue
+            try:
+                version = await sysevents.get_version(conn)
+            finally:
+                self._server.release_pgcon(dbname, conn)
+
+            if version is None or (<Database>db)._dbver != dbver:
+                # The schema was changed while we were waiting; the
+                # version is recorded by the next check.
+                continue
+            known_ver = (<Database>db)._sys_event_ver
+            if known_ver is not None and version != known_ver:
+                (<Database>db)._on_remote_ddl()
+            (<Database>db)._sys_event_ver = version
+
     def get_dbver(self, dbname):
         db = self._get_db(dbname)
         return (<Database>db)._dbver
@@ -321,8 +537,92 @@ cdef class DatabaseIndex:
         except KeyError:
             db = Database(self, dbname)
             self._dbs[dbname] = db
+            if self._persistent_cache is not None:
+                # The database is usable while its persisted
+                # queries are being loaded.
+                db._load_queries_task = asyncio.create_task(
+                    self._load_persisted_queries(db))
         return db
 
+    async def _get_schema_hash(self, dbname):
+        conn = await self._server.acquire_pgcon(dbname)
+        try:
+            result = await conn.simple_query(
+                b'''SELECT version, encode(hash, 'hex')
+                    FROM edgedb._schema_snapshot''',
+                ignore_data=False)
+        except pgerror.BackendError:
+            # Databases that were never altered by this version
+            # of the server don't have the snapshot table.
+            return None
+        finally:
+            self._server.release_pgcon(dbname, conn)
+
+        if not result:
+            return None
+
+        version, schema_hash = result[0]
+        if version.decode() != self._persistent_cache.get_version():
+            return None
+        return bytes.fromhex(schema_hash.decode())
+
+    async def _load_persisted_queries(self, Database db):
+        dbver = db._dbver
+        try:
+            schema_hash = await self._get_schema_hash(db._name)
+            if db._dbver != dbver:
+                # The schema was changed while we were waiting.
+                return
+
+            entries = []
+            if schema_hash is not None:
+                entries = await asyncio.get_running_loop().run_in_executor(
+                    None, self._persistent_cache.load, db._name, schema_hash)
+            if db._dbver != dbver:
+                return
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning(
+                'could not load persisted queries of database %r',
+                db._name, exc_info=True)
+            return
+        finally:
+            db._load_queries_task = None
+
+        db._schema_hash = schema_hash
+        db._restore_queries(entries)
+
+    async def save_persisted_queries(self):
+        if self._persistent_cache is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        for dbname, db in list(self._dbs.items()):
+            if (not (<Database>db)._queries_changed or
+                    (<Database>db)._schema_hash is None):
+                continue
+            # Queries compiled while the file is being written are
+            # saved the next time.
+            (<Database>db)._queries_changed = False
+            try:
+                await loop.run_in_executor(
+                    None, self._persistent_cache.store,
+                    dbname, (<Database>db)._schema_hash,
+                    (<Database>db)._get_persisted_queries())
+            except Exception:
+                (<Database>db)._queries_changed = True
+                logger.warning(
+                    'could not persist queries of database %r',
+                    dbname, exc_info=True)
+
+    def stop(self):
+        for db in self._dbs.values():
+            task = (<Database>db)._load_queries_task
+            if task is not None:
+                task.cancel()
+                (<Database>db)._load_queries_task = None
+
     cdef _save_system_overrides(self):
         data = config.to_json(config.get_settings(), self._sys_config)
         with open(self._sys_overrides_fn, 'wt') as f:
@@ -367,6 +667,8 @@ cdef class DatabaseIndex:
             await self._server._after_system_config_reset(
                 op.setting_name)
 
+        self._server.signal_sys_event('system-config-changes')
+
     def new_view(self, dbname: str, *, user: str, query_cache: bool):
         db = self._get_db(dbname)
         return (<Database>db)._new_view(user, query_cache)
@@ -25,6 +25,33 @@ EDGEDB_ENCODING = 'utf-8'
 
 
 _MAX_QUERIES_CACHE = 1000
+_MAX_PERSISTED_QUERIES = 500
+# Number of the most used queries recompiled after DDL.
+_MAX_WARM_UP_QUERIES = 50
+# Seconds between saves of the persistent query cache.
+_PERSISTED_QUERIES_SAVE_INTERVAL = 60.0
+# Number of distinct queries the statistics are kept for.
+_MAX_QUERY_STATS = 5000
+# Seconds between saves of the query statistics (see sys::QueryStats.)
+_QUERY_STATS_SAVE_INTERVAL = 5.0
+
+# Postgres NOTIFY channel used by the servers sharing a Postgres
+# cluster to tell each other about schema and system config changes.
+EDGEDB_SYSEVENT_CHANNEL = '__edgedb_sysevent__'
+# Seconds to wait before reconnecting the system event listener.
+SYSEVENT_RECONNECT_INTERVAL = 1.0
+# Seconds between checks of the system event versions of the
+# databases, which find the schema changes whose notifications
+# were lost.
+SYSEVENT_CHECK_INTERVAL = 10.0
+
+# Number of Postgres connections every server opens outside of the
+# backend connection pool: the system event listener and sender and
+# the connection reloading the system config.
+_RESERVED_BACKEND_CONNECTIONS = 3
+
+# Seconds between checks of the replication lag of read replicas.
+REPLICA_CHECK_INTERVAL = 1.0
 
 _QUERY_ROLLING_AVG_LEN = 10
 _QUERIES_ROLLING_AVG_LEN = 300
@@ -45,6 +45,7 @@ cdef class HttpProtocol:
         object transport
         object unprocessed
         bint in_response
+        str proto_name
 
         HttpRequest current_request
 
@@ -54,5 +55,6 @@ cdef class HttpProtocol:
     cdef write(self, HttpRequest request, HttpResponse response)
 
     cdef unhandled_exception(self, ex)
+    cdef _observe_request(self, started_at, status)
     cdef resume(self)
     cdef close(self)
@@ -19,12 +19,15 @@
 
 import collections
 import http
+import time
 
 import httptools
 
 from edb.common import debug
 from edb.common import markup
 
+from edb.server import metrics
+
 
 HTTPStatus = http.HTTPStatus
 
@@ -52,6 +55,8 @@ cdef class HttpProtocol:
         self.current_request = HttpRequest()
         self.in_response = False
         self.unprocessed = None
+        # Label of the metrics of requests served by this protocol.
+        self.proto_name = 'http'
 
     def connection_made(self, transport):
         self.transport = transport
@@ -156,19 +161,27 @@ cdef class HttpProtocol:
         if self.transport is None:
             return
 
+        started_at = time.monotonic()
         try:
             await self.handle_request(request, response)
         except Exception as ex:
             self.unhandled_exception(ex)
+            self._observe_request(started_at, HTTPStatus.BAD_REQUEST)
             return
 
         self.write(request, response)
         self.in_response = False
+        self._observe_request(started_at, response.status)
 
         if response.close_connection or not request.should_keep_alive:
             self.close()
         else:
             self.resume()
 
+    cdef _observe_request(self, started_at, status):
+        metrics.http_request_duration.observe(
+            time.monotonic() - started_at, self.proto_name)
+        metrics.http_requests.inc(1.0, self.proto_name, str(status.value))
+
     async def handle_request(self, request, response):
         raise NotImplementedError
@@ -57,7 +57,7 @@ class BaseHttpPort(baseport.Port):
         self.concurrency = concurrency
 
         self._servers = []
-        self._query_cache = cache.StatementsCache(
+        self._query_cache = cache.QueryCache(
             maxsize=defines.HTTP_PORT_QUERY_CACHE_SIZE)
 
     @property
@@ -75,6 +75,9 @@ class BaseHttpPort(baseport.Port):
     def get_dbver(self):
         return self._dbindex.get_dbver(self.database)
 
+    def get_query_cache_stats(self):
+        return self._query_cache.get_stats()
+
     def get_compiler_worker_cls(self):
         raise NotImplementedError
 
@@ -109,7 +112,8 @@ class BaseHttpPort(baseport.Port):
         nethost = await self._fix_localhost(self._nethost, self._netport)
         srv = await self._loop.create_server(
             self.build_protocol,
-            host=nethost, port=self._netport)
+            host=nethost, port=self._netport,
+            reuse_port=self.get_server().in_multi_frontend_mode())
 
         self._servers.append(srv)
 
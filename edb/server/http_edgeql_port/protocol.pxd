@@ -18,10 +18,10 @@
 
 
 from edb.server.http cimport http
-from edb.server.cache cimport stmt_cache
+from edb.server.cache cimport query_cache as qcache
 
 
 cdef class Protocol(http.HttpProtocol):
     cdef:
         object server
-        stmt_cache.StatementsCache query_cache
+        qcache.QueryCache query_cache
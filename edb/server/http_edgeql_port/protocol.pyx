@@ -37,6 +37,7 @@ cdef class Protocol(http.HttpProtocol):
 
     def __init__(self, loop, server, query_cache):
         http.HttpProtocol.__init__(self, loop)
+        self.proto_name = server.get_proto_name()
         self.server = server
         self.query_cache = query_cache
 
@@ -129,6 +130,7 @@ cdef class Protocol(http.HttpProtocol):
         try:
             units = await comp.call(
                 'compile_eql',
+                self.server.database,
                 dbver,
                 query,
                 None,  # modaliases
@@ -145,15 +147,13 @@ cdef class Protocol(http.HttpProtocol):
 
     async def execute(self, bytes query, variables):
         dbver = self.server.get_dbver()
-        cache_key = (query, dbver)
         use_prep_stmt = False
 
-        query_unit: compiler.QueryUnit = self.query_cache.get(
-            cache_key, None)
+        query_unit: compiler.QueryUnit = self.query_cache.get(query, dbver)
 
         if query_unit is None:
             query_unit = await self.compile(dbver, query)
-            self.query_cache[cache_key] = query_unit
+            self.query_cache.put(query, dbver, query_unit)
         else:
             # This is at least the second time this query is used.
             use_prep_stmt = True
@@ -65,7 +65,7 @@ class Compiler(compiler.BaseCompiler):
             operation_name: str=None,
             variables: typing.Optional[typing.Mapping[str, object]]=None):
 
-        db = await self._get_database(dbver)
+        db = await self._get_database(self._dbname, dbver)
 
         op = graphql.translate(
             db.gqlcore,
@@ -38,6 +38,7 @@ cdef class Protocol(http.HttpProtocol):
 
     def __init__(self, loop, server, query_cache):
         http.HttpProtocol.__init__(self, loop)
+        self.proto_name = server.get_proto_name()
         self.server = server
         self.query_cache = query_cache
 
@@ -160,16 +161,16 @@ cdef class Protocol(http.HttpProtocol):
 
     async def execute(self, query, operation_name, variables):
         dbver = self.server.get_dbver()
-        cache_key = (query, operation_name, dbver)
+        cache_key = (query, operation_name)
         use_prep_stmt = False
 
         op: compiler.CompiledOperation = self.query_cache.get(
-            cache_key, None)
+            cache_key, dbver)
 
         if op is None:
             op = await self.compile(
                 dbver, query, operation_name, variables)
-            self.query_cache[cache_key] = op
+            self.query_cache.put(cache_key, dbver, op)
         else:
             if op.cache_deps_vars:
                 op = await self.compile(
@@ -149,7 +149,8 @@ def _init_parsers():
     ql_parser.preload()
 
 
-def _run_server(cluster, args, runstate_dir, internal_runstate_dir):
+def _run_server(cluster, args, runstate_dir, internal_runstate_dir, *,
+                frontend_id=0):
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     try:
@@ -158,6 +159,11 @@ def _run_server(cluster, args, runstate_dir, internal_runstate_dir):
         # coverage will fail to detect that "import edb..." lines
         # actually were run.
         from . import server
+        from . import tracing
+
+        trace_exporter = None
+        if args['trace_file']:
+            trace_exporter = tracing.FileExporter(args['trace_file'])
 
         ss = server.Server(
             loop=loop,
@@ -165,8 +171,15 @@ def _run_server(cluster, args, runstate_dir, internal_runstate_dir):
             runstate_dir=runstate_dir,
             internal_runstate_dir=internal_runstate_dir,
             max_backend_connections=args['max_backend_connections'],
+            persistent_query_cache=args['persistent_query_cache'],
             nethost=args['bind_address'],
             netport=args['port'],
+            frontend_id=frontend_id,
+            frontends=args['frontends'],
+            replica_dsns=args['replica_dsn'],
+            replica_max_lag=args['replica_max_lag'],
+            metrics_port=args['metrics_port'],
+            trace_exporter=trace_exporter,
         )
 
         loop.run_until_complete(ss.init())
@@ -179,8 +192,9 @@ def _run_server(cluster, args, runstate_dir, internal_runstate_dir):
 
         loop.add_signal_handler(signal.SIGTERM, terminate_server, ss, loop)
 
-        # Notify systemd that we've started up.
-        _sd_notify('READY=1')
+        if args['frontends'] == 1:
+            # Notify systemd that we've started up.
+            _sd_notify('READY=1')
 
         try:
             loop.run_forever()
@@ -189,7 +203,60 @@ def _run_server(cluster, args, runstate_dir, internal_runstate_dir):
 
     except KeyboardInterrupt:
         logger.info('Shutting down.')
-        _sd_notify('STOPPING=1')
+        if args['frontends'] == 1:
+            _sd_notify('STOPPING=1')
+
+
+def _run_frontends(cluster, args, runstate_dir, internal_runstate_dir):
+    # Fork before any event loop is created; every frontend is a
+    # complete server sharing the Postgres cluster with the others.
+    pids = []
+    for frontend_id in range(args['frontends']):
+        frontend_runstate_dir = os.path.join(
+            internal_runstate_dir, f'frontend-{frontend_id}')
+        os.mkdir(frontend_runstate_dir)
+
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                setproctitle.setproctitle(
+                    f'edgedb-server: frontend-{frontend_id}')
+                _run_server(cluster, args, runstate_dir,
+                            frontend_runstate_dir, frontend_id=frontend_id)
+            except BaseException:
+                logger.exception('frontend %d failed', frontend_id)
+                status = 1
+            finally:
+                os._exit(status)
+
+        pids.append(pid)
+
+    def forward_signal(signo, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGINT, forward_signal)
+
+    _sd_notify('READY=1')
+
+    # The frontends are stopped together: if one of them exits,
+    # the instance is shut down.
+    stopping = False
+    while pids:
+        pid, _ = os.wait()
+        if pid not in pids:
+            continue
+        pids.remove(pid)
+        if not stopping:
+            stopping = True
+            logger.info('Shutting down.')
+            _sd_notify('STOPPING=1')
+            forward_signal(signal.SIGTERM, None)
 
 
 def run_server(args):
@@ -294,7 +361,12 @@ def run_server(args):
                     port=cluster_port,
                     server_settings=server_settings)
 
-            if not args['bootstrap']:
+            if args['bootstrap']:
+                pass
+            elif args['frontends'] > 1:
+                _run_frontends(
+                    cluster, args, runstate_dir, internal_runstate_dir)
+            else:
                 _run_server(cluster, args, runstate_dir, internal_runstate_dir)
 
     except BaseException:
@@ -362,6 +434,34 @@ _server_options = [
               '("/run" on Linux by default)')),
     click.option(
         '--max-backend-connections', type=int, default=100),
+    click.option(
+        '--frontends', type=click.IntRange(min=1), default=1,
+        help=('number of server processes accepting client connections; '
+              'the backend connections are split between them')),
+    click.option(
+        '--replica-dsn', type=str, multiple=True, metavar='DSN',
+        help=('postgres:// URI of a hot standby of the database cluster; '
+              'read-only queries outside of transactions are executed '
+              'on the standbys that have replayed the previous writes of '
+              'the same connection (can be specified multiple times)')),
+    click.option(
+        '--replica-max-lag', type=float, default=0.0,
+        help=('maximum replication lag (in seconds) of a standby that '
+              'is still used for read-only queries')),
+    click.option(
+        '--metrics-port', type=int, default=None,
+        help=('port to serve the server metrics on, in the Prometheus '
+              'text format (/metrics); with several frontends, frontend '
+              'N listens on this port + N')),
+    click.option(
+        '--trace-file', type=str, default=None, metavar='PATH',
+        help=('append the timing breakdown of every query to PATH, '
+              'one JSON object per line')),
+    click.option(
+        '--persistent-query-cache/--no-persistent-query-cache',
+        help=('keep compiled queries in the data directory across '
+              'server restarts'),
+        default=False),
 ]
 
 
@@ -373,6 +473,13 @@ def server_options(func):
 
 def server_main(*, insecure=False, **kwargs):
 
+    if (kwargs['max_backend_connections'] // kwargs['frontends'] <=
+            defines._RESERVED_BACKEND_CONNECTIONS):
+        raise click.UsageError(
+            f'--max-backend-connections is too low for '
+            f'{kwargs["frontends"]} frontends: every frontend needs more '
+            f'than {defines._RESERVED_BACKEND_CONNECTIONS} connections')
+
     logsetup.setup_logging(kwargs['log_level'], kwargs['log_to'])
     exceptions.install_excepthook()
 
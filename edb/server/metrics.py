@@ -0,0 +1,125 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Metrics of the server process (see the --metrics-port option)."""
+
+
+from edb.common import prometheus
+
+
+registry = prometheus.Registry(prefix='edgedb_server_')
+
+
+# Binary protocol
+
+compile_duration = registry.new_histogram(
+    'compile_duration_seconds',
+    'Time it takes to compile EdgeQL queries, including the wait '
+    'for a compiler.',
+)
+
+parse_duration = registry.new_histogram(
+    'parse_duration_seconds',
+    'Time it takes to prepare queries for successful Parse messages of '
+    'the binary protocol.',
+)
+
+execute_duration = registry.new_histogram(
+    'execute_duration_seconds',
+    'Time it takes to execute queries and send their results for '
+    'successful Execute messages of the binary protocol.',
+)
+
+query_cache_lookups = registry.new_counter(
+    'query_cache_lookups_total',
+    'Lookups of compiled queries in the query cache.',
+    labels=('result',),
+)
+
+backend_parse = registry.new_counter(
+    'backend_parse_total',
+    'Statements parsed by Postgres and the parses skipped because the '
+    'statement was already prepared.',
+    labels=('result',),
+)
+
+# Postgres
+
+backend_query_duration = registry.new_histogram(
+    'backend_query_duration_seconds',
+    'Time it takes Postgres to execute queries and stream the results.',
+)
+
+backend_connections = registry.new_gauge(
+    'backend_connections',
+    'Postgres connections of the backend pools.',
+    labels=('pool', 'state'),
+)
+
+backend_connections_max = registry.new_gauge(
+    'backend_connections_max',
+    'Maximum number of connections of the backend pools.',
+    labels=('pool',),
+)
+
+backend_connection_waiters = registry.new_gauge(
+    'backend_connection_waiters',
+    'Clients waiting for a connection of the backend pools.',
+    labels=('pool',),
+)
+
+# Compiler processes
+
+compiler_call_duration = registry.new_histogram(
+    'compiler_call_duration_seconds',
+    'Time it takes compiler processes to serve requests.',
+    labels=('method',),
+)
+
+compiler_workers = registry.new_gauge(
+    'compiler_workers',
+    'Compiler processes of the shared pool.',
+    labels=('state',),
+)
+
+compiler_waiters = registry.new_gauge(
+    'compiler_waiters',
+    'Clients waiting for a compiler of the shared pool.',
+)
+
+compiler_events = registry.new_counter(
+    'compiler_events_total',
+    'Compiler processes of the shared pool spawned, killed and '
+    'recycled.',
+    labels=('event',),
+)
+
+# HTTP ports
+
+http_request_duration = registry.new_histogram(
+    'http_request_duration_seconds',
+    'Time it takes to handle requests to the HTTP ports.',
+    labels=('protocol',),
+)
+
+http_requests = registry.new_counter(
+    'http_requests_total',
+    'Requests to the HTTP ports.',
+    labels=('protocol', 'status'),
+)
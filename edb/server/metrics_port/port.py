@@ -0,0 +1,67 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from edb.common import taskgroup
+
+from edb.server import baseport
+
+from . import protocol
+
+
+class MetricsPort:
+    """Serve the metrics of a registry over HTTP.
+
+    Unlike the other ports, the metrics port needs neither compilers
+    nor Postgres connections.
+    """
+
+    def __init__(self, *, loop, nethost, netport, registry,
+                 reuse_port=False):
+        self._loop = loop
+        self._nethost = nethost
+        self._netport = netport
+        self._registry = registry
+        self._reuse_port = reuse_port
+        self._servers = []
+
+    def get_registry(self):
+        return self._registry
+
+    def build_protocol(self):
+        return protocol.Protocol(self._loop, self)
+
+    async def start(self):
+        if self._servers:
+            raise RuntimeError('already serving')
+
+        nethost = await baseport.fix_localhost(
+            self._loop, self._nethost, self._netport)
+        srv = await self._loop.create_server(
+            self.build_protocol,
+            host=nethost, port=self._netport,
+            reuse_port=self._reuse_port)
+
+        self._servers.append(srv)
+
+    async def stop(self):
+        async with taskgroup.TaskGroup() as g:
+            for srv in self._servers:
+                srv.close()
+                g.create_task(srv.wait_closed())
+            self._servers.clear()
@@ -64,20 +64,68 @@ cdef class EdgeConnection:
 
         object port
 
-        object backend
         object loop
         readonly dbview.DatabaseConnectionView dbview
 
         ReadBuffer buffer
 
         object _msg_take_waiter
+        # Set while the client transport's write buffer is full.
+        object _write_waiter
         object _startup_msg_waiter
 
         object _main_task
 
         object _last_anon_compiled
+        # The literals extracted from the last anonymous statement
+        # if it was compiled normalized, None otherwise.
+        object _last_anon_normalized
+        # Whether the last anonymous statement is executed as a
+        # named Postgres statement that is already prepared.
+        bint _last_anon_prepared
         WriteBuffer _write_buf
 
+        # Named prepared statements of this connection.
+        dict _prepared_stmts
+
+        # The query whose result was suspended by an Execute message
+        # with a row limit, and the ID of its transaction.
+        object _cursor
+
+        # A Postgres connection borrowed from the server-wide pool;
+        # it is held for the duration of a transaction and returned
+        # to the pool at the next synchronization point.
+        object _pgcon
+        # The Postgres connection the last anonymous statement
+        # was parsed on.
+        object _last_anon_pgcon
+
+        # The position of the primary's WAL the replicas must have
+        # replayed for this connection to read its own writes from
+        # them; it is looked up before the next read after a write.
+        object _write_lsn
+        bint _write_lsn_stale
+
+        # A compiler worker from the port's shared pool that holds
+        # the compiler state of the current transaction block, and
+        # the ID of that transaction (None if the worker has already
+        # discarded it.)
+        object _pinned_compiler
+        object _pinned_txid
+
+        # The trace of the message being processed (see
+        # edb.server.tracing), and whether the client has requested
+        # one in the headers of that message.
+        object _trace
+        object _trace_exporter
+        bint _trace_requested
+
+        object _query_stats
+
+        # (schema_hash, snapshot) of the last DDL unit executed, saved
+        # once its transaction is committed (see save_schema_snapshot.)
+        object _pending_schema_snapshot
+
         bint debug
         bint query_cache_enabled
 
@@ -86,6 +134,7 @@ cdef class EdgeConnection:
     cdef char render_cardinality(self, query_unit) except -1
 
     cdef write(self, WriteBuffer buf)
+    cdef inline bint is_writing_paused(self)
     cdef flush(self)
     cdef abort(self)
     cdef close(self)
@@ -93,11 +142,36 @@ cdef class EdgeConnection:
     cdef fallthrough(self, bint ignore_unhandled)
 
     cdef pgcon_last_sync_status(self)
-
-    cdef WriteBuffer recode_bind_args(self, bytes bind_args)
+    cdef maybe_release_pgcon(self)
+    cdef release_pgcon(self, bint discard)
+    cdef track_compiler_tx_state(self, units)
+    cdef unpin_compiler(self)
+    cdef maybe_unpin_compiler(self, query_unit)
+
+    cdef normalize_query(self, bytes eql)
+    cdef lookup_compiled_query(self, bytes eql, normalized,
+                               bint json_mode, bint expect_one)
+
+    cdef WriteBuffer recode_bind_args(self, bytes bind_args, normalized)
+
+    cdef can_use_replica(self, query_unit)
+    cdef track_writes(self, query_unit)
+    cdef can_pipeline(self, query_unit)
+    cdef on_pipelined_query_complete(self, query_unit, int64_t rows,
+                                     double duration)
+    cdef record_query_stats(self, query_unit, double duration, int64_t rows)
+    cdef on_ddl_success(self, query_unit)
 
     cdef WriteBuffer make_describe_msg(self, query_unit)
     cdef WriteBuffer make_command_complete_msg(self, query_unit)
+    cdef WriteBuffer make_portal_suspended_msg(self)
+
+    cdef int32_t read_execute_headers(self) except -1
+    cdef read_trace_headers(self)
+    cdef start_trace(self, str name)
+    cdef write_trace_headers(self, WriteBuffer msg)
+    cdef abort_trace(self, exc)
+    cdef check_row_limit_allowed(self, query_unit)
 
     cdef inline reject_headers(self)
     cdef dict parse_headers(self)
@@ -20,6 +20,7 @@ import asyncio
 import hashlib
 import json
 import logging
+import time
 import traceback
 
 cimport cython
@@ -46,9 +47,12 @@ from edb.server.pgproto.pgproto cimport (
 from edb.server.dbview cimport dbview
 
 from edb.server import config
+from edb.server import metrics
+from edb.server import tracing
 
 from edb.server import compiler
 from edb.server.compiler import errormech
+from edb.server.compiler import normalizer
 from edb.server.pgcon cimport pgcon
 from edb.server.pgcon import errors as pgerror
 
@@ -62,6 +66,14 @@ from edgedb import scram
 
 
 DEF FLUSH_BUFFER_AFTER = 100_000
+DEF MAX_PIPELINED_QUERIES = 100
+# Execute message header: the maximum number of rows to return, as
+# int32; the rest of the result is fetched with FetchMore messages.
+DEF HEADER_ROW_LIMIT = 0xFF10
+# Parse, Execute and OptimisticExecute message header: request a
+# trace of the message; the trace is returned as JSON in the header
+# of the same code of the ParseComplete or CommandComplete message.
+DEF HEADER_TRACE = 0xFF11
 cdef bytes ZERO_UUID = b'\x00' * 16
 cdef bytes EMPTY_TUPLE_UUID = s_obj.get_known_type_id('empty-tuple').bytes
 
@@ -74,6 +86,30 @@ cdef object CARD_MANY = compiler.ResultCardinality.MANY
 cdef object logger = logging.getLogger('edb.server')
 
 
+@cython.final
+cdef class PreparedStatement:
+
+    cdef:
+        bytes eql
+        bint json_mode
+        bint expect_one
+
+        object query_unit
+        object normalized
+        # The version of the schema the statement was compiled
+        # against, see DatabaseConnectionView.schema_version.
+        object schema_version
+
+    def __init__(self, bytes eql, bint json_mode, bint expect_one):
+        self.eql = eql
+        self.json_mode = json_mode
+        self.expect_one = expect_one
+
+        self.query_unit = None
+        self.normalized = None
+        self.schema_version = None
+
+
 @cython.final
 cdef class EdgeConnection:
 
@@ -85,7 +121,15 @@ cdef class EdgeConnection:
 
         self.loop = server.get_loop()
         self.dbview = None
-        self.backend = None
+
+        self._pgcon = None
+        self._last_anon_pgcon = None
+
+        self._write_lsn = 0
+        self._write_lsn_stale = False
+
+        self._pinned_compiler = None
+        self._pinned_txid = None
 
         self._transport = None
         self.buffer = ReadBuffer()
@@ -95,11 +139,24 @@ cdef class EdgeConnection:
 
         self._main_task = None
         self._msg_take_waiter = None
+        self._write_waiter = None
 
         self._last_anon_compiled = None
+        self._last_anon_normalized = None
+        self._last_anon_prepared = False
+
+        self._prepared_stmts = {}
+        self._cursor = None
 
         self._write_buf = None
 
+        self._trace = None
+        self._trace_exporter = server.get_server().get_trace_exporter()
+        self._trace_requested = False
+
+        self._query_stats = server.get_server().get_query_stats()
+        self._pending_schema_snapshot = None
+
         self.debug = debug.flags.server_proto
         self.query_cache_enabled = not (debug.flags.disable_qcache or
                                         debug.flags.edgeql_compile)
@@ -127,9 +184,11 @@ cdef class EdgeConnection:
         if self._transport is not None:
             self._transport.abort()
             self._transport = None
-        if self.backend is not None:
-            self.loop.create_task(self.backend.close())
-            self.backend = None
+        if self._pgcon is not None:
+            # The state of the Postgres connection is unknown (a
+            # query could be still running on it), don't reuse it.
+            self.release_pgcon(True)
+        self.unpin_compiler()
 
     cdef close(self):
         self.flush()
@@ -137,9 +196,55 @@ cdef class EdgeConnection:
         if self._transport is not None:
             self._transport.close()
             self._transport = None
-        if self.backend is not None:
-            self.loop.create_task(self.backend.close())
-            self.backend = None
+        if self._pgcon is not None:
+            self.release_pgcon(False)
+        self.unpin_compiler()
+
+    async def get_pgcon(self):
+        if self._pgcon is not None:
+            return self._pgcon
+
+        dbname = self.dbview.dbname
+        server = self.port.get_server()
+        pgconn = await server.acquire_pgcon(dbname)
+        try:
+            await pgconn.restore_session_state(
+                self.dbview.modaliases,
+                self.dbview.get_session_config())
+        except Exception:
+            server.release_pgcon(dbname, pgconn, discard=True)
+            raise
+
+        if self._con_status == EDGECON_BAD:
+            # The connection was aborted while we were waiting.
+            server.release_pgcon(dbname, pgconn)
+            raise ConnectionAbortedError
+
+        self._pgcon = pgconn
+        return pgconn
+
+    cdef maybe_release_pgcon(self):
+        # Must only be called at synchronization points, i.e. when
+        # there is no implicit transaction open on the Postgres
+        # connection.
+        if self._pgcon is None:
+            return
+        if self.dbview.in_tx() or self._pgcon.in_tx():
+            return
+        self.release_pgcon(False)
+
+    cdef release_pgcon(self, bint discard):
+        pgconn = self._pgcon
+        self._pgcon = None
+        self._last_anon_pgcon = None
+
+        if not discard:
+            pgconn.set_session_state(
+                self.dbview.modaliases,
+                self.dbview.get_session_config())
+
+        self.port.get_server().release_pgcon(
+            self.dbview.dbname, pgconn, discard=discard)
 
     cdef flush(self):
         if self._transport is None:
@@ -157,6 +262,15 @@ cdef class EdgeConnection:
         self._msg_take_waiter = self.loop.create_future()
         await self._msg_take_waiter
 
+    cdef inline bint is_writing_paused(self):
+        return self._write_waiter is not None
+
+    async def wait_for_writable(self):
+        # Wait until the client has read enough of the data written
+        # to it so far.
+        if self._write_waiter is not None:
+            await self._write_waiter
+
     async def auth(self):
         cdef:
             char mtype
@@ -189,9 +303,6 @@ cdef class EdgeConnection:
             assert type(dbv) is dbview.DatabaseConnectionView
             self.dbview = <dbview.DatabaseConnectionView>dbv
 
-            self.backend = await self.port.new_backend(
-                dbname=database, dbver=self.dbview.dbver)
-
             # The user has already been authenticated by other means
             # (such as the ability to write to a protected socket).
             if self._external_auth:
@@ -228,7 +339,7 @@ cdef class EdgeConnection:
                 msg_buf = WriteBuffer.new_message(b'S')
                 msg_buf.write_len_prefixed_bytes(b'pgaddr')
                 msg_buf.write_len_prefixed_utf8(
-                    str(self.backend.pgcon.get_pgaddr()))
+                    str(self.port.get_server().get_pgaddr()))
                 msg_buf.end_message()
                 buf.write_buffer(msg_buf)
 
@@ -241,6 +352,8 @@ cdef class EdgeConnection:
             self.write(buf)
             self.flush()
 
+            self.maybe_release_pgcon()
+
         else:
             self.fallthrough(False)
 
@@ -279,7 +392,8 @@ cdef class EdgeConnection:
     async def _get_role_record(self, user):
         role_query = self.port.get_server().get_sys_query('role')
 
-        json_data = await self.backend.pgcon.parse_execute_json(
+        pgconn = await self.get_pgcon()
+        json_data = await pgconn.parse_execute_json(
             role_query, b'__sys_role',
             dbver=0, use_prep_stmt=True, args=(user,),
         )
@@ -463,7 +577,8 @@ cdef class EdgeConnection:
         return verifier, is_mock
 
     async def recover_current_tx_info(self):
-        ret = await self.backend.pgcon.simple_query(b'''
+        pgconn = await self.get_pgcon()
+        ret = await pgconn.simple_query(b'''
             SELECT s1.name AS n, s1.value AS v, s1.type AS t
                 FROM _edgecon_state s1
             UNION ALL
@@ -501,36 +616,124 @@ cdef class EdgeConnection:
 
     #############
 
+    async def call_compiler(self, method_name, *args):
+        # Compilers are shared by all connections of the port; when
+        # in a transaction block, calls go to the compiler that
+        # holds the transaction's state.  Requests to a worker are
+        # multiplexed, so there's no need to wait for the worker to
+        # finish serving other connections.
+        if self._pinned_compiler is not None:
+            return await self._pinned_compiler.call(method_name, *args)
+        else:
+            return await self.port.get_compiler_pool().call(
+                method_name, *args)
+
+    cdef track_compiler_tx_state(self, units):
+        txid = self._pinned_txid
+        for unit in units:
+            if unit.tx_id is not None:
+                txid = unit.tx_id
+            elif unit.tx_commit or unit.tx_rollback:
+                # The compiler forgets the transaction state
+                # once it compiles the end of the block.
+                txid = None
+        self._pinned_txid = txid
+
+    cdef unpin_compiler(self):
+        worker = self._pinned_compiler
+        if worker is None:
+            return
+
+        txid = self._pinned_txid
+        self._pinned_compiler = None
+        self._pinned_txid = None
+
+        pool = self.port.get_compiler_pool()
+        if pool is not None:
+            pool.unpin(worker)
+
+        if txid is not None:
+            self.loop.create_task(
+                self._discard_compiler_tx_state(worker, txid))
+
+    cdef maybe_unpin_compiler(self, query_unit):
+        # The compiler forgets the state of a transaction block once
+        # it compiles its COMMIT or ROLLBACK; unless the compiled
+        # script has started another block, it's not needed anymore.
+        if ((query_unit.tx_commit or query_unit.tx_rollback) and
+                self._pinned_txid is None):
+            self.unpin_compiler()
+
+    async def _discard_compiler_tx_state(self, worker, txid):
+        try:
+            await worker.call('discard_tx_state', txid)
+        except Exception:
+            # The pool is stopping or the worker is gone.
+            logger.debug(
+                'could not discard the compiler state of transaction %s',
+                txid, exc_info=True)
+
     async def _compile(self, bytes eql, bint json_mode, bint expect_one,
-                       str stmt_mode):
+                       str stmt_mode, first_extra=None):
 
-        if self.dbview.in_tx_error():
-            self.dbview.raise_in_tx_error()
+        started_at = time.monotonic()
+        try:
+            if self.dbview.in_tx_error():
+                self.dbview.raise_in_tx_error()
 
-        if self.dbview.in_tx():
-            return await self.backend.compiler.call(
-                'compile_eql_in_tx',
-                self.dbview.txid,
-                eql,
-                json_mode,
-                expect_one,
-                stmt_mode)
-        else:
-            return await self.backend.compiler.call(
-                'compile_eql',
-                self.dbview.dbver,
-                eql,
-                self.dbview.modaliases,
-                self.dbview.get_session_config(),
-                json_mode,
-                expect_one,
-                stmt_mode,
-                CAP_ALL)
+            if self.dbview.in_tx():
+                self._pinned_txid = self.dbview.txid
+                units = await self.call_compiler(
+                    'compile_eql_in_tx',
+                    self.dbview.txid,
+                    eql,
+                    json_mode,
+                    expect_one,
+                    stmt_mode,
+                    first_extra)
+                self.track_compiler_tx_state(units)
+                return units
+
+            # The previous transaction block is over.
+            self.unpin_compiler()
+
+            pool = self.port.get_compiler_pool()
+            worker = await pool.acquire()
+            try:
+                units = await worker.call(
+                    'compile_eql',
+                    self.dbview.dbname,
+                    self.dbview.dbver,
+                    eql,
+                    self.dbview.modaliases,
+                    self.dbview.get_session_config(),
+                    json_mode,
+                    expect_one,
+                    stmt_mode,
+                    CAP_ALL,
+                    False,
+                    first_extra)
+
+                self.track_compiler_tx_state(units)
+                if self._pinned_txid is not None:
+                    # The compiled script has started a transaction block;
+                    # its state is kept by this worker.  Pin it before
+                    # it's released, so that the pool doesn't recycle it.
+                    self._pinned_compiler = worker
+                    pool.pin(worker)
+            finally:
+                pool.release(worker)
+
+            return units
+        finally:
+            metrics.compile_duration.observe(time.monotonic() - started_at)
 
     async def _compile_rollback(self, bytes eql):
         assert self.dbview.in_tx_error()
         try:
-            return await self.backend.compiler.call(
+            # Served by the compiler holding the state of the
+            # transaction, like the other commands of the block.
+            return await self.call_compiler(
                 'try_compile_rollback', self.dbview.dbver, eql)
         except Exception:
             self.dbview.raise_in_tx_error()
@@ -539,7 +742,8 @@ cdef class EdgeConnection:
         assert self.dbview.in_tx_error()
 
         query_unit, num_remain = await self._compile_rollback(eql)
-        await self.backend.pgcon.simple_query(
+        pgconn = await self.get_pgcon()
+        await pgconn.simple_query(
             b';'.join(query_unit.sql), ignore_data=True)
 
         if query_unit.tx_savepoint_rollback:
@@ -551,6 +755,7 @@ cdef class EdgeConnection:
                 self.debug_print('== RECOVERY: ROLLBACK')
             assert query_unit.tx_rollback
             self.dbview.abort_tx()
+            self.unpin_compiler()
 
         if num_remain:
             return 'skip_first', query_unit
@@ -582,17 +787,20 @@ cdef class EdgeConnection:
                 packet.write_buffer(self.pgcon_last_sync_status())
                 self.write(packet)
                 self.flush()
+                self.maybe_release_pgcon()
                 return
 
         units = await self._compile(eql, False, False, stmt_mode)
+        pgconn = await self.get_pgcon()
 
         for query_unit in units:
+            self.track_writes(query_unit)
             self.dbview.start(query_unit)
             try:
                 if query_unit.system_config:
                     await self._execute_system_config(query_unit)
                 else:
-                    await self.backend.pgcon.simple_query(
+                    await pgconn.simple_query(
                         b';'.join(query_unit.sql), ignore_data=True)
                     if query_unit.config_ops is not None:
                         await self.dbview.apply_config_ops(
@@ -601,32 +809,62 @@ cdef class EdgeConnection:
                 raise
             except Exception:
                 self.dbview.on_error(query_unit)
-                if not self.backend.pgcon.in_tx() and self.dbview.in_tx():
+                if not pgconn.in_tx() and self.dbview.in_tx():
                     # COMMIT command can fail, in which case the
                     # transaction is aborted.  This check workarounds
                     # that (until a better solution is found.)
                     self.dbview.abort_tx()
+                    self.unpin_compiler()
                     await self.recover_current_tx_info()
                 raise
             else:
                 self.dbview.on_success(query_unit)
+                self.maybe_unpin_compiler(query_unit)
+                self.on_ddl_success(query_unit)
+                # Every unit of a script is committed on its own.
+                await self.save_schema_snapshot(pgconn)
 
         packet = WriteBuffer.new()
         packet.write_buffer(self.make_command_complete_msg(query_unit))
         packet.write_buffer(self.pgcon_last_sync_status())
         self.write(packet)
         self.flush()
+        self.maybe_release_pgcon()
 
-    async def _parse(self, bytes eql, bint json_mode, bint expect_one):
+    cdef normalize_query(self, bytes eql):
+        if not self.query_cache_enabled:
+            # Normalization is only worth it if the compiled
+            # queries are cached.
+            return None
+        return normalizer.normalize(eql)
+
+    cdef lookup_compiled_query(self, bytes eql, normalized,
+                               bint json_mode, bint expect_one):
+        query_unit = None
+        if normalized is not None:
+            query_unit = self.dbview.lookup_compiled_query(
+                normalized.text, json_mode, expect_one,
+                normalized.first_extra)
+        if query_unit is None:
+            # The query could have failed to compile normalized
+            # earlier, and was compiled as is.
+            query_unit = self.dbview.lookup_compiled_query(
+                eql, json_mode, expect_one, None)
+        return query_unit
+
+    async def _parse(self, bytes eql, normalized,
+                     bint json_mode, bint expect_one, bint anon=True):
+        started_at = time.monotonic()
         if self.debug:
             self.debug_print('PARSE', eql)
 
-        query_unit = self.dbview.lookup_compiled_query(
-            eql, json_mode, expect_one)
+        query_unit = self.lookup_compiled_query(
+            eql, normalized, json_mode, expect_one)
         cached = True
         if query_unit is None:
             # Cache miss; need to compile this query.
             cached = False
+            compile_start = time.monotonic()
 
             if self.dbview.in_tx_error():
                 # The current transaction is aborted; only
@@ -638,9 +876,29 @@ cdef class EdgeConnection:
                     # ROLLBACK in that 'eql' string.
                     self.dbview.raise_in_tx_error()
             else:
-                query_unit = await self._compile(
-                    eql, json_mode, expect_one, 'single')
-                query_unit = query_unit[0]
+                units = None
+                if normalized is not None:
+                    try:
+                        units = await self._compile(
+                            normalized.text, json_mode, expect_one,
+                            'single', normalized.first_extra)
+                    except normalizer.NormalizationError:
+                        # Not every literal can be replaced with a
+                        # parameter (or the query is invalid anyway);
+                        # compile the query as is.
+                        if self.debug:
+                            self.debug_print(
+                                'PARSE /NORMALIZED FAILED', normalized.text)
+                if units is None:
+                    units = await self._compile(
+                        eql, json_mode, expect_one, 'single')
+                query_unit = units[0]
+                if self._trace is not None:
+                    self._trace.add_span(
+                        'compile', compile_start, time.monotonic())
+                    self._trace.add_compile_spans(
+                        compile_start, query_unit.compile_timings)
+            compile_time = time.monotonic() - compile_start
         elif self.dbview.in_tx_error():
             # We have a cached QueryUnit for this 'eql', but the current
             # transaction is aborted.  We can only complete this Parse
@@ -649,23 +907,119 @@ cdef class EdgeConnection:
             if not (query_unit.tx_rollback or query_unit.tx_savepoint_rollback):
                 self.dbview.raise_in_tx_error()
 
-        await self.backend.pgcon.parse_execute(
-            1,           # =parse
-            0,           # =execute
-            query_unit,  # =query
-            self,        # =edgecon
-            None,        # =bind_data
-            0,           # =send_sync
-            0,           # =use_prep_stmt
-        )
+        pgconn = self._pgcon
+        if pgconn is None:
+            # No backend connection is held between transactions, and
+            # the one the statement would be parsed on now is unlikely
+            # to be the one it is executed on after the next Sync; it
+            # is parsed when executed instead.  Cached statements are
+            # executed as named Postgres statements, which are kept
+            # prepared on every connection.
+            prepared = cached and bool(query_unit.sql_hash)
+            self.port.count_backend_parse(skipped=True)
+        elif (cached and query_unit.sql_hash and
+                (<pgcon.PGProto>pgconn).is_prepared(
+                    query_unit.sql_hash, query_unit.dbver)):
+            # The statement is known to be valid; it will be executed
+            # as the named Postgres statement, no need to parse it.
+            prepared = True
+            self.port.count_backend_parse(skipped=True)
+        else:
+            prepared = False
+            self.port.count_backend_parse(skipped=False)
+            backend_start = time.monotonic()
+            await pgconn.parse_execute(
+                1,           # =parse
+                0,           # =execute
+                query_unit,  # =query
+                self,        # =edgecon
+                None,        # =bind_data
+                0,           # =send_sync
+                0,           # =use_prep_stmt
+            )
+            if self._trace is not None:
+                self._trace.add_span(
+                    'backend.parse', backend_start, time.monotonic())
+
+        if self._trace is not None:
+            self._trace.attrs['cached'] = cached
+
+        if query_unit.first_extra is None:
+            normalized = None
+        query_text = eql if normalized is None else normalized.text
 
         if not cached and query_unit.cacheable:
             self.dbview.cache_compiled_query(
-                eql, json_mode, expect_one, query_unit)
+                query_text, json_mode, expect_one, query_unit)
 
-        self._last_anon_compiled = query_unit
+        if query_unit.sql_hash:
+            if cached:
+                self._query_stats.record_cache_hit(
+                    self.dbview.dbname, query_unit.sql_hash, query_text)
+            else:
+                self._query_stats.record_compile(
+                    self.dbview.dbname, query_unit.sql_hash, query_text,
+                    compile_time)
+
+        if anon:
+            self._last_anon_compiled = query_unit
+            self._last_anon_normalized = normalized
+            self._last_anon_prepared = prepared
+            self._last_anon_pgcon = pgconn
+        elif not prepared and self._last_anon_pgcon is pgconn:
+            # The anonymous statement has just been replaced in
+            # Postgres; it has to be parsed again when executed.
+            self._last_anon_pgcon = None
+
+        metrics.parse_duration.observe(time.monotonic() - started_at)
         return query_unit
 
+    async def _prepare_stmt(self, PreparedStatement stmt):
+        normalized = self.normalize_query(stmt.eql)
+        query_unit = await self._parse(
+            stmt.eql, normalized, stmt.json_mode, stmt.expect_one, False)
+
+        if query_unit.first_extra is None:
+            normalized = None
+        stmt.query_unit = query_unit
+        stmt.normalized = normalized
+        stmt.schema_version = self.dbview.schema_version
+
+    async def _get_prepared_stmt(self, bytes stmt_name,
+                                 bint check_types):
+        cdef PreparedStatement stmt
+
+        stmt = self._prepared_stmts.get(stmt_name)
+        if stmt is None:
+            raise errors.TypeSpecNotFoundError(
+                f'prepared statement {stmt_name.decode()!r} '
+                f'does not exist')
+
+        if (stmt.schema_version != self.dbview.schema_version and
+                not self.dbview.in_tx_error()):
+            # The schema has changed since the statement was
+            # compiled; compile it again.
+            query_unit = stmt.query_unit
+            normalized = stmt.normalized
+            schema_version = stmt.schema_version
+            await self._prepare_stmt(stmt)
+
+            if check_types and (
+                    stmt.query_unit.in_type_id != query_unit.in_type_id or
+                    stmt.query_unit.out_type_id != query_unit.out_type_id):
+                # The client would encode the arguments or decode
+                # the result using outdated type descriptors; keep
+                # failing until it describes the statement.
+                stmt.query_unit = query_unit
+                stmt.normalized = normalized
+                stmt.schema_version = schema_version
+                raise errors.TypeSpecNotFoundError(
+                    f'the type of prepared statement '
+                    f'{stmt_name.decode()!r} has changed; describe '
+                    f'the statement again before executing it')
+
+        return stmt
+
     cdef parse_cardinality(self, bytes card):
         if card == b'm':
             return CARD_MANY
@@ -725,10 +1079,9 @@ cdef class EdgeConnection:
         cdef:
             bint json_mode
             bytes eql
+            PreparedStatement stmt
 
-        self._last_anon_compiled = None
-
-        self.reject_headers()
+        self.read_trace_headers()
 
         json_mode = self.parse_json_mode(self.buffer.read_byte())
         expect_one = (
@@ -736,18 +1089,30 @@ cdef class EdgeConnection:
         )
 
         stmt_name = self.buffer.read_len_prefixed_bytes()
-        if stmt_name:
-            raise errors.UnsupportedFeatureError(
-                'prepared statements are not yet supported')
+        if not stmt_name:
+            self._last_anon_compiled = None
+        elif stmt_name in self._prepared_stmts:
+            raise errors.BinaryProtocolError(
+                f'prepared statement {stmt_name.decode()!r} '
+                f'already exists')
 
         eql = self.buffer.read_len_prefixed_bytes()
         if not eql:
             raise errors.BinaryProtocolError('empty query')
 
-        query_unit = await self._parse(eql, json_mode, expect_one)
+        self.start_trace('parse')
+
+        if stmt_name:
+            stmt = PreparedStatement(eql, json_mode, expect_one)
+            await self._prepare_stmt(stmt)
+            self._prepared_stmts[stmt_name] = stmt
+            query_unit = stmt.query_unit
+        else:
+            query_unit = await self._parse(
+                eql, self.normalize_query(eql), json_mode, expect_one)
 
         buf = WriteBuffer.new_message(b'1')  # ParseComplete
-        buf.write_int16(0)  # no headers
+        self.write_trace_headers(buf)
         buf.write_byte(self.render_cardinality(query_unit))
         buf.write_bytes(query_unit.in_type_id)
         buf.write_bytes(query_unit.out_type_id)
@@ -762,7 +1127,7 @@ cdef class EdgeConnection:
             WriteBuffer msg
 
         msg = WriteBuffer.new_message(b'T')
-        msg.write_int16(0)  # no headers
+        self.write_trace_headers(msg)
 
         msg.write_byte(self.render_cardinality(query_unit))
 
@@ -782,14 +1147,23 @@ cdef class EdgeConnection:
             WriteBuffer msg
 
         msg = WriteBuffer.new_message(b'C')
-        msg.write_int16(0)  # no headers
+        self.write_trace_headers(msg)
         msg.write_len_prefixed_bytes(query_unit.status)
         return msg.end_message()
 
+    cdef WriteBuffer make_portal_suspended_msg(self):
+        cdef:
+            WriteBuffer msg
+
+        msg = WriteBuffer.new_message(b's')
+        self.write_trace_headers(msg)
+        return msg.end_message()
+
     async def describe(self):
         cdef:
             char rtype
             WriteBuffer msg
+            PreparedStatement stmt
 
         self.reject_headers()
 
@@ -799,8 +1173,8 @@ cdef class EdgeConnection:
             stmt_name = self.buffer.read_len_prefixed_bytes()
 
             if stmt_name:
-                raise errors.UnsupportedFeatureError(
-                    'prepared statements are not yet supported')
+                stmt = await self._get_prepared_stmt(stmt_name, False)
+                self.write(self.make_describe_msg(stmt.query_unit))
             else:
                 if self._last_anon_compiled is None:
                     raise errors.TypeSpecNotFoundError(
@@ -814,7 +1188,8 @@ cdef class EdgeConnection:
                 f'unsupported "describe" message mode {chr(rtype)!r}')
 
     async def _execute_system_config(self, query_unit):
-        data = await self.backend.pgcon.simple_query(
+        pgconn = await self.get_pgcon()
+        data = await pgconn.simple_query(
             b';'.join(query_unit.sql), ignore_data=False)
         if data:
             config_ops = [config.Operation.from_json(r[0]) for r in data]
@@ -825,7 +1200,7 @@ cdef class EdgeConnection:
         # If this is a backend configuration setting we also
         # need to make sure it has been loaded.
         if query_unit.backend_config:
-            await self.backend.pgcon.simple_query(
+            await pgconn.simple_query(
                 b'SELECT pg_reload_conf()', ignore_data=True)
 
         if query_unit.config_requires_restart:
@@ -835,13 +1210,15 @@ cdef class EdgeConnection:
                 'server restart is required for the configuration '
                 'change to take effect')
 
-    async def _execute(self, query_unit, bind_args,
-                       bint parse, bint use_prep_stmt):
+    async def _execute(self, query_unit, normalized, bind_args,
+                       bint parse, bint use_prep_stmt, int32_t row_limit=0):
+        started_at = time.monotonic()
         if self.dbview.in_tx_error():
             if not (query_unit.tx_savepoint_rollback or query_unit.tx_rollback):
                 self.dbview.raise_in_tx_error()
 
-            await self.backend.pgcon.simple_query(
+            pgconn = await self.get_pgcon()
+            await pgconn.simple_query(
                 b';'.join(query_unit.sql), ignore_data=True)
 
             if query_unit.tx_savepoint_rollback:
@@ -849,11 +1226,30 @@ cdef class EdgeConnection:
             else:
                 assert query_unit.tx_rollback
                 self.dbview.abort_tx()
+                self.unpin_compiler()
 
             self.write(self.make_command_complete_msg(query_unit))
+            metrics.execute_duration.observe(time.monotonic() - started_at)
             return
 
-        bound_args_buf = self.recode_bind_args(bind_args)
+        bound_args_buf = self.recode_bind_args(bind_args, normalized)
+
+        if not row_limit and self.can_use_replica(query_unit):
+            replica_pool = await self.get_replica_pool()
+            if (replica_pool is not None and
+                    await self._execute_on_replica(
+                        replica_pool, query_unit, bound_args_buf,
+                        use_prep_stmt)):
+                metrics.execute_duration.observe(
+                    time.monotonic() - started_at)
+                return
+
+        pgconn = await self.get_pgcon()
+        if not parse and self._last_anon_pgcon is not pgconn:
+            # The statement was parsed on a different Postgres
+            # connection (or that connection was returned to the
+            # pool since); parse it again.
+            parse = True
 
         process_sync = False
         if self.buffer.take_message_type(b'S'):
@@ -861,13 +1257,20 @@ cdef class EdgeConnection:
             # send it right away.
             process_sync = True
 
+        if row_limit:
+            # The previous result fetched in batches is closed.
+            self._cursor = None
+
+        suspended = False
         try:
+            self.track_writes(query_unit)
             self.dbview.start(query_unit)
             try:
                 if query_unit.system_config:
                     await self._execute_system_config(query_unit)
                 else:
-                    await self.backend.pgcon.parse_execute(
+                    backend_start = time.monotonic()
+                    suspended = await pgconn.parse_execute(
                         parse,              # =parse
                         1,                  # =execute
                         query_unit,         # =query
@@ -875,7 +1278,15 @@ cdef class EdgeConnection:
                         bound_args_buf,     # =bind_data
                         process_sync,       # =send_sync
                         use_prep_stmt,      # =use_prep_stmt
+                        row_limit,          # =row_limit
                     )
+                    backend_end = time.monotonic()
+                    self.record_query_stats(
+                        query_unit, backend_end - backend_start,
+                        (<pgcon.PGProto>pgconn).last_row_count)
+                    if self._trace is not None:
+                        self._trace.add_span(
+                            'backend.execute', backend_start, backend_end)
                     if query_unit.config_ops is not None:
                         await self.dbview.apply_config_ops(
                             query_unit.config_ops)
@@ -891,23 +1302,32 @@ cdef class EdgeConnection:
                     # status of the Postgres connection.  Query it to
                     # be able to figure out the tx status of this EdgeDB
                     # connection with the next "if" block.
-                    await self.backend.pgcon.sync()
+                    await pgconn.sync()
 
-                if not self.backend.pgcon.in_tx() and self.dbview.in_tx():
+                if not pgconn.in_tx() and self.dbview.in_tx():
                     # COMMIT command can fail, in which case the
                     # transaction is finished.  This check workarounds
                     # that (until a better solution is found.)
                     self.dbview.abort_tx()
+                    self.unpin_compiler()
                     await self.recover_current_tx_info()
                 raise
             else:
                 self.dbview.on_success(query_unit)
+                self.maybe_unpin_compiler(query_unit)
+                self.on_ddl_success(query_unit)
 
-            self.write(self.make_command_complete_msg(query_unit))
+            if suspended:
+                self._cursor = (query_unit, self.dbview.txid)
+                self.write(self.make_portal_suspended_msg())
+            else:
+                self.write(self.make_command_complete_msg(query_unit))
 
             if process_sync:
+                await self.save_schema_snapshot(pgconn)
                 self.write(self.pgcon_last_sync_status())
                 self.flush()
+                self.maybe_release_pgcon()
         except Exception:
             if process_sync:
                 self.buffer.put_message()
@@ -915,32 +1335,476 @@ cdef class EdgeConnection:
         else:
             if process_sync:
                 self.buffer.finish_message()
+            metrics.execute_duration.observe(time.monotonic() - started_at)
 
-    async def execute(self):
+    async def fetch_more(self):
         cdef:
-            WriteBuffer bound_args_buf
-            bint process_sync
+            int32_t row_limit
 
         self.reject_headers()
-        stmt_name = self.buffer.read_len_prefixed_bytes()
-        bind_args = self.buffer.read_len_prefixed_bytes()
+        row_limit = self.buffer.read_int32()
         self.buffer.finish_message()
-        query_unit = None
 
         if self.debug:
-            self.debug_print('EXECUTE')
+            self.debug_print('FETCH MORE', row_limit)
+
+        if row_limit <= 0:
+            raise errors.BinaryProtocolError(
+                f'invalid row limit {row_limit}')
+
+        if self.dbview.in_tx_error():
+            self.dbview.raise_in_tx_error()
+
+        cursor = self._cursor
+        if (cursor is None or not self.dbview.in_tx() or
+                cursor[1] != self.dbview.txid):
+            # The result was fetched completely, or the transaction
+            # it was executed in is over (or was rolled back to a
+            # savepoint), which closes the Postgres portal.
+            self._cursor = None
+            raise errors.BinaryProtocolError(
+                'no suspended result to fetch rows from')
+
+        query_unit = cursor[0]
+        pgconn = await self.get_pgcon()
+
+        process_sync = False
+        if self.buffer.take_message_type(b'S'):
+            process_sync = True
+
+        try:
+            try:
+                suspended = await pgconn.fetch_cursor(
+                    query_unit, self, row_limit, process_sync)
+            except ConnectionAbortedError:
+                raise
+            except Exception:
+                self._cursor = None
+                self.dbview.on_error(query_unit)
+                if not process_sync:
+                    # See the comment in _execute().
+                    await pgconn.sync()
+                raise
+
+            if suspended:
+                self.write(self.make_portal_suspended_msg())
+            else:
+                self._cursor = None
+                self.write(self.make_command_complete_msg(query_unit))
+
+            if process_sync:
+                self.write(self.pgcon_last_sync_status())
+                self.flush()
+                self.maybe_release_pgcon()
+        except Exception:
+            if process_sync:
+                self.buffer.put_message()
+            raise
+        else:
+            if process_sync:
+                self.buffer.finish_message()
+
+    cdef int32_t read_execute_headers(self) except -1:
+        # Return the row limit of the Execute message, 0 if the
+        # whole result is requested.
+        cdef int32_t row_limit = 0
+
+        self._trace_requested = False
+        for key, value in self.parse_headers().items():
+            if key == HEADER_TRACE:
+                self._trace_requested = True
+            elif key == HEADER_ROW_LIMIT:
+                if len(value) != 4:
+                    raise errors.BinaryProtocolError(
+                        'invalid row limit header')
+                row_limit = hton.unpack_int32(
+                    cpython.PyBytes_AS_STRING(value))
+                if row_limit <= 0:
+                    raise errors.BinaryProtocolError(
+                        f'invalid row limit {row_limit}')
+            else:
+                raise errors.BinaryProtocolError(
+                    f'unexpected header {key:#x}')
+
+        return row_limit
+
+    cdef read_trace_headers(self):
+        self._trace_requested = False
+        for key in self.parse_headers():
+            if key == HEADER_TRACE:
+                self._trace_requested = True
+            else:
+                raise errors.BinaryProtocolError(
+                    f'unexpected header {key:#x}')
+
+    cdef start_trace(self, str name):
+        # Start tracing the current message if the client has
+        # requested it in the message headers or traces are exported.
+        if self._trace_requested or self._trace_exporter is not None:
+            self._trace = tracing.Trace(name, reply=self._trace_requested)
+        self._trace_requested = False
+
+    cdef write_trace_headers(self, WriteBuffer msg):
+        # Write the headers of the message completing the traced
+        # message, and finish the trace.
+        trace = self._trace
+        if trace is None:
+            msg.write_int16(0)  # no headers
+            return
+
+        self._trace = None
+        trace.finish()
+        if trace.reply:
+            msg.write_int16(1)
+            msg.write_int16(<int16_t><uint16_t>HEADER_TRACE)
+            msg.write_len_prefixed_bytes(trace.as_json().encode())
+        else:
+            msg.write_int16(0)  # no headers
+        if self._trace_exporter is not None:
+            self._trace_exporter.export(trace)
+
+    cdef abort_trace(self, exc):
+        trace = self._trace
+        if trace is None:
+            return
+
+        self._trace = None
+        trace.finish()
+        trace.attrs['error'] = type(exc).__name__
+        if self._trace_exporter is not None:
+            self._trace_exporter.export(trace)
+
+    async def _get_execute_target(self, bytes stmt_name):
+        cdef:
+            PreparedStatement stmt
 
         if stmt_name:
-            raise errors.UnsupportedFeatureError(
-                'prepared statements are not yet supported')
+            stmt = await self._get_prepared_stmt(stmt_name, True)
+            if stmt.query_unit.sql_hash:
+                # The statement is kept prepared in every Postgres
+                # connection it is executed on.
+                use_prep_stmt = True
+            else:
+                use_prep_stmt = False
+                self._last_anon_pgcon = None
+            return stmt.query_unit, stmt.normalized, True, use_prep_stmt
         else:
             if self._last_anon_compiled is None:
                 raise errors.BinaryProtocolError(
                     'no prepared anonymous statement found')
 
-            query_unit = self._last_anon_compiled
+            return (self._last_anon_compiled, self._last_anon_normalized,
+                    self._last_anon_prepared, self._last_anon_prepared)
+
+    cdef can_use_replica(self, query_unit):
+        # Connections to replicas don't keep the session state,
+        # so only the connections with the default one can use them.
+        # The Postgres connection is only held between the
+        # synchronization points if there can be uncommitted writes.
+        return (
+            query_unit.read_only and
+            query_unit.cacheable and
+            not self.dbview.in_tx() and
+            self._pgcon is None and
+            not self.dbview.get_session_config()
+        )
+
+    cdef track_writes(self, query_unit):
+        if not query_unit.read_only:
+            self._write_lsn_stale = True
+
+    async def get_replica_pool(self):
+        server = self.port.get_server()
+        if not server.has_replicas():
+            return None
+
+        if self._write_lsn_stale:
+            # The writes of this connection are committed by now,
+            # so the current WAL position of the primary is past
+            # their commit records.
+            try:
+                self._write_lsn = await server.get_primary_lsn()
+            except Exception:
+                logger.warning(
+                    'could not get the WAL position of the primary',
+                    exc_info=True)
+                return None
+            self._write_lsn_stale = False
+
+        return server.get_replica_pool(self._write_lsn)
+
+    async def _execute_on_replica(self, pool, query_unit, bound_args_buf,
+                                  bint use_prep_stmt):
+        cdef:
+            bint discard = True
+
+        dbname = self.dbview.dbname
+        try:
+            pgconn = await pool.acquire(dbname)
+        except Exception:
+            # Fall back to the primary; the replica will be taken
+            # out of rotation by the server when it notices.
+            logger.warning(
+                'could not connect to a replica', exc_info=True)
+            return False
+
+        process_sync = False
+        if self.buffer.take_message_type(b'S'):
+            process_sync = True
+
+        try:
+            try:
+                self.dbview.start(query_unit)
+                try:
+                    # The query always ends with a "Sync" on the
+                    # replica so that its connection can be released
+                    # right away.
+                    backend_start = time.monotonic()
+                    await pgconn.parse_execute(
+                        1,                  # =parse
+                        1,                  # =execute
+                        query_unit,         # =query
+                        self,               # =edgecon
+                        bound_args_buf,     # =bind_data
+                        1,                  # =send_sync
+                        use_prep_stmt,      # =use_prep_stmt
+                    )
+                    backend_end = time.monotonic()
+                    self.record_query_stats(
+                        query_unit, backend_end - backend_start,
+                        (<pgcon.PGProto>pgconn).last_row_count)
+                    if self._trace is not None:
+                        self._trace.add_span(
+                            'backend.execute', backend_start, backend_end)
+                        self._trace.attrs['replica'] = True
+                except ConnectionAbortedError:
+                    raise
+                except Exception:
+                    self.dbview.on_error(query_unit)
+                    discard = not pgconn.is_connected()
+                    raise
+                else:
+                    self.dbview.on_success(query_unit)
+                    discard = False
+            finally:
+                pool.release(dbname, pgconn, discard=discard)
+
+            self.write(self.make_command_complete_msg(query_unit))
+
+            if process_sync:
+                self.write(self.pgcon_last_sync_status())
+                self.flush()
+                self.maybe_release_pgcon()
+        except Exception:
+            if process_sync:
+                self.buffer.put_message()
+            raise
+        else:
+            if process_sync:
+                self.buffer.finish_message()
+
+        return True
+
+    cdef can_pipeline(self, query_unit):
+        # Queries that don't change the state of the connection
+        # can be sent to Postgres without waiting for the results
+        # of the previous ones.
+        return (
+            not self.dbview.in_tx_error() and
+            bool(query_unit.sql_hash) and
+            len(query_unit.sql) == 1 and
+            not query_unit.has_ddl and
+            not query_unit.has_set and
+            query_unit.tx_id is None and
+            not query_unit.system_config and
+            query_unit.config_ops is None and
+            query_unit.modaliases is None
+        )
+
+    cdef on_pipelined_query_complete(self, query_unit, int64_t rows,
+                                     double duration):
+        self.dbview.on_success(query_unit)
+        self.record_query_stats(query_unit, duration, rows)
+        self.write(self.make_command_complete_msg(query_unit))
+
+    cdef on_ddl_success(self, query_unit):
+        if query_unit.schema_snapshot is not None:
+            # Only the hash of the new schema is written by the unit;
+            # the snapshot is saved after the commit (the previous
+            # pending one is stale in any case.)
+            self._pending_schema_snapshot = (
+                query_unit.schema_hash, query_unit.schema_snapshot)
+
+    async def save_schema_snapshot(self, pgconn):
+        # Must be called after a "Sync", once the transaction that
+        # wrote the schema hash is over.  If it was rolled back, or
+        # another DDL has been committed since, nothing is updated.
+        pending = self._pending_schema_snapshot
+        if pending is None:
+            return
+        self._pending_schema_snapshot = None
+
+        try:
+            await pgconn.save_schema_snapshot(*pending)
+        except ConnectionAbortedError:
+            raise
+        except Exception:
+            # The compilers will introspect the schema instead.
+            logger.warning('could not save the schema snapshot',
+                           exc_info=True)
+
+    cdef record_query_stats(self, query_unit, double duration, int64_t rows):
+        if query_unit.sql_hash:
+            self._query_stats.record_execute(
+                self.dbview.dbname, query_unit.sql_hash, duration, rows)
+
+    async def _execute_pipeline(self, query_unit, normalized, bytes bind_args):
+        # The "Execute" message following the current one has been
+        # taken from the buffer already.
+        cdef:
+            list queries = [query_unit]
+            list bind_data = [self.recode_bind_args(bind_args, normalized)]
+
+        pending = None
+        try:
+            while True:
+                row_limit = self.read_execute_headers()
+                stmt_name = self.buffer.read_len_prefixed_bytes()
+                bind_args = self.buffer.read_len_prefixed_bytes()
+                self.buffer.finish_message()
+
+                query_unit, normalized, parse, use_prep_stmt = \
+                    await self._get_execute_target(stmt_name)
+                if (row_limit or self._trace_requested or
+                        not self.can_pipeline(query_unit)):
+                    pending = (query_unit, normalized, bind_args,
+                               parse, use_prep_stmt, row_limit)
+                    break
+
+                queries.append(query_unit)
+                bind_data.append(self.recode_bind_args(bind_args, normalized))
+
+                if (len(queries) >= MAX_PIPELINED_QUERIES or
+                        not self.buffer.take_message_type(b'E')):
+                    break
+        except ConnectionAbortedError:
+            raise
+        except Exception:
+            # The queries preceding the failed message are
+            # executed nonetheless.
+            await self._execute_queries(queries, bind_data, False)
+            raise
+
+        if self.debug:
+            self.debug_print('EXECUTE /PIPELINED', len(queries))
+
+        if pending is None:
+            await self._execute_queries(queries, bind_data, True)
+        else:
+            await self._execute_queries(queries, bind_data, False)
+            if pending[-1]:
+                self.check_row_limit_allowed(pending[0])
+            self.start_trace('execute')
+            await self._execute(*pending)
+
+    async def _execute_queries(self, list queries, list bind_data,
+                               bint sync_allowed):
+        pgconn = await self.get_pgcon()
 
-        await self._execute(query_unit, bind_args, False, False)
+        process_sync = False
+        if sync_allowed and self.buffer.take_message_type(b'S'):
+            # A "Sync" message follows the last "Execute" message;
+            # send it along with the queries.
+            process_sync = True
+
+        try:
+            for query_unit in queries:
+                self.track_writes(query_unit)
+                self.dbview.start(query_unit)
+            try:
+                await pgconn.execute_pipeline(
+                    queries, bind_data, self, process_sync)
+            except ConnectionAbortedError:
+                raise
+            except Exception:
+                self.dbview.tx_error()
+
+                if not process_sync and self.dbview.in_tx():
+                    # See the comment in _execute().
+                    await pgconn.sync()
+                raise
+
+            if process_sync:
+                self.write(self.pgcon_last_sync_status())
+                self.flush()
+                self.maybe_release_pgcon()
+        except Exception:
+            if process_sync:
+                self.buffer.put_message()
+            raise
+        else:
+            if process_sync:
+                self.buffer.finish_message()
+
+    async def execute(self):
+        cdef:
+            int32_t row_limit
+
+        row_limit = self.read_execute_headers()
+        stmt_name = self.buffer.read_len_prefixed_bytes()
+        bind_args = self.buffer.read_len_prefixed_bytes()
+        self.buffer.finish_message()
+
+        if self.debug:
+            self.debug_print('EXECUTE')
+
+        self.start_trace('execute')
+        query_unit, normalized, parse, use_prep_stmt = \
+            await self._get_execute_target(stmt_name)
+
+        if row_limit:
+            self.check_row_limit_allowed(query_unit)
+            await self._execute(
+                query_unit, normalized, bind_args, parse, use_prep_stmt,
+                row_limit)
+        elif ((self._trace is None or not self._trace.reply) and
+                self.can_pipeline(query_unit) and
+                self.buffer.take_message_type(b'E')):
+            # The client has sent more "Execute" messages without
+            # waiting for the results of this one.  Pipelined
+            # queries are not traced.
+            self._trace = None
+            await self._execute_pipeline(query_unit, normalized, bind_args)
+        else:
+            await self._execute(
+                query_unit, normalized, bind_args, parse, use_prep_stmt)
+
+    cdef check_row_limit_allowed(self, query_unit):
+        if not self.dbview.in_tx():
+            # Postgres closes the portal at the end of the implicit
+            # transaction of the Execute message.
+            raise errors.BinaryProtocolError(
+                'results can only be fetched in batches '
+                'in transaction blocks')
+        if not query_unit.sql_hash:
+            raise errors.BinaryProtocolError(
+                'the result of this command cannot be fetched in batches')
+
+    async def close_stmt(self):
+        self.reject_headers()
+
+        stmt_name = self.buffer.read_len_prefixed_bytes()
+        self.buffer.finish_message()
+
+        if self.debug:
+            self.debug_print('CLOSE', stmt_name)
+
+        if not stmt_name:
+            raise errors.BinaryProtocolError(
+                'cannot close the anonymous statement')
+
+        # Closing a statement that doesn't exist is not an error.
+        self._prepared_stmts.pop(stmt_name, None)
 
     async def opportunistic_execute(self):
         cdef:
@@ -950,7 +1814,7 @@ cdef class EdgeConnection:
             bytes out_tid
             bytes bound_args
 
-        self.reject_headers()
+        self.read_trace_headers()
         json_mode = self.parse_json_mode(self.buffer.read_byte())
         expect_one = (
             self.parse_cardinality(self.buffer.read_byte()) is CARD_ONE
@@ -964,13 +1828,27 @@ cdef class EdgeConnection:
         if not query:
             raise errors.BinaryProtocolError('empty query')
 
-        query_unit = self.dbview.lookup_compiled_query(
-            query, json_mode, expect_one)
+        self.start_trace('opportunistic_execute')
+        normalized = self.normalize_query(query)
+        query_unit = self.lookup_compiled_query(
+            query, normalized, json_mode, expect_one)
         if query_unit is None:
             if self.debug:
                 self.debug_print('OPPORTUNISTIC EXECUTE /REPARSE', query)
 
-            query_unit = await self._parse(query, json_mode, expect_one)
+            query_unit = await self._parse(
+                query, normalized, json_mode, expect_one)
+        else:
+            if query_unit.sql_hash:
+                self._query_stats.record_cache_hit(
+                    self.dbview.dbname, query_unit.sql_hash,
+                    query if query_unit.first_extra is None
+                    else normalized.text)
+            if self._trace is not None:
+                self._trace.attrs['cached'] = True
+
+        if query_unit.first_extra is None:
+            normalized = None
 
         if (query_unit.in_type_id != in_tid or
                 query_unit.out_type_id != out_tid):
@@ -985,19 +1863,23 @@ cdef class EdgeConnection:
             self.debug_print('OPPORTUNISTIC EXECUTE', query)
 
         await self._execute(
-            query_unit, bind_args, True, bool(query_unit.sql_hash))
+            query_unit, normalized, bind_args, True,
+            bool(query_unit.sql_hash))
 
     async def sync(self):
         self.buffer.consume_message()
 
-        await self.backend.pgcon.sync()
+        if self._pgcon is not None:
+            await self._pgcon.sync()
+            await self.save_schema_snapshot(self._pgcon)
         self.write(self.pgcon_last_sync_status())
 
-        if self.debug:
+        if self.debug and self._pgcon is not None:
             self.debug_print(
-                'SYNC', (<pgcon.PGProto>(self.backend.pgcon)).xact_status)
+                'SYNC', (<pgcon.PGProto>(self._pgcon)).xact_status)
 
         self.flush()
+        self.maybe_release_pgcon()
 
     async def main(self):
         cdef:
@@ -1050,6 +1932,12 @@ cdef class EdgeConnection:
                     elif mtype == b'O':
                         await self.opportunistic_execute()
 
+                    elif mtype == b'C':
+                        await self.close_stmt()
+
+                    elif mtype == b'M':
+                        await self.fetch_more()
+
                     elif mtype == b'Q':
                         flush_sync_on_error = True
                         await self.simple_query()
@@ -1067,29 +1955,25 @@ cdef class EdgeConnection:
                     raise
 
                 except Exception as ex:
-                    if self.backend is None:
+                    if self._con_status == EDGECON_BAD:
                         # The connection has been aborted; there's nothing
                         # we can do except shutting this down.
-                        if self._con_status == EDGECON_BAD:
-                            return
-                        else:
-                            raise
+                        return
 
                     self.dbview.tx_error()
                     self.buffer.finish_message()
 
+                    self.abort_trace(ex)
                     await self.write_error(ex)
-                    if self.backend is None:
+                    if self._con_status == EDGECON_BAD:
                         # The connection was aborted while we were
                         # interpreting the error (via compiler/errmech.py).
-                        if self._con_status == EDGECON_BAD:
-                            return
-                        else:
-                            raise
+                        return
 
                     if flush_sync_on_error:
                         self.write(self.pgcon_last_sync_status())
                         self.flush()
+                        self.maybe_release_pgcon()
                     else:
                         await self.recover_from_error()
 
@@ -1213,13 +2097,14 @@ cdef class EdgeConnection:
 
     async def _interpret_backend_error(self, exc):
         if self.dbview.in_tx():
-            return await self.backend.compiler.call(
+            return await self.call_compiler(
                 'interpret_backend_error_in_tx',
                 self.dbview.txid,
                 exc.fields)
         else:
-            return await self.backend.compiler.call(
+            return await self.port.get_compiler_pool().call(
                 'interpret_backend_error',
+                self.dbview.dbname,
                 self.dbview.dbver,
                 exc.fields)
 
@@ -1246,8 +2131,15 @@ cdef class EdgeConnection:
             pgcon.PGTransactionStatus xact_status
             WriteBuffer buf
 
-        xact_status = <pgcon.PGTransactionStatus>(
-            (<pgcon.PGProto>self.backend.pgcon).xact_status)
+        if self._pgcon is not None:
+            xact_status = <pgcon.PGTransactionStatus>(
+                (<pgcon.PGProto>self._pgcon).xact_status)
+        elif self.dbview.in_tx_error():
+            xact_status = pgcon.PQTRANS_INERROR
+        elif self.dbview.in_tx():
+            xact_status = pgcon.PQTRANS_INTRANS
+        else:
+            xact_status = pgcon.PQTRANS_IDLE
 
         buf = WriteBuffer.new_message(b'Z')
         buf.write_int16(0)  # no headers
@@ -1278,7 +2170,7 @@ cdef class EdgeConnection:
             raise errors.BinaryProtocolError(
                 f'unexpected message type {chr(mtype)!r}')
 
-    cdef WriteBuffer recode_bind_args(self, bytes bind_args):
+    cdef WriteBuffer recode_bind_args(self, bytes bind_args, normalized):
         cdef:
             FRBuffer in_buf
             WriteBuffer out_buf = WriteBuffer.new()
@@ -1297,11 +2189,23 @@ cdef class EdgeConnection:
         # number of elements in the tuple
         argsnum = hton.unpack_int32(frb_read(&in_buf, 4))
 
-        out_buf.write_int16(<int16_t>argsnum)
+        if normalized is None:
+            out_buf.write_int16(<int16_t>argsnum)
+        else:
+            if argsnum != normalized.first_extra:
+                raise errors.QueryError(
+                    f'expected {normalized.first_extra} arguments, '
+                    f'got {argsnum}')
+            out_buf.write_int16(
+                <int16_t>(argsnum + normalized.extra_count))
 
         in_len = frb_get_len(&in_buf)
         out_buf.write_cstr(frb_read_all(&in_buf), in_len)
 
+        if normalized is not None:
+            # The values of the literals extracted from the query.
+            out_buf.write_bytes(normalized.extra_blob)
+
         # All columns are in binary format
         out_buf.write_int32(0x00010001)
         return out_buf
@@ -1319,13 +2223,22 @@ cdef class EdgeConnection:
             self._msg_take_waiter.set_exception(ConnectionAbortedError())
             self._msg_take_waiter = None
 
+        if (self._write_waiter is not None and
+                not self._write_waiter.done()):
+            self._write_waiter.set_exception(ConnectionAbortedError())
+            self._write_waiter = None
+
         self.abort()
 
     def pause_writing(self):
-        pass
+        if self._write_waiter is None:
+            self._write_waiter = self.loop.create_future()
 
     def resume_writing(self):
-        pass
+        waiter = self._write_waiter
+        self._write_waiter = None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(True)
 
     def data_received(self, data):
         self.buffer.feed_data(data)
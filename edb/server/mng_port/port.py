@@ -17,39 +17,25 @@
 #
 
 
+import asyncio
+import collections
 import logging
 import os
 import os.path
 import stat
-import weakref
 
+from edb.common import debug
 from edb.common import taskgroup
 from edb.server import baseport
 from edb.server import compiler
+from edb.server import procpool
 
 from . import edgecon
 
 
 logger = logging.getLogger('edb.server')
 
-
-class Backend:
-
-    def __init__(self, pgcon, compiler):
-        self._pgcon = pgcon
-        self._compiler = compiler
-
-    @property
-    def pgcon(self):
-        return self._pgcon
-
-    @property
-    def compiler(self):
-        return self._compiler
-
-    async def close(self):
-        self._pgcon.terminate()
-        await self._compiler.close()
+WARM_UP_POLL_INTERVAL = 0.05
 
 
 class ManagementPort(baseport.Port):
@@ -63,7 +49,18 @@ class ManagementPort(baseport.Port):
         self._edgecon_id = 0
 
         self._servers = []
-        self._backends = weakref.WeakSet()
+
+        self._warm_up_tasks = set()
+        self._warm_up_stats = {
+            'pending': 0,
+            'compiled': 0,
+            'failed': 0,
+            'superseded': 0,
+        }
+        self._parse_stats = {
+            'backend': 0,
+            'skipped': 0,
+        }
 
     def new_view(self, *, dbname, user, query_cache):
         return self._dbindex.new_view(
@@ -75,19 +72,103 @@ class ManagementPort(baseport.Port):
     def get_compiler_worker_name(self):
         return 'compiler-mng'
 
-    async def new_backend(self, *, dbname: str, dbver: int):
-        server = self.get_server()
+    async def create_compiler_manager(self):
+        # All connections to this port share one pool of compilers.
+        return await procpool.create_pool(
+            runstate_dir=self._internal_runstate_dir,
+            worker_args=self.get_compiler_worker_args(),
+            worker_cls=self.get_compiler_worker_cls(),
+            name=self.get_compiler_worker_name(),
+            pool_size=self.get_server().get_compiler_pool_size(),
+            use_forkserver=not debug.flags.server_no_forkserver,
+        )
+
+    def get_compiler_pool(self):
+        return self._compiler_manager
+
+    def warm_up_queries(self, dbname, dbver, keys):
+        if self._compiler_manager is None:
+            return
+
+        self._warm_up_stats['pending'] += len(keys)
+        task = self._loop.create_task(
+            self._warm_up_queries(dbname, dbver, keys))
+        self._warm_up_tasks.add(task)
+        task.add_done_callback(self._warm_up_tasks.discard)
+
+    async def _warm_up_queries(self, dbname, dbver, keys):
+        pool = self._compiler_manager
+        stats = self._warm_up_stats
+        keys = collections.deque(keys)
+        try:
+            while keys:
+                # Only use the workers that have nothing else to do.
+                worker = pool.try_acquire()
+                if worker is None:
+                    await asyncio.sleep(WARM_UP_POLL_INTERVAL)
+                    continue
+
+                try:
+                    if self._dbindex.get_dbver(dbname) != dbver:
+                        # The schema has been changed again; the next
+                        # warm-up will take care of the queries.
+                        break
+
+                    key = keys.popleft()
+                    stats['pending'] -= 1
+                    (eql, json_mode, expect_one, first_extra,
+                     modaliases, config) = key
+                    try:
+                        units = await worker.call(
+                            'compile_eql',
+                            dbname,
+                            dbver,
+                            eql,
+                            modaliases,
+                            config,
+                            json_mode,
+                            expect_one,
+                            'single',
+                            compiler.Capability.ALL,
+                            False,
+                            first_extra)
+                    except Exception:
+                        stats['failed'] += 1
+                        logger.debug(
+                            'could not warm up query %r of database %r',
+                            eql, dbname, exc_info=True)
+                    else:
+                        stats['compiled'] += 1
+                        self._dbindex.cache_compiled_query(
+                            dbname, key, units[0])
+                finally:
+                    pool.release(worker)
+        finally:
+            stats['pending'] -= len(keys)
+            stats['superseded'] += len(keys)
+
+        logger.debug('warmed up queries of database %r: %r', dbname, stats)
 
-        async with taskgroup.TaskGroup() as g:
-            new_pgcon_task = g.create_task(server.new_pgcon(dbname))
-            compiler_task = g.create_task(self.new_compiler(dbname, dbver))
+    def get_warm_up_stats(self):
+        """Return the counters of recompiled queries after DDL."""
+        return dict(self._warm_up_stats)
+
+    def count_backend_parse(self, *, skipped):
+        if skipped:
+            self._parse_stats['skipped'] += 1
+        else:
+            self._parse_stats['backend'] += 1
 
-        backend = Backend(
-            new_pgcon_task.result(),
-            compiler_task.result())
+    def get_parse_stats(self):
+        """Return the number of parsed statements sent to Postgres.
 
-        self._backends.add(backend)
-        return backend
+        'skipped' is the number of Postgres round-trips saved because
+        the statement was already prepared.
+        """
+        return dict(self._parse_stats)
+
+    def get_query_hits(self, dbname):
+        return self._dbindex.get_query_hits(dbname)
 
     def new_edgecon_id(self):
         self._edgecon_id += 1
@@ -98,9 +179,23 @@ class ManagementPort(baseport.Port):
 
         nethost = await self._fix_localhost(self._nethost, self._netport)
 
+        # With several frontends the kernel distributes the incoming
+        # TCP connections between the processes.
         tcp_srv = await self._loop.create_server(
             lambda: edgecon.EdgeConnection(self),
-            host=nethost, port=self._netport)
+            host=nethost, port=self._netport,
+            reuse_port=self.get_server().in_multi_frontend_mode())
+
+        self._servers.append(tcp_srv)
+        if len(nethost) > 1:
+            host_str = f"{{{', '.join(nethost)}}}"
+        else:
+            host_str = next(iter(nethost))
+        logger.info('Serving on %s:%s', host_str, self._netport)
+
+        if not self.get_server().is_primary_frontend():
+            # UNIX sockets can't be shared between processes.
+            return
 
         try:
             unix_sock_path = os.path.join(
@@ -111,6 +206,7 @@ class ManagementPort(baseport.Port):
         except Exception:
             tcp_srv.close()
             await tcp_srv.wait_closed()
+            self._servers.clear()
             raise
 
         try:
@@ -125,20 +221,18 @@ class ManagementPort(baseport.Port):
             await tcp_srv.wait_closed()
             unix_srv.close()
             await unix_srv.wait_closed()
+            self._servers.clear()
             raise
 
-        self._servers.append(tcp_srv)
-        if len(nethost) > 1:
-            host_str = f"{{{', '.join(nethost)}}}"
-        else:
-            host_str = next(iter(nethost))
-        logger.info('Serving on %s:%s', host_str, self._netport)
         self._servers.append(unix_srv)
         logger.info('Serving on %s', unix_sock_path)
         self._servers.append(admin_unix_srv)
         logger.info('Serving admin on %s', admin_unix_sock_path)
 
     async def stop(self):
+        for task in self._warm_up_tasks:
+            task.cancel()
+
         try:
             async with taskgroup.TaskGroup() as g:
                 for srv in self._servers:
@@ -146,10 +240,4 @@ class ManagementPort(baseport.Port):
                     g.create_task(srv.wait_closed())
                 self._servers.clear()
         finally:
-            try:
-                async with taskgroup.TaskGroup() as g:
-                    for backend in self._backends:
-                        g.create_task(backend.close())
-                    self._backends.clear()
-            finally:
-                await super().stop()
+            await super().stop()
@@ -62,6 +62,9 @@ cdef class PGProto:
         readonly int32_t backend_pid
         readonly int32_t backend_secret
 
+        # Rows returned or affected by the last parse_execute() call.
+        readonly int64_t last_row_count
+
         stmt_cache.StatementsCache prep_stmts
         list last_parse_prep_stmts
 
@@ -69,14 +72,21 @@ cdef class PGProto:
 
         object pgaddr
 
+        # (modaliases, session config) the "_edgecon_state" table
+        # and the backend session settings currently reflect.
+        object session_state
+
     cdef write(self, buf)
 
     cdef parse_error_message(self)
     cdef parse_sync_message(self)
+    cdef int64_t parse_row_count(self) except -1
 
     cdef parse_notification(self)
     cdef fallthrough(self)
 
     cdef before_prepare(self, stmt_name, dbver, WriteBuffer outbuf)
+    cdef is_prepared(self, bytes stmt_name, dbver)
 
     cdef make_clean_stmt_message(self, bytes stmt_name)
+    cdef make_close_portal_message(self)
@@ -20,6 +20,9 @@
 import asyncio
 import codecs
 import json
+import time
+
+import immutables
 
 cimport cython
 cimport cpython
@@ -46,7 +49,9 @@ from edb.server.pgproto.pgproto cimport (
 )
 
 from edb.server import compiler
+from edb.server import config
 from edb.server import defines
+from edb.server import metrics
 from edb.server.cache cimport stmt_cache
 from edb.server.mng_port cimport edgecon
 
@@ -58,6 +63,15 @@ from . import errors as pgerror
 DEF DATA_BUFFER_SIZE = 100_000
 DEF PREP_STMTS_CACHE = 100
 
+# The name of the portal of a result fetched in batches.
+cdef bytes CURSOR_PORTAL = b'__edgedb_cursor__'
+
+# Fills in the schema snapshot whose hash was recorded by a DDL
+# transaction, unless a later DDL has replaced it already.
+cdef bytes SAVE_SCHEMA_SNAPSHOT_SQL = (
+    b'UPDATE edgedb._schema_snapshot SET snapshot = $1 WHERE hash = $2'
+)
+
 
 cdef object CARD_NA = compiler.ResultCardinality.NOT_APPLICABLE
 
@@ -84,14 +98,28 @@ cdef bytes INIT_CON_SCRIPT = (b'''
 )
 
 
-async def connect(addr, dbname):
+cdef object DEFAULT_SESSION_STATE = (
+    immutables.Map({None: defines.DEFAULT_MODULE_ALIAS}),
+    immutables.Map(),
+)
+
+
+async def connect(addr, dbname, *, replica=False):
     loop = asyncio.get_running_loop()
 
-    _, protocol = await loop.create_unix_connection(
-        lambda: PGProto(dbname, loop, addr), addr)
+    if isinstance(addr, tuple):
+        # (host, port)
+        _, protocol = await loop.create_connection(
+            lambda: PGProto(dbname, loop, addr), *addr)
+    else:
+        _, protocol = await loop.create_unix_connection(
+            lambda: PGProto(dbname, loop, addr), addr)
 
     await protocol.connect()
-    await protocol.simple_query(INIT_CON_SCRIPT, ignore_data=True)
+    if not replica:
+        # Hot standby servers can't create temporary tables, so
+        # connections to replicas can't keep the session state.
+        await protocol.simple_query(INIT_CON_SCRIPT, ignore_data=True)
 
     return protocol
 
@@ -134,10 +162,13 @@ cdef class PGProto:
 
         self.backend_pid = -1
         self.backend_secret = -1
+        self.last_row_count = 0
 
         self.last_parse_prep_stmts = []
         self.debug = debug.flags.server_proto
 
+        self.session_state = DEFAULT_SESSION_STATE
+
         self.pgaddr = addr
 
     def debug_print(self, *args):
@@ -149,6 +180,29 @@ cdef class PGProto:
     def get_pgaddr(self):
         return self.pgaddr
 
+    def get_session_state(self):
+        return self.session_state
+
+    def set_session_state(self, modaliases, session_config):
+        self.session_state = (modaliases, session_config)
+
+    async def restore_session_state(self, modaliases, session_config):
+        # Make the session state of this backend connection match
+        # the state of the EdgeDB connection that is about to use it.
+        cdef object state = (modaliases, session_config)
+
+        if self.session_state == state:
+            return
+
+        script = _build_session_state_script(
+            self.session_state, state)
+        # Reset the state before running the script; if it fails
+        # the connection state is unknown, and it has to be restored
+        # from scratch next time.
+        self.session_state = None
+        await self.simple_query(script, ignore_data=True)
+        self.session_state = state
+
     def in_tx(self):
         return (
             self.xact_status == PQTRANS_INTRANS or
@@ -211,6 +265,7 @@ cdef class PGProto:
 
     cdef before_prepare(self, stmt_name, dbver, WriteBuffer outbuf):
         parse = 1
+        store_stmt = 0
 
         while self.prep_stmts.needs_cleanup():
             stmt_name_to_clean = self.prep_stmts.cleanup_one()
@@ -230,6 +285,11 @@ cdef class PGProto:
 
         return parse, store_stmt
 
+    cdef is_prepared(self, bytes stmt_name, dbver):
+        # Whether the named statement is prepared in this connection
+        # for the given version of the database.
+        return self.prep_stmts.get(stmt_name, None) == dbver
+
     async def parse_execute_json(self, sql, sql_hash, dbver,
                                  use_prep_stmt, args):
         cdef:
@@ -355,6 +415,85 @@ cdef class PGProto:
 
         return data
 
+    async def save_schema_snapshot(self, bytes schema_hash, bytes snapshot):
+        # The snapshot is passed as a parameter, so that Postgres
+        # doesn't have to parse the whole pickled schema.
+        cdef:
+            WriteBuffer packet
+            WriteBuffer buf
+
+        self.before_command()
+
+        packet = WriteBuffer.new()
+
+        buf = WriteBuffer.new_message(b'P')
+        buf.write_bytestring(b'')  # statement name
+        buf.write_bytestring(SAVE_SCHEMA_SNAPSHOT_SQL)
+        buf.write_int16(0)
+        packet.write_buffer(buf.end_message())
+
+        buf = WriteBuffer.new_message(b'B')
+        buf.write_bytestring(b'')  # portal name
+        buf.write_bytestring(b'')  # statement name
+        buf.write_int32(0x00010001)  # binary for all parameters
+        buf.write_int16(2)  # number of parameters
+        buf.write_int32(<int32_t>len(snapshot))
+        buf.write_bytes(snapshot)
+        buf.write_int32(<int32_t>len(schema_hash))
+        buf.write_bytes(schema_hash)
+        buf.write_int16(0)  # no result columns
+        packet.write_buffer(buf.end_message())
+
+        buf = WriteBuffer.new_message(b'E')
+        buf.write_bytestring(b'')  # portal name
+        buf.write_int32(0)  # limit: 0 - return all rows
+        packet.write_buffer(buf.end_message())
+
+        packet.write_bytes(SYNC_MESSAGE)
+        self.waiting_for_sync = True
+        self.write(packet)
+
+        error = None
+        while True:
+            if not self.buffer.take_message():
+                await self.wait_for_message()
+            mtype = self.buffer.get_message_type()
+
+            try:
+                if mtype == b'E':
+                    # ErrorResponse
+                    fields = self.parse_error_message()
+                    error = pgerror.BackendError(fields=fields)
+
+                elif mtype in {b'1', b'2', b'n', b'C'}:
+                    # ParseComplete, BindComplete, NoData or
+                    # CommandComplete
+                    self.buffer.discard_message()
+
+                elif mtype == b'Z':
+                    # ReadyForQuery
+                    self.parse_sync_message()
+                    break
+
+                else:
+                    self.fallthrough()
+
+            finally:
+                self.buffer.finish_message()
+
+        if error is not None:
+            raise error
+
+    async def wait_for_client(self, edgecon.EdgeConnection edgecon):
+        # Stop reading the query results from Postgres until the
+        # client catches up, so that they don't pile up in memory.
+        self.transport.pause_reading()
+        try:
+            await edgecon.wait_for_writable()
+        finally:
+            if self.transport is not None:
+                self.transport.resume_reading()
+
     async def parse_execute(self,
                             bint parse,
                             bint execute,
@@ -362,12 +501,16 @@ cdef class PGProto:
                             edgecon.EdgeConnection edgecon,
                             WriteBuffer bind_data,
                             bint send_sync,
-                            bint use_prep_stmt):
+                            bint use_prep_stmt,
+                            int32_t row_limit=0):
+        # If row_limit is set, return True if the result has more
+        # rows, which can be fetched with fetch_cursor().
 
         cdef:
             WriteBuffer packet
             WriteBuffer buf
             bytes stmt_name
+            bytes portal_name = b''
             bint store_stmt = 0
 
             bint has_result = query.cardinality is not CARD_NA
@@ -425,6 +568,15 @@ cdef class PGProto:
         if execute:
             assert bind_data is not None
 
+            if row_limit:
+                if msgs_num > 1:
+                    raise errors.InternalServerError(
+                        'cannot fetch the result of more than one SQL '
+                        'query in batches')
+                portal_name = CURSOR_PORTAL
+                # Close the portal of the previous batched result.
+                packet.write_buffer(self.make_close_portal_message())
+
             if stmt_name == b'' and msgs_num > 1:
                 for s in self.last_parse_prep_stmts:
                     buf = WriteBuffer.new_message(b'B')
@@ -440,14 +592,14 @@ cdef class PGProto:
 
             else:
                 buf = WriteBuffer.new_message(b'B')
-                buf.write_bytestring(b'')  # portal name
+                buf.write_bytestring(portal_name)  # portal name
                 buf.write_bytestring(stmt_name)  # statement name
                 buf.write_buffer(bind_data)
                 packet.write_buffer(buf.end_message())
 
                 buf = WriteBuffer.new_message(b'E')
-                buf.write_bytestring(b'')  # portal name
-                buf.write_int32(0)  # limit: 0 - return all rows
+                buf.write_bytestring(portal_name)  # portal name
+                buf.write_int32(row_limit)  # limit: 0 - return all rows
                 packet.write_buffer(buf.end_message())
 
         if send_sync:
@@ -455,6 +607,8 @@ cdef class PGProto:
             self.waiting_for_sync = True
         else:
             packet.write_bytes(FLUSH_MESSAGE)
+        self.last_row_count = 0
+        started_at = time.monotonic()
         self.write(packet)
 
         try:
@@ -480,10 +634,12 @@ cdef class PGProto:
                         if buf.len() >= DATA_BUFFER_SIZE:
                             edgecon.write(buf)
                             buf = None
+                            if edgecon.is_writing_paused():
+                                await self.wait_for_client(edgecon)
 
                     elif mtype == b'C' and execute:  ## result
                         # CommandComplete
-                        self.buffer.discard_message()
+                        self.last_row_count += self.parse_row_count()
                         if buf is not None:
                             edgecon.write(buf)
                             buf = None
@@ -512,7 +668,11 @@ cdef class PGProto:
                     elif mtype == b's' and execute:  ## result
                         # PortalSuspended
                         self.buffer.discard_message()
-                        return
+                        self.last_row_count += row_limit
+                        if buf is not None:
+                            edgecon.write(buf)
+                            buf = None
+                        return True
 
                     elif mtype == b'2' and execute:
                         # BindComplete
@@ -535,6 +695,263 @@ cdef class PGProto:
         finally:
             if send_sync:
                 await self.wait_for_sync()
+            if execute:
+                metrics.backend_query_duration.observe(
+                    time.monotonic() - started_at)
+
+    cdef int64_t parse_row_count(self) except -1:
+        # The command tag ends with the number of rows for the commands
+        # that have one, e.g. "SELECT 10" or "INSERT 0 1".
+        tag = self.buffer.read_null_str()
+        _, _, count = tag.rpartition(b' ')
+        if count.isdigit():
+            return int(count)
+        return 0
+
+    async def fetch_cursor(self,
+                           object query,
+                           edgecon.EdgeConnection edgecon,
+                           int32_t row_limit,
+                           bint send_sync):
+        # Fetch the next rows of a result that was suspended by
+        # parse_execute(); return True if there are more rows.
+
+        cdef:
+            WriteBuffer packet
+            WriteBuffer buf
+
+        self.before_command()
+
+        packet = WriteBuffer.new()
+        buf = WriteBuffer.new_message(b'E')
+        buf.write_bytestring(CURSOR_PORTAL)  # portal name
+        buf.write_int32(row_limit)
+        packet.write_buffer(buf.end_message())
+
+        if send_sync:
+            packet.write_bytes(SYNC_MESSAGE)
+            self.waiting_for_sync = True
+        else:
+            packet.write_bytes(FLUSH_MESSAGE)
+        self.write(packet)
+
+        try:
+            buf = None
+            while True:
+                if not self.buffer.take_message():
+                    await self.wait_for_message()
+                mtype = self.buffer.get_message_type()
+
+                try:
+                    if mtype == b'D':
+                        # DataRow
+                        if query.cardinality is CARD_NA:
+                            raise errors.InternalServerError(
+                                f'query that was inferred to have '
+                                f'no data returned received a DATA package; '
+                                f'query: {query.sql}')
+
+                        if buf is None:
+                            buf = WriteBuffer.new()
+
+                        self.buffer.redirect_messages(buf, b'D')
+                        if buf.len() >= DATA_BUFFER_SIZE:
+                            edgecon.write(buf)
+                            buf = None
+                            if edgecon.is_writing_paused():
+                                await self.wait_for_client(edgecon)
+
+                    elif mtype == b'C' or mtype == b's':
+                        # CommandComplete or PortalSuspended
+                        self.buffer.discard_message()
+                        if buf is not None:
+                            edgecon.write(buf)
+                            buf = None
+                        return mtype == b's'
+
+                    elif mtype == b'E':
+                        # ErrorResponse
+                        er = self.parse_error_message()
+                        raise pgerror.BackendError(fields=er)
+
+                    else:
+                        self.fallthrough()
+
+                finally:
+                    self.buffer.finish_message()
+        finally:
+            if send_sync:
+                await self.wait_for_sync()
+
+    async def execute_pipeline(self,
+                               list queries,
+                               list bind_data,
+                               edgecon.EdgeConnection edgecon,
+                               bint send_sync):
+        # Execute a series of queries in one round-trip; every query
+        # must have a single SQL statement and is executed as a named
+        # prepared statement.  As with separate Execute messages, the
+        # queries following a failed one are not executed.
+
+        cdef:
+            WriteBuffer packet
+            WriteBuffer buf
+            bytes stmt_name
+            set parsed = set()
+            list to_store = []
+            ssize_t msgs_num = len(queries)
+            ssize_t msgs_executed = 0
+            ssize_t i
+
+        self.before_command()
+
+        packet = WriteBuffer.new()
+
+        for i in range(msgs_num):
+            query = queries[i]
+            if len(query.sql) != 1 or not query.sql_hash:
+                raise errors.InternalServerError(
+                    'cannot pipeline queries that are not prepared '
+                    'as a single SQL statement')
+
+            stmt_name = query.sql_hash
+            if stmt_name not in parsed:
+                parsed.add(stmt_name)
+                parse, store_stmt = self.before_prepare(
+                    stmt_name, query.dbver, packet)
+                if parse:
+                    buf = WriteBuffer.new_message(b'P')
+                    buf.write_bytestring(stmt_name)
+                    buf.write_bytestring(query.sql[0])
+                    buf.write_int16(0)
+                    packet.write_buffer(buf.end_message())
+                    to_store.append(
+                        (stmt_name, query.dbver) if store_stmt else None)
+
+            buf = WriteBuffer.new_message(b'B')
+            buf.write_bytestring(b'')  # portal name
+            buf.write_bytestring(stmt_name)  # statement name
+            buf.write_buffer(<WriteBuffer>bind_data[i])
+            packet.write_buffer(buf.end_message())
+
+            buf = WriteBuffer.new_message(b'E')
+            buf.write_bytestring(b'')  # portal name
+            buf.write_int32(0)  # limit: 0 - return all rows
+            packet.write_buffer(buf.end_message())
+
+        if send_sync:
+            packet.write_bytes(SYNC_MESSAGE)
+            self.waiting_for_sync = True
+        else:
+            packet.write_bytes(FLUSH_MESSAGE)
+        completed_at = time.monotonic()
+        self.write(packet)
+
+        to_store.reverse()
+
+        try:
+            buf = None
+            while True:
+                if not self.buffer.take_message():
+                    await self.wait_for_message()
+                mtype = self.buffer.get_message_type()
+
+                try:
+                    if mtype == b'D':
+                        # DataRow
+                        query = queries[msgs_executed]
+                        if query.cardinality is CARD_NA:
+                            raise errors.InternalServerError(
+                                f'query that was inferred to have '
+                                f'no data returned received a DATA package; '
+                                f'query: {query.sql}')
+
+                        if buf is None:
+                            buf = WriteBuffer.new()
+
+                        self.buffer.redirect_messages(buf, b'D')
+                        if buf.len() >= DATA_BUFFER_SIZE:
+                            edgecon.write(buf)
+                            buf = None
+                            if edgecon.is_writing_paused():
+                                await self.wait_for_client(edgecon)
+
+                    elif mtype == b'C' or mtype == b'I':
+                        # CommandComplete or EmptyQueryResponse
+                        if mtype == b'C':
+                            rows = self.parse_row_count()
+                        else:
+                            rows = 0
+                            self.buffer.discard_message()
+                        if buf is not None:
+                            edgecon.write(buf)
+                            buf = None
+                        # The queries are executed one after another,
+                        # each one is timed from the completion of
+                        # the previous one.
+                        now = time.monotonic()
+                        edgecon.on_pipelined_query_complete(
+                            queries[msgs_executed], rows, now - completed_at)
+                        completed_at = now
+                        msgs_executed += 1
+                        if msgs_executed == msgs_num:
+                            return
+
+                    elif mtype == b'1':
+                        # ParseComplete
+                        self.buffer.discard_message()
+                        stored = to_store.pop()
+                        if stored is not None:
+                            self.prep_stmts[stored[0]] = stored[1]
+
+                    elif mtype == b'E':
+                        # ErrorResponse
+                        er = self.parse_error_message()
+                        raise pgerror.BackendError(fields=er)
+
+                    elif mtype == b'n' or mtype == b'2' or mtype == b'3':
+                        # NoData, BindComplete or CloseComplete
+                        self.buffer.discard_message()
+
+                    else:
+                        self.fallthrough()
+
+                finally:
+                    self.buffer.finish_message()
+        finally:
+            if send_sync:
+                await self.wait_for_sync()
+
+    async def listen_for_notifications(self, callback):
+        # Pass the channel and the payload of every notification
+        # received by this connection to the callback; the connection
+        # can't be used for anything else afterwards.  Runs until
+        # the connection is lost (ConnectionAbortedError).
+        self.before_command()
+
+        while True:
+            if not self.buffer.take_message():
+                await self.wait_for_message()
+            mtype = self.buffer.get_message_type()
+
+            try:
+                if mtype == b'A':
+                    # NotificationResponse
+                    self.buffer.read_int32()  # sender PID
+                    channel = self.buffer.read_null_str().decode()
+                    payload = self.buffer.read_null_str().decode()
+                    callback(channel, payload)
+
+                elif mtype == b'E':
+                    # ErrorResponse
+                    er = self.parse_error_message()
+                    raise pgerror.BackendError(fields=er)
+
+                else:
+                    self.fallthrough()
+
+            finally:
+                self.buffer.finish_message()
 
     async def simple_query(self, bytes sql, bint ignore_data):
         cdef:
@@ -771,6 +1188,13 @@ cdef class PGProto:
 
         self.buffer.finish_message()
 
+    cdef make_close_portal_message(self):
+        cdef WriteBuffer buf
+        buf = WriteBuffer.new_message(b'C')
+        buf.write_byte(b'P')
+        buf.write_bytestring(CURSOR_PORTAL)
+        return buf.end_message()
+
     cdef make_clean_stmt_message(self, bytes stmt_name):
         cdef WriteBuffer buf
         buf = WriteBuffer.new_message(b'C')
@@ -819,6 +1243,48 @@ cdef class PGProto:
         pass
 
 
+cdef _has_backend_settings(session_config):
+    settings = config.get_settings()
+    for name in session_config:
+        if settings[name].backend_setting:
+            return True
+    return False
+
+
+cdef bytes _build_session_state_script(old_state, new_state):
+    cdef list buf
+
+    modaliases, session_config = new_state
+    settings = config.get_settings()
+    ql = pg_common.quote_literal
+
+    buf = ['DELETE FROM _edgecon_state;']
+
+    for alias, module in modaliases.items():
+        buf.append(
+            f'INSERT INTO _edgecon_state(name, value, type) '
+            f"VALUES ({ql(alias or '')}, {ql(module)}, 'A');")
+
+    if old_state is None or _has_backend_settings(old_state[1]):
+        buf.append('RESET ALL;')
+
+    for name, value in session_config.items():
+        setting = settings[name]
+        if setting.backend_setting:
+            # Postgres is fine with all setting types to be passed
+            # as strings.
+            buf.append(
+                f'SET {pg_common.quote_ident(setting.backend_setting)} '
+                f'= {ql(str(value))};')
+        else:
+            jval = json.dumps(config.value_to_json_value(setting, value))
+            buf.append(
+                f'INSERT INTO _edgecon_state(name, value, type) '
+                f"VALUES ({ql(name)}, {ql(jval)}, 'C');")
+
+    return '\n'.join(buf).encode('utf-8')
+
+
 cdef bytes SYNC_MESSAGE = bytes(WriteBuffer.new_message(b'S').end_message())
 cdef bytes FLUSH_MESSAGE = bytes(WriteBuffer.new_message(b'H').end_message())
 
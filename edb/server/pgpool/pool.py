@@ -0,0 +1,222 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import collections
+import logging
+
+
+logger = logging.getLogger('edb.server')
+
+
+class Pool:
+    """A server-wide pool of Postgres connections.
+
+    Connections are kept per database and are lent out to EdgeDB
+    client connections for the duration of a single implicit or
+    explicit transaction.  The total number of open connections
+    never exceeds *max_capacity*: when the limit is reached an idle
+    connection to another database is closed to make room, and if
+    there are none, callers wait for a connection to be released.
+
+    The limit can be changed with set_max_capacity(), e.g. when the
+    server opens connections outside of the pool.
+    """
+
+    def __init__(self, *, connect, max_capacity: int, loop):
+        if max_capacity < 1:
+            raise ValueError('max_capacity must be greater than zero')
+
+        self._connect = connect
+        self._max_capacity = max_capacity
+        self._loop = loop
+
+        # dbname -> deque of idle connections; the most recently
+        # released connection is reused first.
+        self._idle = {}
+        self._nidle = 0
+        self._cur_capacity = 0
+        self._waiters = collections.deque()
+
+        self._closed = False
+
+        self._stats_connected = 0
+        self._stats_disconnected = 0
+        self._stats_acquired = 0
+        self._stats_waited = 0
+
+    @property
+    def max_capacity(self):
+        return self._max_capacity
+
+    @property
+    def current_capacity(self):
+        return self._cur_capacity
+
+    @property
+    def idle_count(self):
+        return self._nidle
+
+    def set_max_capacity(self, max_capacity: int):
+        if max_capacity < 1:
+            raise ValueError('max_capacity must be greater than zero')
+
+        self._max_capacity = max_capacity
+
+        # Connections over the new limit are closed: the idle ones
+        # right away, the lent ones when they are released.
+        while self._cur_capacity > self._max_capacity:
+            if not self._steal_idle():
+                break
+
+        for _ in range(self._max_capacity - self._cur_capacity):
+            if not self._wakeup_next():
+                break
+
+    def get_stats(self):
+        return {
+            'max_capacity': self._max_capacity,
+            'current_capacity': self._cur_capacity,
+            'idle': self._nidle,
+            'waiters': len(self._waiters),
+            'connected': self._stats_connected,
+            'disconnected': self._stats_disconnected,
+            'acquired': self._stats_acquired,
+            'waited': self._stats_waited,
+        }
+
+    async def acquire(self, dbname):
+        if self._closed:
+            raise RuntimeError('cannot acquire a connection: pool is closed')
+
+        while True:
+            con = self._pop_idle(dbname)
+            if con is not None:
+                self._stats_acquired += 1
+                return con
+
+            if self._cur_capacity < self._max_capacity:
+                self._cur_capacity += 1
+                try:
+                    con = await self._connect(dbname)
+                except BaseException:
+                    self._cur_capacity -= 1
+                    self._wakeup_next()
+                    raise
+                self._stats_connected += 1
+                self._stats_acquired += 1
+                return con
+
+            if self._steal_idle():
+                # An idle connection to another database was closed;
+                # there's room for a new one now.
+                continue
+
+            self._stats_waited += 1
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if not waiter.cancelled() and waiter.done():
+                    # We were woken up but can't use the slot;
+                    # pass it on.
+                    self._wakeup_next()
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                raise
+
+            if self._closed:
+                raise RuntimeError(
+                    'cannot acquire a connection: pool is closed')
+
+    def release(self, dbname, con, *, discard: bool = False):
+        if (discard or self._closed or not con.is_connected()
+                or con.in_tx()
+                or self._cur_capacity > self._max_capacity):
+            self._discard(con)
+        else:
+            try:
+                idle = self._idle[dbname]
+            except KeyError:
+                idle = self._idle[dbname] = collections.deque()
+            idle.append(con)
+            self._nidle += 1
+
+        self._wakeup_next()
+
+    def close(self):
+        self._closed = True
+        for idle in self._idle.values():
+            for con in idle:
+                self._discard(con)
+        self._idle.clear()
+        self._nidle = 0
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _discard(self, con):
+        self._cur_capacity -= 1
+        self._stats_disconnected += 1
+        try:
+            con.terminate()
+        except Exception:
+            logger.exception('could not terminate a backend connection')
+
+    def _pop_idle(self, dbname):
+        idle = self._idle.get(dbname)
+        while idle:
+            con = idle.pop()
+            self._nidle -= 1
+            if con.is_connected():
+                return con
+            # The connection was closed while sitting in the pool.
+            self._discard(con)
+        return None
+
+    def _steal_idle(self):
+        # Close the least recently used idle connection of the
+        # database with the largest number of idle connections.
+        victim_db = None
+        victim_len = 0
+        for dbname, idle in self._idle.items():
+            if len(idle) > victim_len:
+                victim_db = dbname
+                victim_len = len(idle)
+
+        if victim_db is None:
+            return False
+
+        con = self._idle[victim_db].popleft()
+        self._nidle -= 1
+        self._discard(con)
+        return True
+
+    def _wakeup_next(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return True
+        return False
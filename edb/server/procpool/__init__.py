@@ -17,7 +17,7 @@
 #
 
 
-__all__ = 'create_manager',
+__all__ = 'create_manager', 'create_pool'
 
 
-from .pool import create_manager
+from .pool import create_manager, create_pool
@@ -20,10 +20,26 @@
 import asyncio
 import os
 import struct
+import typing
 
 
-_len_unpacker = struct.Struct('!I').unpack
-_len_packer = struct.Struct('!I').pack
+_uint32_unpacker = struct.Struct('!I').unpack_from
+_uint32_packer = struct.Struct('!I').pack
+
+# Every message is framed as:
+#
+#   uint32  length of the rest of the frame
+#   uint64  request ID
+#   bytes   payload
+#
+# Request IDs are assigned by the hub; replies carry the ID of the
+# request they answer, which allows any number of requests to be
+# in flight on a single connection.
+_header = struct.Struct('!IQ')
+_header_unpacker = _header.unpack_from
+_header_packer = _header.pack
+_HEADER_LEN = _header.size
+_REQ_ID_LEN = _HEADER_LEN - 4
 
 
 class PoolClosedError(Exception):
@@ -34,33 +50,50 @@ class BaseFramedProtocol(asyncio.Protocol):
 
     def __init__(self, *, loop, con_waiter=None):
         self._loop = loop
-        self._buffer = b''
+        # Incoming data is accumulated in a single bytearray; the
+        # consumed part is dropped once per data_received() call,
+        # so every byte is copied a constant number of times
+        # regardless of how the stream is chunked.
+        self._buffer = bytearray()
+        self._pos = 0
         self._transport = None
         self._con_waiter = con_waiter
-        self._curmsg_len = -1
         self._closed = False
 
-    def process_message(self, msg):
+    def process_message(self, req_id, msg):
         raise NotImplementedError
 
+    def _process_data(self):
+        buf = self._buffer
+        buflen = len(buf)
+
+        while buflen - self._pos >= _HEADER_LEN:
+            msglen, req_id = _header_unpacker(buf, self._pos)
+            end = self._pos + 4 + msglen
+            if end > buflen:
+                break
+
+            with memoryview(buf) as view:
+                msg = bytes(view[self._pos + _HEADER_LEN:end])
+            self._pos = end
+            self.process_message(req_id, msg)
+
     def data_received(self, data):
-        # TODO: rewrite to avoid buffer copies.
         self._buffer += data
-        while self._buffer:
-            if self._curmsg_len == -1:
-                if len(self._buffer) >= 4:
-                    self._curmsg_len = _len_unpacker(self._buffer[:4])[0]
-                    self._buffer = self._buffer[4:]
-                else:
-                    return
-
-            if self._curmsg_len > 0 and len(self._buffer) >= self._curmsg_len:
-                msg = self._buffer[:self._curmsg_len]
-                self._buffer = self._buffer[self._curmsg_len:]
-                self._curmsg_len = -1
-                self.process_message(msg)
+        self._process_data()
+
+        if self._pos:
+            if self._pos == len(self._buffer):
+                self._buffer.clear()
             else:
-                return
+                del self._buffer[:self._pos]
+            self._pos = 0
+
+    def write_message(self, req_id, payload: bytes):
+        self._transport.writelines((
+            _header_packer(len(payload) + _REQ_ID_LEN, req_id),
+            payload,
+        ))
 
     def connection_made(self, tr):
         self._transport = tr
@@ -84,42 +117,49 @@ class HubProtocol(BaseFramedProtocol):
 
     def __init__(self, *, loop, on_pid):
         super().__init__(loop=loop)
-        self._msg_waiter = None
+        self._msg_waiters = {}
         self._on_pid = on_pid
         self._pid = None
 
-    def send(self, waiter, payload: bytes):
-        if self._msg_waiter is not None and not self._msg_waiter.done():
-            raise RuntimeError('FramedProtocol: another send() is in progress')
-        self._msg_waiter = waiter
-        self._transport.writelines((_len_packer(len(payload)), payload))
+    def send(self, req_id, waiter, payload: bytes):
+        if req_id in self._msg_waiters:
+            raise RuntimeError(
+                f'FramedProtocol: request {req_id} is already in progress')
+        self._msg_waiters[req_id] = waiter
+        self.write_message(req_id, payload)
 
-    def process_message(self, msg):
-        if self._msg_waiter is not None and not self._msg_waiter.done():
-            self._msg_waiter.set_result(msg)
-            self._msg_waiter = None
+    def forget(self, req_id):
+        self._msg_waiters.pop(req_id, None)
 
-    def data_received(self, data):
+    def process_message(self, req_id, msg):
+        waiter = self._msg_waiters.pop(req_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(msg)
+
+    def _process_data(self):
         if self._pid is None:
-            pid_data = data[:4]
-            data = data[4:]
-            self._pid = _len_unpacker(pid_data)[0]
+            # The worker starts with sending its PID.
+            if len(self._buffer) - self._pos < 4:
+                return
+            self._pid = _uint32_unpacker(self._buffer, self._pos)[0]
+            self._pos += 4
             self._on_pid(self, self._transport, self._pid)
-            if data:
-                super().data_received(data)
-        else:
-            super().data_received(data)
+
+        super()._process_data()
 
     def connection_lost(self, exc):
         super().connection_lost(exc)
 
-        if self._msg_waiter is not None:
+        waiters = list(self._msg_waiters.values())
+        self._msg_waiters.clear()
+        for waiter in waiters:
+            if waiter.done():
+                continue
             if exc is not None:
-                self._msg_waiter.set_exception(exc)
+                waiter.set_exception(exc)
             else:
-                self._msg_waiter.set_exception(ConnectionError(
+                waiter.set_exception(ConnectionError(
                     'lost connection to the worker during a call'))
-            self._msg_waiter = None
 
 
 class WorkerProtocol(BaseFramedProtocol):
@@ -129,15 +169,15 @@ class WorkerProtocol(BaseFramedProtocol):
         self._con = con
         super().__init__(loop=loop, con_waiter=con_waiter)
 
-    def reply(self, payload: bytes):
-        self._transport.writelines((_len_packer(len(payload)), payload))
+    def reply(self, req_id, payload: bytes):
+        self.write_message(req_id, payload)
 
-    def process_message(self, msg):
-        self._con._on_message(msg)
+    def process_message(self, req_id, msg):
+        self._con._on_message(req_id, msg)
 
     def connection_made(self, tr):
         super().connection_made(tr)
-        tr.write(_len_packer(os.getpid()))
+        tr.write(_uint32_packer(os.getpid()))
 
     def connection_lost(self, exc):
         super().connection_lost(exc)
@@ -150,14 +190,28 @@ class HubConnection:
         self._transport = transport
         self._protocol = protocol
         self._loop = loop
+        self._next_req_id = 0
 
     def is_closed(self):
         return self._protocol._closed
 
-    async def request(self, data: bytes) -> bytes:
+    def request(self, data: bytes) -> typing.Awaitable[bytes]:
+        # The request is sent right away, not when the result is
+        # awaited, so requests are received in the order they are made.
+        self._next_req_id += 1
+        req_id = self._next_req_id
         waiter = self._loop.create_future()
-        self._protocol.send(waiter, data)
-        return await waiter
+        self._protocol.send(req_id, waiter, data)
+        return self._wait_for_reply(req_id, waiter)
+
+    async def _wait_for_reply(self, req_id: int,
+                              waiter: asyncio.Future) -> bytes:
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # The reply, if it ever arrives, will be discarded.
+            self._protocol.forget(req_id)
+            raise
 
     def abort(self):
         self._transport.abort()
@@ -175,18 +229,18 @@ class WorkerConnection:
     def is_closed(self):
         return self._protocol._closed
 
-    def _on_message(self, msg: bytes):
-        self._msgs.put_nowait(msg)
+    def _on_message(self, req_id: int, msg: bytes):
+        self._msgs.put_nowait((req_id, msg))
 
     def _on_connection_lost(self, exc):
         self._con_lost_fut.set_exception(
             PoolClosedError('connection to the pool is closed'))
         self._con_lost_fut._log_traceback = False
 
-    async def reply(self, data):
-        self._protocol.reply(data)
+    async def reply(self, req_id: int, data: bytes):
+        self._protocol.reply(req_id, data)
 
-    async def next_request(self) -> bytes:
+    async def next_request(self) -> typing.Tuple[int, bytes]:
         getter = self._loop.create_task(self._msgs.get())
         await asyncio.wait(
             [getter, self._con_lost_fut],
@@ -0,0 +1,156 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Fork server for procpool workers.
+
+The fork server is a template process that imports the worker class,
+instantiates it once and then forks ready-to-use workers on request.
+Everything loaded by the worker class constructor (for compilers: the
+std schema, the config spec and the parser tables) is shared between
+the workers copy-on-write instead of being loaded by each of them.
+
+The template talks to the manager over a socket pair using a trivial
+line-based protocol: the manager sends ``fork\\n`` and the template
+replies with the pid of the new worker, or with an empty line if the
+fork failed.
+"""
+
+
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+
+from edb.common import debug
+
+
+FORKSERVER_START_TIMEOUT = 60.0
+POLL_INTERVAL = 0.05
+
+
+class ForkedProcess:
+    """A handle for a worker forked by the fork server.
+
+    The worker is not a child of the manager process, so it can't
+    be waited for with waitpid(); the fork server reaps it instead.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def _signal(self, sig):
+        if self.returncode is not None:
+            raise ProcessLookupError
+        os.kill(self.pid, sig)
+
+    def kill(self):
+        self._signal(signal.SIGKILL)
+
+    def terminate(self):
+        self._signal(signal.SIGTERM)
+
+    async def wait(self):
+        while self.returncode is None:
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                # The exit status isn't available to us.
+                self.returncode = 0
+            else:
+                await asyncio.sleep(POLL_INTERVAL)
+        return self.returncode
+
+
+class ForkServer:
+
+    def __init__(self, *, command_args, env):
+        self._command_args = command_args
+        self._env = env
+        self._proc = None
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        sock, child_sock = socket.socketpair()
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                *self._command_args,
+                '--forkserver-fd', str(child_sock.fileno()),
+                env=self._env,
+                stdin=subprocess.DEVNULL,
+                pass_fds=(child_sock.fileno(),))
+        except Exception:
+            sock.close()
+            raise
+        finally:
+            child_sock.close()
+
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            sock=sock)
+
+        # The template sends an empty line once the worker class
+        # is instantiated and it is ready to fork.
+        try:
+            await asyncio.wait_for(
+                self._reader.readline(), FORKSERVER_START_TIMEOUT)
+        except Exception:
+            await self.stop()
+            raise
+
+    def is_running(self):
+        return (
+            self._proc is not None and
+            self._proc.returncode is None and
+            not self._reader.at_eof()
+        )
+
+    async def fork(self) -> ForkedProcess:
+        async with self._lock:
+            if not self.is_running():
+                if self._proc is not None:
+                    if debug.flags.server:
+                        debug.dump('fork server died, restarting')
+                    await self.stop()
+                await self.start()
+
+            self._writer.write(b'fork\n')
+            line = await self._reader.readline()
+
+        if not line.strip():
+            raise RuntimeError('fork server could not fork a worker')
+        return ForkedProcess(int(line))
+
+    async def stop(self):
+        if self._writer is not None:
+            # The template exits when the socket is closed.
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+        proc = self._proc
+        self._proc = None
+        if proc is not None and proc.returncode is None:
+            try:
+                proc.terminate()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
@@ -20,17 +20,23 @@
 import asyncio
 import base64
 import collections
+import logging
 import os.path
 import pickle
 import subprocess
 import sys
 import time
+import typing
+
+import psutil
 
 from edb.common import debug
 from edb.common import supervisor
 from edb.common import taskgroup
+from edb.server import metrics
 
 from . import amsg
+from . import forkserver
 
 
 BUFFER_POOL_SIZE = 4
@@ -38,6 +44,20 @@ PROCESS_INITIAL_RESPONSE_TIMEOUT = 60.0
 KILL_TIMEOUT = 10.0
 WORKER_MOD = __name__.rpartition('.')[0] + '.worker'
 
+# Workers of a Pool are replaced with fresh processes after serving
+# this many requests or when their RSS exceeds this many megabytes:
+# long-lived compilers accumulate schemas and caches.
+WORKER_MAX_REQUESTS = 10000
+WORKER_MAX_RSS = 1024
+# Workers of a Pool idle for this many seconds are stopped (unless
+# the pool has no more than its minimum size).
+WORKER_IDLE_TIMEOUT = 300.0
+# Seconds between checks of the idle time and RSS of workers.
+POOL_MAINTENANCE_INTERVAL = 10.0
+
+
+logger = logging.getLogger('edb.server')
+
 
 # Inherit sys.path so that import system can find worker class
 # in unittests.
@@ -45,6 +65,13 @@ _ENV = os.environ.copy()
 _ENV['PYTHONPATH'] = ':'.join(sys.path)
 
 
+def _get_env():
+    if debug.flags.server:
+        return {'EDGEDB_DEBUG_SERVER': '1', **_ENV}
+    else:
+        return _ENV
+
+
 class Worker:
 
     def __init__(self, manager, server, command_args):
@@ -56,6 +83,14 @@ class Worker:
         self._last_used = time.monotonic()
         self._closed = False
         self._sup = None
+        # Number of requests served by the current process.
+        self._requests = 0
+        # Number of clients that keep their state in this worker
+        # (see Pool.pin()).
+        self._pins = 0
+        # Several calls can be in flight at the same time; make
+        # sure only one of them respawns a dead process.
+        self._spawn_lock = asyncio.Lock()
 
     async def _kill_proc(self, proc):
         try:
@@ -71,19 +106,19 @@ class Worker:
 
     async def _spawn(self):
         self._manager._stats_spawned += 1
+        self._requests = 0
 
         if self._proc is not None:
             self._manager._sup.create_task(self._kill_proc(self._proc))
             self._proc = None
 
-        env = _ENV
-        if debug.flags.server:
-            env = {'EDGEDB_DEBUG_SERVER': '1', **_ENV}
-
-        self._proc = await asyncio.create_subprocess_exec(
-            *self._command_args,
-            env=env,
-            stdin=subprocess.DEVNULL)
+        if self._manager._forkserver is not None:
+            self._proc = await self._manager._forkserver.fork()
+        else:
+            self._proc = await asyncio.create_subprocess_exec(
+                *self._command_args,
+                env=_get_env(),
+                stdin=subprocess.DEVNULL)
         try:
             self._con = await asyncio.wait_for(
                 self._server.get_by_pid(self._proc.pid),
@@ -98,17 +133,44 @@ class Worker:
     def get_pid(self):
         return self._proc.pid
 
-    async def call(self, method_name, *args):
+    def get_rss(self):
+        try:
+            return psutil.Process(self._proc.pid).memory_info().rss
+        except psutil.Error:
+            return 0
+
+    def call(self, method_name, *args) -> typing.Awaitable:
         assert not self._closed
 
         if self._con.is_closed():
-            await self._spawn()
+            return self._respawn_and_call(method_name, args)
 
+        # Send the request right away: requests made in a row are
+        # received by the worker in that order, even if the caller
+        # doesn't await the result immediately.
+        started_at = time.monotonic()
         msg = pickle.dumps((method_name, args))
-        data = await self._con.request(msg)
+        return self._get_result(
+            self._con.request(msg), method_name, started_at)
+
+    async def _respawn_and_call(self, method_name, args):
+        async with self._spawn_lock:
+            if self._con.is_closed():
+                await self._spawn()
+
+        started_at = time.monotonic()
+        msg = pickle.dumps((method_name, args))
+        return await self._get_result(
+            self._con.request(msg), method_name, started_at)
+
+    async def _get_result(self, request, method_name, started_at):
+        data = await request
         status, *data = pickle.loads(data)
 
         self._last_used = time.monotonic()
+        self._requests += 1
+        metrics.compiler_call_duration.observe(
+            self._last_used - started_at, method_name)
 
         if status == 0:
             return data[0]
@@ -138,7 +200,8 @@ class Worker:
 class Manager:
 
     def __init__(self, *, worker_cls, worker_args,
-                 loop, name, runstate_dir, pool_size=BUFFER_POOL_SIZE):
+                 loop, name, runstate_dir, pool_size=BUFFER_POOL_SIZE,
+                 use_forkserver=False):
 
         self._worker_cls = worker_cls
         self._worker_args = worker_args
@@ -161,9 +224,13 @@ class Manager:
 
         self._stats_spawned = 0
         self._stats_killed = 0
+        self._stats_recycled = 0
 
         self._sup = None
 
+        self._use_forkserver = use_forkserver
+        self._forkserver = None
+
         self._worker_command_args = [
             sys.executable, '-m', WORKER_MOD,
 
@@ -177,6 +244,14 @@ class Manager:
     def iter_workers(self):
         return iter(frozenset(self._workers))
 
+    def get_stats(self):
+        return {
+            'workers': len(self._workers),
+            'spawned': self._stats_spawned,
+            'killed': self._stats_killed,
+            'recycled': self._stats_recycled,
+        }
+
     def is_running(self):
         return self._running
 
@@ -207,6 +282,13 @@ class Manager:
         self._sup = await supervisor.Supervisor.create()
 
         await self._server.start()
+
+        if self._use_forkserver:
+            self._forkserver = forkserver.ForkServer(
+                command_args=self._worker_command_args,
+                env=_get_env())
+            await self._forkserver.start()
+
         self._running = True
 
         if self._pool_size:
@@ -233,11 +315,238 @@ class Manager:
 
         self._workers_pool.clear()
         self._workers.clear()
+
+        if self._forkserver is not None:
+            await self._forkserver.stop()
+            self._forkserver = None
+
         self._running = False
 
 
+class Pool(Manager):
+    """A pool of workers shared by many clients.
+
+    Unlike the Manager, which hands out dedicated workers, the Pool
+    lends a worker for the duration of a single call.  A client that
+    needs subsequent calls to be served by the same worker (e.g. the
+    worker holds its transaction state) can call that worker
+    directly: requests are multiplexed over worker connections; such
+    a client must pin() the worker for as long as it needs it.
+
+    The pool starts with *min_size* workers and grows up to
+    *pool_size* workers while clients wait for one.  Workers idle
+    for longer than *worker_idle_timeout* are stopped, and workers
+    that served *worker_max_requests* requests or use more than
+    *worker_max_rss* MB of memory are replaced with new processes.
+    """
+
+    def __init__(self, *, pool_size=None, min_size=None,
+                 worker_max_requests=WORKER_MAX_REQUESTS,
+                 worker_max_rss=WORKER_MAX_RSS,
+                 worker_idle_timeout=WORKER_IDLE_TIMEOUT,
+                 **kwargs):
+        if pool_size is None:
+            pool_size = os.cpu_count() or BUFFER_POOL_SIZE
+        if min_size is None:
+            min_size = BUFFER_POOL_SIZE
+        # Manager.start() spawns the initial workers.
+        super().__init__(pool_size=min(min_size, pool_size), **kwargs)
+
+        self._min_size = min(min_size, pool_size)
+        self._max_size = pool_size
+        self._worker_max_requests = worker_max_requests
+        self._worker_max_rss = worker_max_rss * 1024 * 1024
+        self._worker_idle_timeout = worker_idle_timeout
+
+        # Workers that aren't serving a call right now.
+        self._free_workers = collections.deque()
+        # Clients waiting for a worker.
+        self._waiters = collections.deque()
+        # Number of workers being spawned to serve the waiters.
+        self._spawning = 0
+
+        self._maintenance_task = None
+
+    def get_size(self):
+        return self._max_size
+
+    def get_stats(self):
+        return {
+            **super().get_stats(),
+            'free': len(self._free_workers),
+            'waiters': len(self._waiters),
+            'min_size': self._min_size,
+            'max_size': self._max_size,
+        }
+
+    def pin(self, worker):
+        """Prevent the worker from being stopped or recycled."""
+        worker._pins += 1
+
+    def unpin(self, worker):
+        assert worker._pins > 0
+        worker._pins -= 1
+
+    async def spawn_worker(self):
+        raise RuntimeError(
+            'cannot spawn a dedicated worker: use acquire() instead')
+
+    async def acquire(self):
+        if not self._running:
+            raise RuntimeError('cannot acquire a worker: not running')
+
+        if self._free_workers:
+            return self._free_workers.pop()
+
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        self._maybe_grow()
+        try:
+            return await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The worker was handed over to us, but we
+                # can't use it; pass it on.
+                self.release(waiter.result())
+            raise
+
+    def try_acquire(self):
+        """Return a worker that is idle right now or None.
+
+        Unlike acquire(), never waits, so background requests don't
+        delay the clients waiting for a worker.
+        """
+        if not self._running or self._waiters or not self._free_workers:
+            return None
+        return self._free_workers.pop()
+
+    def release(self, worker):
+        if worker._closed:
+            return
+
+        if (self._worker_max_requests and not worker._pins and
+                worker._requests >= self._worker_max_requests):
+            self._recycle(worker)
+            return
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(worker)
+                return
+
+        # LIFO: the most recently used worker is likely to have
+        # the needed schema cached.
+        self._free_workers.append(worker)
+
+    async def call(self, method_name, *args):
+        worker = await self.acquire()
+        try:
+            return await worker.call(method_name, *args)
+        finally:
+            self.release(worker)
+
+    async def _spawn_for_pool(self):
+        worker = await self._spawn_worker()
+        self._workers.add(worker)
+        self.release(worker)
+        return worker
+
+    def _maybe_grow(self):
+        if (len(self._waiters) > self._spawning and
+                len(self._workers) + self._spawning < self._max_size):
+            self._spawning += 1
+            self._sup.create_task(self._grow())
+
+    async def _grow(self):
+        try:
+            await self._spawn_for_pool()
+        except Exception:
+            logger.warning(
+                'could not spawn a %s worker', self._name, exc_info=True)
+        finally:
+            self._spawning -= 1
+
+    def _recycle(self, worker):
+        self._stats_recycled += 1
+        self._sup.create_task(self._replace_worker(worker))
+
+    async def _replace_worker(self, worker):
+        # Spawn the new worker first, so that the pool doesn't
+        # shrink in the meantime.
+        try:
+            await self._spawn_for_pool()
+        except Exception:
+            logger.warning(
+                'could not spawn a %s worker; keep using the old one',
+                self._name, exc_info=True)
+            worker._requests = 0
+            self.release(worker)
+        else:
+            await self._close_worker(worker)
+
+    async def _close_worker(self, worker):
+        try:
+            await worker.close()
+        except Exception:
+            logger.warning(
+                'could not stop a %s worker', self._name, exc_info=True)
+
+    def _check_workers(self):
+        now = time.monotonic()
+        nworkers = len(self._workers)
+
+        # The least recently used workers are at the left.
+        for worker in list(self._free_workers):
+            if worker._pins:
+                continue
+
+            if (nworkers > self._min_size and
+                    now - worker._last_used > self._worker_idle_timeout):
+                self._free_workers.remove(worker)
+                nworkers -= 1
+                self._sup.create_task(self._close_worker(worker))
+
+            elif (self._worker_max_rss and
+                    worker.get_rss() > self._worker_max_rss):
+                self._free_workers.remove(worker)
+                self._recycle(worker)
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(POOL_MAINTENANCE_INTERVAL)
+            try:
+                self._check_workers()
+            except Exception:
+                logger.warning(
+                    'could not check the %s workers', self._name,
+                    exc_info=True)
+
+    async def start(self):
+        await super().start()
+        self._maintenance_task = self._loop.create_task(self._maintain())
+
+    async def stop(self):
+        if not self._running:
+            return
+
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(
+                    RuntimeError('the worker pool is stopping'))
+        self._waiters.clear()
+        self._free_workers.clear()
+
+        await super().stop()
+
+
 async def create_manager(*, runstate_dir: str, name: str,
-                         worker_cls: type, worker_args: tuple) -> Manager:
+                         worker_cls: type, worker_args: tuple,
+                         use_forkserver: bool=False) -> Manager:
 
     loop = asyncio.get_running_loop()
     pool = Manager(
@@ -245,7 +554,29 @@ async def create_manager(*, runstate_dir: str, name: str,
         runstate_dir=runstate_dir,
         worker_cls=worker_cls,
         worker_args=worker_args,
-        name=name)
+        name=name,
+        use_forkserver=use_forkserver)
+
+    await pool.start()
+    return pool
+
+
+async def create_pool(*, runstate_dir: str, name: str,
+                      worker_cls: type, worker_args: tuple,
+                      pool_size: int=None,
+                      min_size: int=None,
+                      use_forkserver: bool=False) -> Pool:
+
+    loop = asyncio.get_running_loop()
+    pool = Pool(
+        loop=loop,
+        runstate_dir=runstate_dir,
+        worker_cls=worker_cls,
+        worker_args=worker_args,
+        name=name,
+        pool_size=pool_size,
+        min_size=min_size,
+        use_forkserver=use_forkserver)
 
     await pool.start()
     return pool
@@ -19,11 +19,14 @@
 
 import argparse
 import asyncio
+import gc
 import importlib
 import base64
 import os
 import pickle
 import signal
+import socket
+import sys
 import traceback
 
 import uvloop
@@ -42,54 +45,69 @@ def load_class(cls_name):
     return cls
 
 
-async def worker(cls, cls_args, sockname):
+async def handle_request(worker, con, req_id, req):
+    try:
+        methname, args = pickle.loads(req)
+        meth = getattr(worker, methname)
+    except Exception as ex:
+        prepare_exception(ex)
+        if debug.flags.server:
+            markup.dump(ex)
+        data = (
+            1,
+            ex,
+            traceback.format_exc()
+        )
+    else:
+        try:
+            res = await meth(*args)
+            data = (0, res)
+        except Exception as ex:
+            prepare_exception(ex)
+            if debug.flags.server:
+                markup.dump(ex)
+            data = (
+                1,
+                ex,
+                traceback.format_exc()
+            )
+
+    try:
+        pickled = pickle.dumps(data)
+    except Exception as ex:
+        ex_tb = traceback.format_exc()
+        ex_str = f'{ex}:\n\n{ex_tb}'
+        pickled = pickle.dumps((2, ex_str))
+
+    await con.reply(req_id, pickled)
+
+
+async def worker(cls, cls_args, sockname, instance=None):
     loop = asyncio.get_running_loop()
     loop.add_signal_handler(signal.SIGTERM, on_terminate_worker)
 
     con = await amsg.worker_connect(sockname)
+    pending = set()
     try:
-        worker = cls(*cls_args)
+        if instance is not None:
+            # Forked by the fork server.
+            worker = instance
+        else:
+            worker = cls(*cls_args)
 
         while True:
             try:
-                req = await con.next_request()
+                req_id, req = await con.next_request()
             except amsg.PoolClosedError:
                 os._exit(0)
 
-            try:
-                methname, args = pickle.loads(req)
-                meth = getattr(worker, methname)
-            except Exception as ex:
-                prepare_exception(ex)
-                if debug.flags.server:
-                    markup.dump(ex)
-                data = (
-                    1,
-                    ex,
-                    traceback.format_exc()
-                )
-            else:
-                try:
-                    res = await meth(*args)
-                    data = (0, res)
-                except Exception as ex:
-                    prepare_exception(ex)
-                    if debug.flags.server:
-                        markup.dump(ex)
-                    data = (
-                        1,
-                        ex,
-                        traceback.format_exc()
-                    )
-
-            try:
-                pickled = pickle.dumps(data)
-            except Exception as ex:
-                ex_tb = traceback.format_exc()
-                ex_str = f'{ex}:\n\n{ex_tb}'
-                pickled = pickle.dumps((2, ex_str))
-
-            await con.reply(pickled)
+            # Requests are multiplexed over the connection; handle
+            # each one in its own task so that a request waiting on
+            # I/O does not hold up the others.
+            task = loop.create_task(
+                handle_request(worker, con, req_id, req))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
     finally:
         con.abort()
 
@@ -99,10 +117,62 @@ def on_terminate_worker():
     os._exit(-1)
 
 
-def run_worker(cls, cls_args, sockname):
+def run_worker(cls, cls_args, sockname, instance=None):
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     with devmode.CoverageConfig.enable_coverage_if_requested():
-        asyncio.run(worker(cls, cls_args, sockname))
+        asyncio.run(worker(cls, cls_args, sockname, instance))
+
+
+def run_forkserver(cls, cls_args, sockname, fd):
+    ctl = socket.socket(fileno=fd)
+    ctl_file = ctl.makefile('rb')
+
+    instance = cls(*cls_args)
+
+    # Everything allocated so far is shared by the forked workers.
+    # Move it out of reach of the garbage collector, which would
+    # otherwise touch (and thus copy) the shared pages in every
+    # worker on each full collection.
+    gc.collect()
+    gc.freeze()
+
+    # Let the kernel reap the forked workers.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    # Tell the manager we are ready.
+    ctl.sendall(b'\n')
+
+    # The manager closes the socket when it stops.
+    for line in ctl_file:
+        if line.strip() != b'fork':
+            continue
+
+        # Don't let the workers inherit pending output.
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        try:
+            pid = os.fork()
+        except OSError:
+            traceback.print_exc()
+            ctl.sendall(b'\n')
+            continue
+
+        if pid == 0:
+            ctl_file.close()
+            ctl.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                run_worker(cls, cls_args, sockname, instance)
+            except amsg.PoolClosedError:
+                os._exit(0)
+            except BaseException:
+                traceback.print_exc()
+                sys.stderr.flush()
+                os._exit(1)
+            os._exit(0)
+
+        ctl.sendall(f'{pid}\n'.encode())
 
 
 def prepare_exception(ex):
@@ -136,11 +206,16 @@ def main():
     parser.add_argument('--cls-name')
     parser.add_argument('--cls-args')
     parser.add_argument('--sockname')
+    parser.add_argument('--forkserver-fd', type=int)
     args = parser.parse_args()
 
     cls = load_class(args.cls_name)
     cls_args = pickle.loads(base64.b64decode(args.cls_args))
 
+    if args.forkserver_fd is not None:
+        run_forkserver(cls, cls_args, args.sockname, args.forkserver_fd)
+        return
+
     try:
         run_worker(cls, cls_args, args.sockname)
     except amsg.PoolClosedError:
@@ -0,0 +1,173 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Statistics of the queries executed by the server.
+
+The statistics are kept per (database, sql_hash); queries that only
+differ in the values of their literals are normalized to the same
+text and hash (see edb.server.compiler.normalizer.)  They are
+periodically saved to the Postgres data directory, from where the
+sys::QueryStats view reads them.  The view only sees the servers
+running on the same host as Postgres: the servers of remote
+clusters can't write to its data directory.
+"""
+
+
+import asyncio
+import json
+import logging
+import os
+import os.path
+import tempfile
+
+from edb.common import lru
+
+
+logger = logging.getLogger('edb.server')
+
+
+class QueryStatsEntry:
+
+    __slots__ = (
+        'query', 'calls', 'cache_hits', 'compilations',
+        'total_compile_time', 'max_compile_time',
+        'total_exec_time', 'max_exec_time', 'rows',
+    )
+
+    def __init__(self, query):
+        self.query = query
+        self.calls = 0
+        self.cache_hits = 0
+        self.compilations = 0
+        self.total_compile_time = 0.0
+        self.max_compile_time = 0.0
+        self.total_exec_time = 0.0
+        self.max_exec_time = 0.0
+        self.rows = 0
+
+
+class QueryStats:
+
+    def __init__(self, *, maxsize):
+        # (dbname, sql_hash) -> QueryStatsEntry; the least recently
+        # used entries are discarded first.
+        self._entries = lru.LRUMapping(maxsize=maxsize)
+        # The first save() replaces the statistics of a previous run.
+        self._dirty = True
+        # Queries that take longer than this many seconds to compile
+        # or to execute are logged; None disables the log.
+        self.slow_query_threshold = None
+
+    def _get_entry(self, dbname, sql_hash, query):
+        key = (dbname, sql_hash)
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            entry = QueryStatsEntry(query.decode())
+            self._entries[key] = entry
+        self._dirty = True
+        return entry
+
+    def record_compile(self, dbname, sql_hash, query, duration):
+        entry = self._get_entry(dbname, sql_hash, query)
+        entry.compilations += 1
+        entry.total_compile_time += duration
+        if duration > entry.max_compile_time:
+            entry.max_compile_time = duration
+        self._check_slow_query('compilation', dbname, entry, duration)
+
+    def record_cache_hit(self, dbname, sql_hash, query):
+        entry = self._get_entry(dbname, sql_hash, query)
+        entry.cache_hits += 1
+
+    def record_execute(self, dbname, sql_hash, duration, rows):
+        try:
+            entry = self._entries[(dbname, sql_hash)]
+        except KeyError:
+            # Evicted since the query was compiled.
+            return
+        self._dirty = True
+        entry.calls += 1
+        entry.total_exec_time += duration
+        if duration > entry.max_exec_time:
+            entry.max_exec_time = duration
+        entry.rows += rows
+        self._check_slow_query('execution', dbname, entry, duration)
+
+    def _check_slow_query(self, stage, dbname, entry, duration):
+        threshold = self.slow_query_threshold
+        if threshold is not None and duration >= threshold:
+            logger.info(
+                'slow query %s in database %r (%.3f s): %s',
+                stage, dbname, duration, entry.query)
+
+    def reset(self):
+        self._entries.clear()
+        self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def as_list(self):
+        return [
+            {
+                'database': dbname,
+                'sql_hash': sql_hash.decode(),
+                'query': entry.query,
+                'calls': entry.calls,
+                'cache_hits': entry.cache_hits,
+                'compilations': entry.compilations,
+                'total_compile_time': entry.total_compile_time,
+                'max_compile_time': entry.max_compile_time,
+                'total_exec_time': entry.total_exec_time,
+                'max_exec_time': entry.max_exec_time,
+                'rows': entry.rows,
+            }
+            for (dbname, sql_hash), entry in self._entries.items()
+        ]
+
+    async def save(self, path):
+        """Write the statistics to *path* if they have changed."""
+        if not self._dirty:
+            return
+        # Queries recorded while the file is being written are
+        # saved the next time.
+        self._dirty = False
+        entries = self.as_list()
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, _write_entries, path, entries)
+        except Exception:
+            self._dirty = True
+            raise
+
+
+def _write_entries(path, entries):
+    # Readers must never see a partially written file.  A write of
+    # a cancelled save() can still be in progress, so the temporary
+    # file must have a unique name.
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with open(fd, 'wt') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
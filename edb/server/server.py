@@ -17,9 +17,13 @@
 #
 
 
+import asyncio
+import functools
+import json
 import logging
 import os
 import urllib.parse
+import uuid
 
 from edb import errors
 
@@ -27,12 +31,19 @@ from edb.common import taskgroup
 
 from edb.edgeql import parser as ql_parser
 
+from edb.pgsql import common as pg_common
+
 from edb.server import config
 from edb.server import defines
 from edb.server import http_edgeql_port
 from edb.server import http_graphql_port
+from edb.server import metrics
+from edb.server import metrics_port
 from edb.server import mng_port
 from edb.server import pgcon
+from edb.server import pgpool
+from edb.server import querystats
+from edb.server import sysevents
 
 from . import dbview
 
@@ -40,15 +51,60 @@ from . import dbview
 logger = logging.getLogger('edb.server')
 
 
+class _Replica:
+    """A read-only standby of the Postgres cluster."""
+
+    def __init__(self, addr, pool):
+        self.addr = addr
+        self.pool = pool
+        # True if the replication lag of the standby is tolerable;
+        # updated periodically by Server._monitor_replicas().
+        self.available = False
+        # The position of the primary's WAL the standby has replayed
+        # up to, as of the last check.
+        self.replay_lsn = 0
+        self.monitor_con = None
+
+
+def _parse_lsn(lsn: str) -> int:
+    hi, _, lo = lsn.partition('/')
+    return (int(hi, 16) << 32) | int(lo, 16)
+
+
 class Server:
 
     def __init__(self, *, loop, cluster, runstate_dir,
                  internal_runstate_dir,
                  max_backend_connections,
-                 nethost, netport):
+                 nethost, netport,
+                 persistent_query_cache=False,
+                 frontend_id=0, frontends=1,
+                 replica_dsns=(), replica_max_lag=0.0,
+                 metrics_port=None, trace_exporter=None):
 
         self._loop = loop
 
+        # Several server processes ("frontends") can serve the same
+        # instance; they share the listening TCP sockets.
+        self._frontend_id = frontend_id
+        self._frontends = frontends
+
+        # All servers using the Postgres cluster, including the other
+        # frontends, notify each other of schema and system config
+        # changes.  Every change advances the system event version
+        # stored in the system database; _sys_event_ver is the latest
+        # version known to this server.  Schema changes also advance
+        # the version of their database in the DDL transaction.
+        self._instance_id = uuid.uuid4().hex
+        self._sys_events_task = None
+        self._check_sys_event_vers_task = None
+        self._sys_pgcon = None
+        self._sys_event_sender = sysevents.SysEventSender(
+            connect=functools.partial(
+                self.new_pgcon, defines.EDGEDB_SUPERUSER_DB),
+            channel=defines.EDGEDB_SYSEVENT_CHANNEL)
+        self._sys_event_ver = None
+
         self._serving = False
 
         self._cluster = cluster
@@ -61,6 +117,35 @@ class Server:
         self._runstate_dir = runstate_dir
         self._internal_runstate_dir = internal_runstate_dir
         self._max_backend_connections = max_backend_connections
+        self._persistent_query_cache = persistent_query_cache
+        self._save_queries_task = None
+        self._pg_pool = pgpool.Pool(
+            connect=self.new_pgcon,
+            max_capacity=self._get_pool_capacity(),
+            loop=loop,
+        )
+
+        # Read-only queries executed outside of transactions are
+        # spread between the replicas whose replication lag doesn't
+        # exceed replica_max_lag seconds.  A connection that has
+        # written something only reads from the replicas that have
+        # replayed its writes.
+        self._replicas = []
+        for dsn in replica_dsns:
+            addr = self._parse_replica_dsn(dsn)
+            pool = pgpool.Pool(
+                connect=functools.partial(self._new_replica_pgcon, addr),
+                # One more connection monitors the replication lag.
+                max_capacity=max(
+                    1, max_backend_connections // frontends - 1),
+                loop=loop,
+            )
+            self._replicas.append(_Replica(addr, pool))
+        self._replica_max_lag = replica_max_lag
+        self._replica_min_lsn = 0
+        self._replica_schema_changed = False
+        self._next_replica = 0
+        self._replicas_task = None
 
         self._mgmt_port = None
         self._mgmt_host_addr = nethost
@@ -70,9 +155,29 @@ class Server:
         self._sys_conf_ports = {}
         self._sys_auth = tuple()
 
+        # Receives the traces of the protocol messages (see
+        # edb.server.tracing); None if traces are only returned
+        # to the clients that request them.
+        self._trace_exporter = trace_exporter
+
+        # Every frontend serves its own metrics on a separate port.
+        self._metrics_port = None
+        self._metrics_port_no = None
+        if metrics_port is not None:
+            self._metrics_port_no = metrics_port + frontend_id
+
+        # Every frontend saves the statistics of its queries to
+        # a separate file, sys::QueryStats aggregates them.
+        self._query_stats = querystats.QueryStats(
+            maxsize=defines._MAX_QUERY_STATS)
+        self._query_stats_dir = os.path.join(
+            self._pg_data_dir, 'query_stats')
+        self._save_query_stats_task = None
+
     async def init(self):
         self._dbindex = await dbview.DatabaseIndex.init(self)
         self._populate_sys_auth()
+        self._populate_slow_query_threshold()
 
         cfg = self._dbindex.get_sys_config()
 
@@ -93,6 +198,14 @@ class Server:
             self._dbindex.get_sys_config().get('auth', ()),
             key=lambda a: a.priority))
 
+    def _populate_slow_query_threshold(self):
+        threshold = self._dbindex.get_sys_config().get(
+            'slow_query_log_threshold', -1)
+        if threshold < 0:
+            self._query_stats.slow_query_threshold = None
+        else:
+            self._query_stats.slow_query_threshold = threshold / 1000
+
     def _get_pgaddr(self):
         pg_con_spec = self._cluster.get_connection_spec()
         if 'host' not in pg_con_spec and 'dsn' in pg_con_spec:
@@ -106,9 +219,323 @@ class Server:
 
         return os.path.join(host, f'.s.PGSQL.{port}')
 
+    def _get_pool_capacity(self, http_connections=0):
+        # The limit is for all frontends together and includes the
+        # connections opened outside of the pool: the system ones and
+        # those of the HTTP ports.
+        capacity = (
+            self._max_backend_connections // self._frontends
+            - defines._RESERVED_BACKEND_CONNECTIONS
+            - http_connections
+        )
+        return max(1, capacity)
+
+    def _update_pool_capacity(self, *, reserve=0):
+        http_connections = reserve + sum(
+            port.concurrency for port in self._sys_conf_ports.values())
+        self._pg_pool.set_max_capacity(
+            self._get_pool_capacity(http_connections))
+
     async def new_pgcon(self, dbname):
         return await pgcon.connect(self._pg_addr, dbname)
 
+    def _parse_replica_dsn(self, dsn):
+        parsed = urllib.parse.urlparse(dsn)
+        if parsed.scheme not in {'postgres', 'postgresql'}:
+            raise errors.ConfigurationError(
+                f'invalid replica DSN {dsn!r}: expected a postgres:// URI')
+
+        query = urllib.parse.parse_qs(parsed.query)
+        host = query.get('host', [parsed.hostname or 'localhost'])[-1]
+        port = int(query.get('port', [parsed.port or 5432])[-1])
+
+        if host.startswith('/'):
+            return os.path.join(host, f'.s.PGSQL.{port}')
+        else:
+            return (host, port)
+
+    async def _new_replica_pgcon(self, addr, dbname):
+        return await pgcon.connect(addr, dbname, replica=True)
+
+    def has_replicas(self):
+        return bool(self._replicas)
+
+    def get_replica_pool(self, min_lsn=0):
+        # Round-robin between the available replicas that have
+        # replayed the WAL up to *min_lsn*; None if there are none.
+        n = len(self._replicas)
+        for i in range(n):
+            replica = self._replicas[(self._next_replica + i) % n]
+            if replica.available and replica.replay_lsn >= min_lsn:
+                self._next_replica = (self._next_replica + i + 1) % n
+                return replica.pool
+        return None
+
+    def _on_schema_change(self):
+        # Replicas that haven't replayed the schema changes yet
+        # can't run queries compiled against the new schema.
+        if not self._replicas:
+            return
+        for replica in self._replicas:
+            replica.available = False
+        self._replica_schema_changed = True
+
+    async def _monitor_replicas(self):
+        while True:
+            if self._replica_schema_changed:
+                try:
+                    self._replica_min_lsn = await self.get_primary_lsn()
+                except Exception:
+                    logger.warning(
+                        'could not get the WAL position of the primary',
+                        exc_info=True)
+                else:
+                    self._replica_schema_changed = False
+
+            for replica in self._replicas:
+                if self._replica_schema_changed:
+                    replica.available = False
+                    continue
+                try:
+                    replica.available = await self._check_replica(replica)
+                except Exception:
+                    if replica.available:
+                        logger.warning(
+                            'replica %r is not available', replica.addr,
+                            exc_info=True)
+                    replica.available = False
+                    if replica.monitor_con is not None:
+                        replica.monitor_con.abort()
+                        replica.monitor_con = None
+
+            await asyncio.sleep(defines.REPLICA_CHECK_INTERVAL)
+
+    async def get_primary_lsn(self):
+        conn = await self.acquire_pgcon(defines.EDGEDB_SUPERUSER_DB)
+        try:
+            result = await conn.simple_query(
+                b'SELECT pg_current_wal_lsn()', ignore_data=False)
+        finally:
+            self.release_pgcon(defines.EDGEDB_SUPERUSER_DB, conn)
+        return _parse_lsn(result[0][0].decode())
+
+    async def _check_replica(self, replica):
+        if replica.monitor_con is None:
+            replica.monitor_con = await self._new_replica_pgcon(
+                replica.addr, defines.EDGEDB_SUPERUSER_DB)
+
+        # The standby is considered to be up to date if it is
+        # streaming and has replayed all of the received changes;
+        # otherwise the lag is the age of the last replayed commit.
+        result = await replica.monitor_con.simple_query(
+            b'''
+                SELECT
+                    pg_last_wal_replay_lsn(),
+                    CASE WHEN
+                        pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                        AND EXISTS (
+                            SELECT FROM pg_stat_wal_receiver
+                            WHERE status = 'streaming')
+                    THEN 0
+                    ELSE coalesce(
+                        extract(epoch FROM
+                            now() - pg_last_xact_replay_timestamp()),
+                        'Infinity')
+                    END
+            ''',
+            ignore_data=False)
+
+        replay_lsn, lag = result[0]
+        if replay_lsn is None:
+            # The server is not a standby.
+            return False
+        replica.replay_lsn = _parse_lsn(replay_lsn.decode())
+        # Queries compiled against the current schema can only run
+        # on the replicas that have replayed its changes.
+        return (replica.replay_lsn >= self._replica_min_lsn and
+                float(lag) <= self._replica_max_lag)
+
+    async def acquire_pgcon(self, dbname):
+        return await self._pg_pool.acquire(dbname)
+
+    def release_pgcon(self, dbname, conn, *, discard=False):
+        self._pg_pool.release(dbname, conn, discard=discard)
+
+    def get_pgaddr(self):
+        return self._pg_addr
+
+    def propagate_schema_delta(self, dbname, base_dbver, dbver, delta):
+        ports = [self._mgmt_port, *self._ports,
+                 *self._sys_conf_ports.values()]
+        for port in ports:
+            if port is not None:
+                port.propagate_schema_delta(dbname, base_dbver, dbver, delta)
+
+    def in_multi_frontend_mode(self):
+        return self._frontends > 1
+
+    def is_primary_frontend(self):
+        # The primary frontend also serves the UNIX sockets, which
+        # can't be shared between processes.
+        return self._frontend_id == 0
+
+    def get_compiler_pool_size(self):
+        if self._frontends == 1:
+            return None  # the default size
+        return max(1, (os.cpu_count() or 1) // self._frontends)
+
+    def signal_sys_event(self, event, **kwargs):
+        # Let the other servers know about a change that was made
+        # by this one.
+        if event == 'schema-changes':
+            self._on_schema_change()
+
+        if self._sys_events_task is None:
+            return
+
+        self._loop.create_task(self._send_sys_event(event, kwargs))
+
+    async def _send_sys_event(self, event, kwargs):
+        try:
+            version = await self._sys_event_sender.send({
+                'event': event,
+                'origin': self._instance_id,
+                **kwargs,
+            })
+        except Exception:
+            logger.warning(
+                'could not notify other servers of %r', event,
+                exc_info=True)
+        else:
+            if version is not None:
+                self._advance_sys_event_ver(version)
+
+    def _advance_sys_event_ver(self, version):
+        if self._sys_event_ver is None or version > self._sys_event_ver:
+            self._sys_event_ver = version
+
+    async def _check_sys_event_vers(self):
+        try:
+            await self._dbindex.check_sys_event_vers()
+        except Exception:
+            logger.warning(
+                'could not check the databases for changes made by '
+                'other servers', exc_info=True)
+
+    async def _check_sys_event_vers_loop(self):
+        while True:
+            await asyncio.sleep(defines.SYSEVENT_CHECK_INTERVAL)
+            await self._check_sys_event_vers()
+
+    async def _listen_sys_events(self):
+        while True:
+            try:
+                self._sys_pgcon = await self.new_pgcon(
+                    defines.EDGEDB_SUPERUSER_DB)
+                await self._sys_pgcon.simple_query(
+                    b'LISTEN ' + pg_common.quote_ident(
+                        defines.EDGEDB_SYSEVENT_CHANNEL).encode(),
+                    ignore_data=True)
+
+                # Changes made while the listener was not connected
+                # were missed; the version tells if there were any.
+                known_ver = self._sys_event_ver
+                version = await sysevents.get_version(self._sys_pgcon)
+                if version is None or (
+                        known_ver is not None and version > known_ver):
+                    self._on_missed_sys_events()
+                if version is not None:
+                    self._advance_sys_event_ver(version)
+                # The schema changes are versioned per database.
+                self._loop.create_task(self._check_sys_event_vers())
+
+                await self._sys_pgcon.listen_for_notifications(
+                    self._on_sys_event)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning(
+                    'lost the connection listening for changes made by '
+                    'other servers; reconnecting', exc_info=True)
+            finally:
+                if self._sys_pgcon is not None:
+                    self._sys_pgcon.terminate()
+                    self._sys_pgcon = None
+
+            await asyncio.sleep(defines.SYSEVENT_RECONNECT_INTERVAL)
+
+    def _on_missed_sys_events(self):
+        self._on_schema_change()
+        self._dbindex.on_remote_schema_change(None)
+        self._loop.create_task(self._on_remote_system_config_change())
+
+    def _on_sys_event(self, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning('invalid system event: %r', payload)
+            return
+
+        if event.get('origin') == self._instance_id:
+            return
+
+        version = event.get('version')
+        if version is not None:
+            # Notifications of different servers can arrive out of
+            # order, so the event is applied even if it is older
+            # than the known version.
+            self._advance_sys_event_ver(version)
+
+        if event['event'] == 'schema-changes':
+            self._on_schema_change()
+            self._dbindex.on_remote_schema_change(event['dbname'])
+        elif event['event'] == 'system-config-changes':
+            self._loop.create_task(self._on_remote_system_config_change())
+        else:
+            logger.warning('unknown system event: %r', payload)
+
+    async def _on_remote_system_config_change(self):
+        old_config = self._dbindex.get_sys_config()
+        try:
+            await self._dbindex.reload_config()
+        except Exception:
+            logger.warning(
+                'could not reload the system config', exc_info=True)
+            return
+        new_config = self._dbindex.get_sys_config()
+
+        old_ports = set(old_config.get('ports', ()))
+        new_ports = set(new_config.get('ports', ()))
+        for portconf in old_ports - new_ports:
+            await self._stop_portconf(portconf)
+        for portconf in new_ports - old_ports:
+            await self._start_portconf(portconf, suppress_errors=True)
+
+        nethost = self._mgmt_host_addr
+        netport = self._mgmt_port_no
+        if (old_config.get('listen_addresses') !=
+                new_config.get('listen_addresses')):
+            nethost = new_config.get('listen_addresses') or 'localhost'
+        if old_config.get('listen_port') != new_config.get('listen_port'):
+            netport = new_config.get('listen_port', defines.EDGEDB_PORT)
+
+        if (nethost, netport) != (self._mgmt_host_addr, self._mgmt_port_no):
+            try:
+                await self._restart_mgmt_port(nethost, netport)
+            except Exception:
+                logger.error(
+                    'could not restart the server on %s:%s',
+                    nethost, netport, exc_info=True)
+
+        self._populate_sys_auth()
+        self._populate_slow_query_threshold()
+
+    def warm_up_queries(self, dbname, dbver, keys):
+        # Only the binary protocol connections share the compiled
+        # queries cache of the database.
+        if self._mgmt_port is not None:
+            self._mgmt_port.warm_up_queries(dbname, dbver, keys)
+
     async def new_compiler(self, dbname, dbver):
         compiler_worker = await self._compiler_manager.spawn_worker()
         try:
@@ -182,10 +609,14 @@ class Server:
             protocol=portconf.protocol,
             concurrency=portconf.concurrency)
 
+        # Make room for the connections of the port before it
+        # opens them.
+        self._update_pool_capacity(reserve=portconf.concurrency)
         try:
             await port.start()
         except Exception as ex:
             await port.stop()
+            self._update_pool_capacity()
             if suppress_errors:
                 logging.error(
                     'failed to start port for config: %r', portconf,
@@ -206,6 +637,7 @@ class Server:
         try:
             port = self._sys_conf_ports.pop(portconf)
             await port.stop()
+            self._update_pool_capacity()
         except Exception:
             logging.error(
                 'failed to stop port for config: %r', portconf,
@@ -253,15 +685,52 @@ class Server:
 
     async def _after_system_config_set(self, setting_name, value):
         # CONFIGURE SYSTEM SET setting_name := value;
-        pass
+        if setting_name == 'slow_query_log_threshold':
+            self._populate_slow_query_threshold()
 
     async def _after_system_config_reset(self, setting_name):
         # CONFIGURE SYSTEM RESET setting_name;
-        pass
+        if setting_name == 'slow_query_log_threshold':
+            self._populate_slow_query_threshold()
 
     def get_datadir(self):
         return self._pg_data_dir
 
+    def persistent_query_cache_enabled(self):
+        return self._persistent_query_cache
+
+    async def _save_persisted_queries_loop(self):
+        while True:
+            await asyncio.sleep(defines._PERSISTED_QUERIES_SAVE_INTERVAL)
+            await self._dbindex.save_persisted_queries()
+
+    def get_query_stats(self):
+        return self._query_stats
+
+    def _prepare_query_stats_dir(self):
+        os.makedirs(self._query_stats_dir, exist_ok=True)
+        if not self.is_primary_frontend():
+            return
+
+        # Remove the statistics of the frontends of the previous
+        # runs that this one doesn't have.
+        current = {f'{i}.json' for i in range(self._frontends)}
+        for fn in os.listdir(self._query_stats_dir):
+            if fn.endswith('.json') and fn not in current:
+                os.unlink(os.path.join(self._query_stats_dir, fn))
+
+    async def _save_query_stats(self):
+        try:
+            await self._query_stats.save(os.path.join(
+                self._query_stats_dir, f'{self._frontend_id}.json'))
+        except Exception:
+            logger.warning('could not save query statistics', exc_info=True)
+
+    async def _save_query_stats_loop(self):
+        while True:
+            await self._save_query_stats()
+            await asyncio.sleep(defines._QUERY_STATS_SAVE_INTERVAL)
+
     def add_port(self, portcls, **kwargs):
         if self._serving:
             raise RuntimeError(
@@ -271,6 +740,63 @@ class Server:
         self._ports.append(port)
         return port
 
+    def get_trace_exporter(self):
+        return self._trace_exporter
+
+    def _collect_metrics(self):
+        pools = [('primary', self._pg_pool)]
+        for i, replica in enumerate(self._replicas):
+            pools.append((f'replica-{i}', replica.pool))
+        for name, pool in pools:
+            stats = pool.get_stats()
+            idle = stats['idle']
+            metrics.backend_connections.set(
+                stats['current_capacity'] - idle, name, 'active')
+            metrics.backend_connections.set(idle, name, 'idle')
+            metrics.backend_connections_max.set(stats['max_capacity'], name)
+            metrics.backend_connection_waiters.set(stats['waiters'], name)
+
+        if self._mgmt_port is None:
+            return
+
+        parse_stats = self._mgmt_port.get_parse_stats()
+        metrics.backend_parse.set_total(parse_stats['backend'], 'backend')
+        metrics.backend_parse.set_total(parse_stats['skipped'], 'skipped')
+
+        compiler_pool = self._mgmt_port.get_compiler_pool()
+        if compiler_pool is not None:
+            stats = compiler_pool.get_stats()
+            metrics.compiler_workers.set(
+                stats['workers'] - stats['free'], 'busy')
+            metrics.compiler_workers.set(stats['free'], 'free')
+            metrics.compiler_waiters.set(stats['waiters'])
+            for event in ('spawned', 'killed', 'recycled'):
+                metrics.compiler_events.set_total(stats[event], event)
+
+    async def _start_metrics_port(self):
+        metrics.registry.add_collector(self._collect_metrics)
+        port = metrics_port.MetricsPort(
+            loop=self._loop,
+            nethost=self._mgmt_host_addr,
+            netport=self._metrics_port_no,
+            registry=metrics.registry,
+        )
+        try:
+            await port.start()
+        except Exception:
+            metrics.registry.remove_collector(self._collect_metrics)
+            raise
+        self._metrics_port = port
+        logger.info('Serving metrics on port %s', self._metrics_port_no)
+
+    async def _stop_metrics_port(self):
+        if self._metrics_port is None:
+            return
+        metrics.registry.remove_collector(self._collect_metrics)
+        port = self._metrics_port
+        self._metrics_port = None
+        await port.stop()
+
     async def start(self):
         # Make sure that EdgeQL parser is preloaded; edgecon might use
         # it to restore config values.
@@ -286,11 +812,59 @@ class Server:
             for portconf in sys_config['ports']:
                 await self._start_portconf(portconf, suppress_errors=True)
 
+        self._sys_events_task = self._loop.create_task(
+            self._listen_sys_events())
+        self._check_sys_event_vers_task = self._loop.create_task(
+            self._check_sys_event_vers_loop())
+
+        if self._replicas:
+            self._replicas_task = self._loop.create_task(
+                self._monitor_replicas())
+
+        if self._metrics_port_no is not None:
+            await self._start_metrics_port()
+
+        if self._persistent_query_cache:
+            # Save the compiled queries periodically rather than
+            # only on shutdown, so that they survive a crash.
+            self._save_queries_task = self._loop.create_task(
+                self._save_persisted_queries_loop())
+
+        self._prepare_query_stats_dir()
+        self._save_query_stats_task = self._loop.create_task(
+            self._save_query_stats_loop())
+
         self._serving = True
 
     async def stop(self):
         self._serving = False
 
+        if self._sys_events_task is not None:
+            self._sys_events_task.cancel()
+            self._sys_events_task = None
+        if self._check_sys_event_vers_task is not None:
+            self._check_sys_event_vers_task.cancel()
+            self._check_sys_event_vers_task = None
+        self._sys_event_sender.close()
+
+        if self._replicas_task is not None:
+            self._replicas_task.cancel()
+            self._replicas_task = None
+
+        if self._save_queries_task is not None:
+            self._save_queries_task.cancel()
+            self._save_queries_task = None
+            await self._dbindex.save_persisted_queries()
+
+        self._dbindex.stop()
+
+        if self._save_query_stats_task is not None:
+            self._save_query_stats_task.cancel()
+            self._save_query_stats_task = None
+            await self._save_query_stats()
+
+        await self._stop_metrics_port()
+
         async with taskgroup.TaskGroup() as g:
             for port in self._ports:
                 g.create_task(port.stop())
@@ -301,6 +875,17 @@ class Server:
             g.create_task(self._mgmt_port.stop())
             self._mgmt_port = None
 
+        if self._trace_exporter is not None:
+            self._trace_exporter.close()
+
+        self._pg_pool.close()
+        for replica in self._replicas:
+            replica.available = False
+            replica.pool.close()
+            if replica.monitor_con is not None:
+                replica.monitor_con.terminate()
+                replica.monitor_con = None
+
     async def get_auth_method(self, user, database, conn):
         authlist = self._sys_auth
 
@@ -0,0 +1,105 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+import json
+import typing
+
+from edb.pgsql import common as pg_common
+from edb.server.pgcon import errors as pgerror
+
+
+async def get_version(conn) -> typing.Optional[int]:
+    """Return the system event version of the database of *conn*.
+
+    DDL transactions advance the version of their database; it is
+    None if the database has no version sequence.
+    """
+    try:
+        result = await conn.simple_query(
+            b'''SELECT CASE WHEN is_called THEN last_value ELSE 0 END
+                FROM edgedb._sysevent_version''',
+            ignore_data=False)
+    except pgerror.BackendError:
+        return None
+    return int(result[0][0])
+
+
+class SysEventSender:
+    """Notify the other servers using the Postgres cluster of changes.
+
+    The notifications are sent on a dedicated connection to the
+    system database, one at a time and in order: waiting for a pooled
+    connection could take long when the pool is exhausted.  They can't
+    be sent by the transactions making the changes either, since
+    Postgres only delivers notifications to the listeners connected to
+    the same database.
+
+    A notification is only a hint: it is lost if the server stops
+    right after the commit.  Schema changes also advance the version
+    of their database in the DDL transaction, which the other servers
+    check periodically (see DatabaseIndex.check_sys_event_vers.)
+    """
+
+    def __init__(self, *, connect, channel: str):
+        self._connect = connect
+        self._channel = channel
+        self._conn = None
+        self._lock = asyncio.Lock()
+
+    async def send(self, event: dict) -> typing.Optional[int]:
+        """Send *event* and return its system event version.
+
+        The version is None if the instance has no version sequence.
+        """
+        async with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = await self._connect()
+                return await self._send(self._conn, event)
+            except BaseException:
+                # The connection could be in any state; a new one
+                # is opened for the next event.
+                self.close()
+                raise
+
+    async def _send(self, conn, event):
+        try:
+            result = await conn.simple_query(
+                b"SELECT nextval('edgedb._sysevent_version')",
+                ignore_data=False)
+        except pgerror.BackendError:
+            # Instances bootstrapped by older versions of the
+            # server don't have the sequence.
+            version = None
+        else:
+            version = int(result[0][0])
+
+        payload = json.dumps({**event, 'version': version})
+        query = (
+            f'SELECT pg_notify({pg_common.quote_literal(self._channel)}, '
+            f'{pg_common.quote_literal(payload)})'
+        ).encode()
+        await conn.simple_query(query, ignore_data=True)
+        return version
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.terminate()
+            self._conn = None
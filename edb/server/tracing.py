@@ -0,0 +1,130 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Timing breakdown of the processing of protocol messages.
+
+A client requests a trace of a Parse, Execute or OptimisticExecute
+message with the TRACE header; the trace is returned as JSON in the
+TRACE header of the ParseComplete or CommandComplete message that
+completes it.  When the server is started with a trace exporter, all
+such messages are traced and passed to the exporter.
+"""
+
+
+import json
+import logging
+import time
+import uuid
+
+
+logger = logging.getLogger('edb.server')
+
+
+class Span:
+
+    __slots__ = ('name', 'start', 'duration')
+
+    def __init__(self, name, start, duration):
+        # Seconds since the start of the trace.
+        self.name = name
+        self.start = start
+        self.duration = duration
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+        }
+
+
+class Trace:
+
+    def __init__(self, name, *, reply):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        # True if the client has requested the trace.
+        self.reply = reply
+        self.start_time = time.time()
+        self.duration = None
+        self.attrs = {}
+        self.spans = []
+        self._start = time.monotonic()
+
+    def add_span(self, name, start, end):
+        """Record a span; *start* and *end* are time.monotonic() values."""
+        self.spans.append(Span(name, start - self._start, end - start))
+
+    def add_compile_spans(self, start, timings):
+        """Record the stages of a compilation started at *start*.
+
+        *timings* are the QueryUnit.compile_timings measured by the
+        compiler process; they are placed relative to the moment the
+        compilation was requested, so their start is approximate.
+        """
+        offset = start - self._start
+        for stage, stage_start, duration in timings:
+            self.spans.append(
+                Span(f'compile.{stage}', offset + stage_start, duration))
+
+    def finish(self):
+        self.duration = time.monotonic() - self._start
+
+    def as_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'attrs': self.attrs,
+            'spans': [span.as_dict() for span in self.spans],
+        }
+
+    def as_json(self):
+        return json.dumps(self.as_dict())
+
+
+class Exporter:
+    """Base class of trace exporters."""
+
+    def export(self, trace):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileExporter(Exporter):
+    """Append traces to a file, one JSON object per line."""
+
+    def __init__(self, path):
+        self._path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def export(self, trace):
+        try:
+            # One write per trace: several server processes can
+            # append to the same file.
+            self._file.write(trace.as_json() + '\n')
+            self._file.flush()
+        except OSError:
+            logger.exception('could not write trace to %r', self._path)
+
+    def close(self):
+        self._file.close()
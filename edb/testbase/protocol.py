@@ -0,0 +1,263 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""A minimal client of the binary protocol.
+
+The client library doesn't expose the protocol features that are
+only used by some drivers (named prepared statements, pipelining,
+fetching results in batches), so the tests of these features send
+the protocol messages themselves.
+"""
+
+
+import asyncio
+import struct
+import typing
+
+import edgedb
+from edgedb import scram
+
+
+HEADER_ROW_LIMIT = 0xFF10
+
+# Arguments of a query without parameters: an empty tuple.
+NO_ARGS = struct.pack('!i', 0)
+
+AUTH_OK = 0
+AUTH_SASL = 10
+AUTH_SASL_CONTINUE = 11
+AUTH_SASL_FINAL = 12
+
+
+class Message(typing.NamedTuple):
+
+    mtype: bytes
+    data: bytes
+
+
+class MessageReader:
+
+    def __init__(self, data: bytes):
+        self._data = data
+        self._pos = 0
+
+    def read_bytes(self, n: int) -> bytes:
+        data = self._data[self._pos:self._pos + n]
+        if len(data) != n:
+            raise AssertionError('unexpected end of message')
+        self._pos += n
+        return data
+
+    def read_byte(self) -> bytes:
+        return self.read_bytes(1)
+
+    def read_int16(self) -> int:
+        return struct.unpack('!h', self.read_bytes(2))[0]
+
+    def read_int32(self) -> int:
+        return struct.unpack('!i', self.read_bytes(4))[0]
+
+    def read_int64(self) -> int:
+        return struct.unpack('!q', self.read_bytes(8))[0]
+
+    def read_len_prefixed_bytes(self) -> bytes:
+        return self.read_bytes(self.read_int32())
+
+    def read_headers(self) -> typing.Dict[int, bytes]:
+        headers = {}
+        for _ in range(self.read_int16()):
+            key = struct.unpack('!H', self.read_bytes(2))[0]
+            headers[key] = self.read_len_prefixed_bytes()
+        return headers
+
+
+def _message(mtype: bytes, *parts: bytes) -> bytes:
+    data = b''.join(parts)
+    return mtype + struct.pack('!i', len(data) + 4) + data
+
+
+def _len_prefixed(data: bytes) -> bytes:
+    return struct.pack('!i', len(data)) + data
+
+
+def _headers(headers: typing.Optional[typing.Dict[int, bytes]]) -> bytes:
+    headers = headers or {}
+    return struct.pack('!h', len(headers)) + b''.join(
+        struct.pack('!H', key) + _len_prefixed(value)
+        for key, value in headers.items())
+
+
+def prepare(query: str, *, stmt_name: bytes = b'',
+            json_mode: bool = False, expect_one: bool = False) -> bytes:
+    return _message(
+        b'P',
+        _headers(None),
+        b'j' if json_mode else b'b',
+        b'o' if expect_one else b'm',
+        _len_prefixed(stmt_name),
+        _len_prefixed(query.encode()),
+    )
+
+
+def describe(*, stmt_name: bytes = b'') -> bytes:
+    return _message(b'D', _headers(None), b'T', _len_prefixed(stmt_name))
+
+
+def execute(*, stmt_name: bytes = b'', args: bytes = NO_ARGS,
+            row_limit: typing.Optional[int] = None) -> bytes:
+    headers = {}
+    if row_limit is not None:
+        headers[HEADER_ROW_LIMIT] = struct.pack('!i', row_limit)
+    return _message(
+        b'E', _headers(headers), _len_prefixed(stmt_name),
+        _len_prefixed(args))
+
+
+def fetch_more(row_limit: int) -> bytes:
+    return _message(b'M', _headers(None), struct.pack('!i', row_limit))
+
+
+def close(stmt_name: bytes) -> bytes:
+    return _message(b'C', _headers(None), _len_prefixed(stmt_name))
+
+
+def execute_script(script: str) -> bytes:
+    return _message(b'Q', _headers(None), _len_prefixed(script.encode()))
+
+
+def sync() -> bytes:
+    return _message(b'S')
+
+
+def parse_error(msg: Message) -> edgedb.EdgeDBError:
+    assert msg.mtype == b'E', msg
+    reader = MessageReader(msg.data)
+    reader.read_byte()  # severity
+    code = reader.read_int32()
+    message = reader.read_len_prefixed_bytes().decode()
+    return edgedb.EdgeDBError._from_code(code, message)
+
+
+def parse_data(msg: Message) -> typing.List[bytes]:
+    """Return the encoded elements of a Data message."""
+    assert msg.mtype == b'D', msg
+    reader = MessageReader(msg.data)
+    return [reader.read_len_prefixed_bytes()
+            for _ in range(reader.read_int16())]
+
+
+class Connection:
+
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def connect(cls, *, host, port, user, password, database,
+                      **kwargs) -> 'Connection':
+        reader, writer = await asyncio.open_connection(host, port)
+        con = cls(reader, writer)
+        try:
+            await con._connect(user, password, database)
+        except BaseException:
+            con.close()
+            raise
+        return con
+
+    async def _connect(self, user, password, database):
+        self.send(
+            _message(b'V', struct.pack('!hhh', 1, 0, 0)),
+            _message(b'0', _len_prefixed(user.encode()),
+                     _len_prefixed(database.encode())),
+        )
+
+        while True:
+            msg = await self.recv()
+            if msg.mtype == b'R':
+                reader = MessageReader(msg.data)
+                status = reader.read_int32()
+                if status == AUTH_SASL:
+                    await self._auth_scram(user, password)
+                elif status != AUTH_OK:
+                    raise AssertionError(
+                        f'unexpected authentication method {status}')
+            elif msg.mtype == b'E':
+                raise parse_error(msg)
+            elif msg.mtype == b'Z':
+                return
+
+    async def _auth_scram(self, user, password):
+        client_nonce = scram.generate_nonce()
+        client_first, client_first_bare = scram.build_client_first_message(
+            client_nonce, user)
+        self.send(_message(
+            b'p', _len_prefixed(b'SCRAM-SHA-256'),
+            _len_prefixed(client_first.encode())))
+
+        reader = MessageReader((await self.expect(b'R')).data)
+        assert reader.read_int32() == AUTH_SASL_CONTINUE
+        server_first = reader.read_len_prefixed_bytes()
+
+        server_nonce, salt, itercount = (
+            scram.parse_server_first_message(server_first))
+        client_final, expected_server_sig = scram.build_client_final_message(
+            password, salt, itercount, client_first_bare.encode(),
+            server_first, server_nonce)
+        self.send(_message(b'p', _len_prefixed(client_final.encode())))
+
+        reader = MessageReader((await self.expect(b'R')).data)
+        assert reader.read_int32() == AUTH_SASL_FINAL
+        server_sig = scram.parse_server_final_message(
+            reader.read_len_prefixed_bytes())
+        if server_sig != expected_server_sig:
+            raise AssertionError('server SCRAM proof does not match')
+
+    def send(self, *messages: bytes):
+        self._writer.write(b''.join(messages))
+
+    async def recv(self) -> Message:
+        """Return the next message, skipping log and status messages."""
+        while True:
+            header = await self._reader.readexactly(5)
+            mtype, length = struct.unpack('!ci', header)
+            data = await self._reader.readexactly(length - 4)
+            if mtype not in (b'L', b'S'):
+                return Message(mtype, data)
+
+    async def expect(self, mtype: bytes) -> Message:
+        msg = await self.recv()
+        if msg.mtype == b'E' and mtype != b'E':
+            raise parse_error(msg)
+        if msg.mtype != mtype:
+            raise AssertionError(
+                f'expected message {mtype!r}, got {msg.mtype!r}')
+        return msg
+
+    async def recv_until_sync(self) -> typing.List[Message]:
+        """Return the messages up to and including ReadyForCommand."""
+        messages = []
+        while True:
+            msg = await self.recv()
+            messages.append(msg)
+            if msg.mtype == b'Z':
+                return messages
+
+    def close(self):
+        self._writer.close()
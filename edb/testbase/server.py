@@ -40,6 +40,7 @@ from edb.server import defines as edgedb_defines
 
 from edb.common import taskgroup
 
+from edb.testbase import protocol
 from edb.testbase import serutils
 
 
@@ -265,6 +266,17 @@ class ConnectedTestCaseMixin:
             cluster=cluster, database=database, user=user, password=password)
         return await edgedb.async_connect(**conargs)
 
+    @classmethod
+    async def connect_protocol(cls, *,
+                               cluster=None,
+                               database=edgedb_defines.EDGEDB_SUPERUSER_DB,
+                               user=edgedb_defines.EDGEDB_SUPERUSER,
+                               password='test'):
+        # A connection that sends the protocol messages as is.
+        conargs = cls.get_connect_args(
+            cluster=cluster, database=database, user=user, password=password)
+        return await protocol.Connection.connect(**conargs)
+
     @classmethod
     def get_connect_args(cls, *,
                          cluster=None,
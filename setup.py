@@ -485,6 +485,12 @@ setuptools.setup(
             extra_compile_args=EXT_CFLAGS,
             extra_link_args=EXT_LDFLAGS),
 
+        distutils_extension.Extension(
+            "edb.server.cache.query_cache",
+            ["edb/server/cache/query_cache.pyx"],
+            extra_compile_args=EXT_CFLAGS,
+            extra_link_args=EXT_LDFLAGS),
+
         distutils_extension.Extension(
             "edb.server.pgcon.pgcon",
             ["edb/server/pgcon/pgcon.pyx"],
@@ -508,6 +514,12 @@ setuptools.setup(
             ["edb/server/http_graphql_port/protocol.pyx"],
             extra_compile_args=EXT_CFLAGS,
             extra_link_args=EXT_LDFLAGS),
+
+        distutils_extension.Extension(
+            "edb.server.metrics_port.protocol",
+            ["edb/server/metrics_port/protocol.pyx"],
+            extra_compile_args=EXT_CFLAGS,
+            extra_link_args=EXT_LDFLAGS),
     ],
     install_requires=RUNTIME_DEPS,
     extras_require=EXTRA_DEPS,
@@ -0,0 +1,89 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import textwrap
+import unittest
+
+from edb.common import prometheus
+
+
+class TestPrometheus(unittest.TestCase):
+
+    def test_prometheus_counter_01(self):
+        r = prometheus.Registry(prefix='test_')
+        c = r.new_counter('requests_total', 'Requests.',
+                          labels=('status',))
+        c.inc(1.0, '200')
+        c.inc(2.0, '200')
+        c.inc(1.0, '404')
+
+        self.assertEqual(r.generate(), textwrap.dedent('''\
+            # HELP test_requests_total Requests.
+            # TYPE test_requests_total counter
+            test_requests_total{status="200"} 3
+            test_requests_total{status="404"} 1
+        '''))
+
+    def test_prometheus_counter_02(self):
+        r = prometheus.Registry()
+        c = r.new_counter('total', 'Total.', labels=('a', 'b'))
+
+        with self.assertRaisesRegex(ValueError, 'expected 2 label values'):
+            c.inc(1.0, 'x')
+
+        with self.assertRaisesRegex(ValueError, 'duplicate metric'):
+            r.new_gauge('total', 'Again.')
+
+    def test_prometheus_gauge_01(self):
+        r = prometheus.Registry()
+        g = r.new_gauge('connections', 'Line one\nline "two".',
+                        labels=('pool',))
+
+        state = {'active': 5}
+        r.add_collector(
+            lambda: g.set(state['active'], 'primary "1"'))
+
+        self.assertEqual(r.generate(), textwrap.dedent('''\
+            # HELP connections Line one\\nline "two".
+            # TYPE connections gauge
+            connections{pool="primary \\"1\\""} 5
+        '''))
+
+        state['active'] = 2.5
+        self.assertIn('connections{pool="primary \\"1\\""} 2.5\n',
+                      r.generate())
+
+    def test_prometheus_histogram_01(self):
+        r = prometheus.Registry()
+        h = r.new_histogram('duration_seconds', 'Duration.',
+                            buckets=(0.5, 0.1, 1.0))
+        h.observe(0.1)
+        h.observe(0.3)
+        h.observe(2.0)
+
+        self.assertEqual(r.generate(), textwrap.dedent('''\
+            # HELP duration_seconds Duration.
+            # TYPE duration_seconds histogram
+            duration_seconds_bucket{le="0.1"} 1
+            duration_seconds_bucket{le="0.5"} 2
+            duration_seconds_bucket{le="1"} 2
+            duration_seconds_bucket{le="+Inf"} 3
+            duration_seconds_sum 2.4
+            duration_seconds_count 3
+        '''))
@@ -0,0 +1,112 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os.path
+import textwrap
+
+from edb.testbase import lang as tb
+
+from edb.edgeql import compiler
+from edb.ir import utils as irutils
+
+
+class TestEdgeQLReadOnlyInference(tb.BaseEdgeQLCompilerTest):
+    """Unit tests for detection of queries that can run on replicas."""
+
+    SCHEMA = os.path.join(os.path.dirname(__file__), 'schemas',
+                          'cards.esdl')
+
+    def run_test(self, *, source, spec, expected):
+        ir = compiler.compile_to_ir(source, self.schema)
+        expected_read_only = {
+            'READ ONLY': True,
+            'READ WRITE': False,
+        }[textwrap.dedent(expected).strip(' \n')]
+        self.assertEqual(irutils.is_read_only(ir), expected_read_only,
+                         'unexpected read-only status:\n' + source)
+
+    def test_edgeql_ir_read_only_01(self):
+        """
+        WITH MODULE test
+        SELECT Card { name, owners: { name } }
+        FILTER .cost > 1
+% OK %
+        READ ONLY
+        """
+
+    def test_edgeql_ir_read_only_02(self):
+        """
+        SELECT count(schema::ObjectType)
+% OK %
+        READ ONLY
+        """
+
+    def test_edgeql_ir_read_only_03(self):
+        """
+        WITH MODULE test
+        INSERT Award { name := 'Gold' }
+% OK %
+        READ WRITE
+        """
+
+    def test_edgeql_ir_read_only_04(self):
+        """
+        WITH MODULE test
+        UPDATE Card
+        FILTER .name = 'Imp'
+        SET { cost := 2 }
+% OK %
+        READ WRITE
+        """
+
+    def test_edgeql_ir_read_only_05(self):
+        """
+        WITH MODULE test
+        DELETE Award
+% OK %
+        READ WRITE
+        """
+
+    def test_edgeql_ir_read_only_06(self):
+        """
+        WITH
+            MODULE test,
+            new := (INSERT Award { name := 'Silver' })
+        SELECT new.name
+% OK %
+        READ WRITE
+        """
+
+    def test_edgeql_ir_read_only_07(self):
+        # The session config is kept in a temporary table, which
+        # only exists on the primary.
+        """
+        SELECT cfg::Config.listen_port
+% OK %
+        READ WRITE
+        """
+
+    def test_edgeql_ir_read_only_08(self):
+        # The query statistics are read from the data directory of
+        # the primary server.
+        """
+        SELECT sys::QueryStats.calls
+% OK %
+        READ WRITE
+        """
@@ -0,0 +1,66 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os.path
+
+from edb.testbase import lang as tb
+
+from edb.edgeql import compiler
+from edb.ir import utils as irutils
+
+
+class TestEdgeQLSchemaObjectIds(tb.BaseEdgeQLCompilerTest):
+    """Unit tests for the schema dependencies of compiled queries."""
+
+    SCHEMA = os.path.join(os.path.dirname(__file__), 'schemas',
+                          'cards.esdl')
+
+    def _get_schema_object_ids(self, source):
+        ir = compiler.compile_to_ir(source, self.schema)
+        return irutils.get_schema_object_ids(ir)
+
+    def test_edgeql_ir_schema_object_ids_01(self):
+        card = self.schema.get('test::Card')
+        award = self.schema.get('test::Award')
+
+        ids = self._get_schema_object_ids("""
+            WITH MODULE test
+            SELECT Card { name }
+            FILTER .cost > 1
+        """)
+
+        self.assertIn(card.id, ids)
+        self.assertIn(card.getptr(self.schema, 'name').id, ids)
+        self.assertIn(card.getptr(self.schema, 'cost').id, ids)
+        self.assertNotIn(card.getptr(self.schema, 'element').id, ids)
+        self.assertNotIn(award.id, ids)
+
+    def test_edgeql_ir_schema_object_ids_02(self):
+        user = self.schema.get('test::User')
+        card = self.schema.get('test::Card')
+
+        ids = self._get_schema_object_ids("""
+            WITH MODULE test
+            SELECT User.deck.element
+        """)
+
+        self.assertIn(user.id, ids)
+        self.assertIn(user.getptr(self.schema, 'deck').id, ids)
+        self.assertIn(card.id, ids)
+        self.assertIn(card.getptr(self.schema, 'element').id, ids)
@@ -25,6 +25,9 @@ from edb.edgeql import qltypes
 
 from edb.schema import links as s_links
 from edb.schema import objtypes as s_objtypes
+from edb.schema import schema as s_schema
+
+from edb.server import compiler as edbcompiler
 
 
 class TestSchema(tb.BaseSchemaLoadTest):
@@ -450,3 +453,147 @@ _123456789_123456789_123456789 -> str
             "constraint 'std::max_len_value' of property 'bar_prop' of "
             "link 'bar' of object type 'test::Object1'",
         )
+
+    def test_schema_changes_01(self):
+        base = self.load_schema("""
+            type Object1 {
+                property foo -> str;
+            };
+            type Object2;
+        """)
+
+        schema = self.run_ddl(base, """
+            CREATE TYPE test::Object3 {
+                CREATE LINK bar -> test::Object1;
+            };
+            ALTER TYPE test::Object1 {
+                DROP PROPERTY foo;
+            };
+            DROP TYPE test::Object2;
+        """)
+
+        changes = schema.get_changes_since(base)
+        self.assertEqual(schema.get_changes_since(schema), {})
+
+        new = base.apply_changes(changes)
+        for attr in s_schema._MAPS:
+            self.assertEqual(
+                dict(getattr(new, attr).items()),
+                dict(getattr(schema, attr).items()),
+                attr)
+
+        self.assertIsNotNone(new.get('test::Object3', None))
+        self.assertIsNone(new.get('test::Object2', None))
+        self.assertIsNotNone(base.get('test::Object2', None))
+
+    def test_schema_changes_02(self):
+        base = self.load_schema("""
+            type Object1 {
+                property foo -> str;
+            };
+            type Object2 {
+                link bar -> Object1;
+            };
+            function hello(a: str) -> str
+                from edgeql $$ SELECT a $$;
+        """)
+
+        schema = self.run_ddl(base, """
+            ALTER TYPE test::Object1 RENAME TO test::Object3;
+            ALTER TYPE test::Object2 {
+                DROP LINK bar;
+                CREATE LINK baz -> test::Object3;
+            };
+            CREATE FUNCTION test::hello(a: int64) -> int64
+                FROM EdgeQL $$ SELECT a $$;
+        """)
+
+        # The changes of a schema derived from the base are found by
+        # the IDs of the changed objects; they are the same as the
+        # changes found by comparing the schemas in full.
+        unrelated = base._replace()
+        unrelated._changelog = s_schema._ChangeLogEntry(None, None)
+
+        def normalize(changes):
+            return {
+                attr: (updated, set(deleted))
+                for attr, (updated, deleted) in changes.items()
+            }
+
+        changes = schema.get_changes_since(base)
+        self.assertEqual(
+            normalize(changes),
+            normalize(schema.get_changes_since(unrelated)))
+        self.assertIn('_shortname_to_id', changes)
+        self.assertIn('_refs_to', changes)
+
+        # The applied changes are tracked too.
+        new = base.apply_changes(changes)
+        self.assertEqual(
+            normalize(new.get_changes_since(base)),
+            normalize(changes))
+
+    def _get_changed_schema_objects(self, base, ddl):
+        schema = self.run_ddl(base, ddl)
+        changes = schema.get_changes_since(base)
+        return edbcompiler.get_changed_schema_objects(base, schema, changes)
+
+    def test_schema_changed_objects_01(self):
+        base = self.load_schema("""
+            type Object1 {
+                property foo -> str;
+            };
+            type Object2 {
+                link bar -> Object1;
+            };
+        """)
+
+        obj1 = base.get('test::Object1')
+        obj2 = base.get('test::Object2')
+
+        # Annotations don't affect compiled queries.
+        changed = self._get_changed_schema_objects(base, """
+            ALTER TYPE test::Object1 {
+                SET ANNOTATION std::description := 'first';
+            };
+        """)
+        self.assertNotIn(obj1.id, changed)
+        self.assertNotIn(obj2.id, changed)
+
+    def test_schema_changed_objects_02(self):
+        base = self.load_schema("""
+            type Object1 {
+                property foo -> str;
+            };
+            type Object2 {
+                link bar -> Object1;
+            };
+        """)
+
+        obj1 = base.get('test::Object1')
+        obj2 = base.get('test::Object2')
+        foo = obj1.getptr(base, 'foo')
+
+        changed = self._get_changed_schema_objects(base, """
+            ALTER TYPE test::Object1 {
+                DROP PROPERTY foo;
+            };
+        """)
+        self.assertIn(foo.id, changed)
+        # The property is a part of its owner type.
+        self.assertIn(obj1.id, changed)
+        self.assertNotIn(obj2.id, changed)
+
+        changed = self._get_changed_schema_objects(base, """
+            ALTER TYPE test::Object1 {
+                CREATE PROPERTY baz -> int64;
+            };
+        """)
+        self.assertIn(obj1.id, changed)
+        self.assertNotIn(obj2.id, changed)
+
+        changed = self._get_changed_schema_objects(base, """
+            DROP TYPE test::Object2;
+        """)
+        self.assertIn(obj2.id, changed)
+        self.assertNotIn(foo.id, changed)
@@ -0,0 +1,107 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+import struct
+import unittest
+
+from edb.server.procpool import amsg
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.written = []
+
+    def writelines(self, data):
+        self.written.append(b''.join(data))
+
+    def write(self, data):
+        self.written.append(data)
+
+
+def frame(req_id, payload):
+    return struct.pack('!IQ', len(payload) + 8, req_id) + payload
+
+
+class TestAmsg(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def make_hub(self):
+        pids = []
+        proto = amsg.HubProtocol(
+            loop=self.loop,
+            on_pid=lambda proto, tr, pid: pids.append(pid))
+        proto.connection_made(FakeTransport())
+        return proto, pids
+
+    def test_amsg_framing_01(self):
+        proto, pids = self.make_hub()
+
+        w1 = self.loop.create_future()
+        w2 = self.loop.create_future()
+        proto.send(1, w1, b'req1')
+        proto.send(2, w2, b'req2')
+
+        self.assertEqual(
+            proto._transport.written,
+            [frame(1, b'req1'), frame(2, b'req2')])
+
+        with self.assertRaisesRegex(RuntimeError, 'already in progress'):
+            proto.send(1, self.loop.create_future(), b'req1')
+
+        # Replies can come out of order and be split at arbitrary
+        # positions, including in the middle of the header.
+        data = (
+            struct.pack('!I', 42) +
+            frame(2, b'reply2') +
+            frame(1, b'reply1' * 1000)
+        )
+        for i in range(0, len(data), 7):
+            proto.data_received(data[i:i + 7])
+
+        self.assertEqual(pids, [42])
+        self.assertEqual(w1.result(), b'reply1' * 1000)
+        self.assertEqual(w2.result(), b'reply2')
+        self.assertEqual(len(proto._buffer), 0)
+
+    def test_amsg_framing_02(self):
+        proto, pids = self.make_hub()
+
+        waiters = {}
+        for req_id in range(1, 4):
+            waiters[req_id] = self.loop.create_future()
+            proto.send(req_id, waiters[req_id], b'')
+
+        proto.data_received(
+            struct.pack('!I', 1) + frame(3, b'') + frame(1, b'x')[:-1])
+        self.assertEqual(waiters[3].result(), b'')
+        self.assertFalse(waiters[1].done())
+
+        proto.data_received(b'x')
+        self.assertEqual(waiters[1].result(), b'x')
+
+        proto.connection_lost(None)
+        with self.assertRaises(ConnectionError):
+            waiters[2].result()
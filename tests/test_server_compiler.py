@@ -0,0 +1,240 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import hashlib
+
+import immutables
+
+from edb import errors
+from edb.server import compiler as edbcompiler
+from edb.server.compiler import compiler as edbcompiler_mod
+from edb.server.compiler import dbstate
+from edb.server.compiler import normalizer
+from edb.server.compiler import schemacache
+from edb.testbase import lang as tb_lang
+from edb.testbase import server as tb
+
+
+def make_compiler():
+    # Only the bookkeeping of the transaction states is tested,
+    # which doesn't need the standard schema or a database.
+    compiler = edbcompiler.Compiler.__new__(edbcompiler.Compiler)
+    compiler._tx_states = {}
+    return compiler
+
+
+def start_tx(compiler):
+    state = dbstate.CompilerConnectionState(
+        1, None, immutables.Map(), immutables.Map(),
+        edbcompiler.Capability.ALL)
+    state.start_tx()
+    compiler._save_state(state)
+    return state.current_tx().id
+
+
+class TestServerCompilerTxState(tb.TestCase):
+
+    async def test_server_compiler_tx_state_01(self):
+        # START TRANSACTION -> error -> ROLLBACK TO SAVEPOINT -> COMMIT,
+        # with the ROLLBACK TO SAVEPOINT compiled by another compiler.
+        pinned = make_compiler()
+        other = make_compiler()
+
+        txid = start_tx(pinned)
+        state = pinned._load_state(txid)
+        sp_id = state.current_tx().declare_savepoint('t1')
+        pinned._save_state(state)
+        self.assertEqual(list(pinned._tx_states), [txid])
+
+        unit, num_remain = await other.try_compile_rollback(
+            1, b'ROLLBACK TO SAVEPOINT t1')
+        self.assertTrue(unit.tx_savepoint_rollback)
+        self.assertEqual(num_remain, 0)
+        self.assertEqual(other._tx_states, {})
+
+        # The server now knows the transaction by the ID of the
+        # savepoint it was rolled back to.
+        state = pinned._load_state(sp_id)
+        self.assertEqual(state.current_tx().id, sp_id)
+        self.assertEqual(list(pinned._tx_states), [sp_id])
+
+        state.commit_tx()
+        pinned._save_state(state)
+        self.assertEqual(pinned._tx_states, {})
+
+    async def test_server_compiler_tx_state_02(self):
+        # START TRANSACTION -> error -> ROLLBACK: the compiler never
+        # sees the end of the transaction, the server discards its
+        # state.
+        pinned = make_compiler()
+        other = make_compiler()
+
+        txid1 = start_tx(pinned)
+        txid2 = start_tx(pinned)
+
+        unit, _ = await other.try_compile_rollback(1, b'ROLLBACK')
+        self.assertTrue(unit.tx_rollback)
+        self.assertEqual(other._tx_states, {})
+
+        await pinned.discard_tx_state(txid1)
+        self.assertEqual(list(pinned._tx_states), [txid2])
+
+        # The state can be found by the ID of its savepoints too.
+        state = pinned._load_state(txid2)
+        sp_id = state.current_tx().declare_savepoint('t1')
+        pinned._save_state(state)
+        await pinned.discard_tx_state(sp_id)
+        self.assertEqual(pinned._tx_states, {})
+
+
+class TestServerCompilerNormalized(tb.TestCase):
+
+    def make_compiler(self, error):
+        def compile(*, ctx, eql):
+            raise error
+
+        compiler = make_compiler()
+        compiler._compile = compile
+        return compiler
+
+    def make_ctx(self, first_extra):
+        return edbcompiler_mod.CompileContext(
+            state=None,
+            output_format=None,
+            expected_cardinality_one=False,
+            stmt_mode=None,
+            first_extra=first_extra)
+
+    async def test_server_compiler_normalized_01(self):
+        # Errors of the normalized query are not reported to the
+        # client: the original query is compiled instead.
+        compiler = self.make_compiler(
+            errors.InvalidTypeError('operator does not exist'))
+        with self.assertRaises(normalizer.NormalizationError):
+            compiler._compile_query(ctx=self.make_ctx(0), eql=b'')
+
+        with self.assertRaises(errors.InvalidTypeError):
+            compiler._compile_query(ctx=self.make_ctx(None), eql=b'')
+
+    async def test_server_compiler_normalized_02(self):
+        # Other errors are not caused by the extracted parameters.
+        compiler = self.make_compiler(
+            errors.InternalServerError('unexpected'))
+        with self.assertRaises(errors.InternalServerError):
+            compiler._compile_query(ctx=self.make_ctx(0), eql=b'')
+
+
+class FakeConnection:
+
+    def __init__(self, row):
+        self.row = row
+
+    async def fetchrow(self, query):
+        return self.row
+
+
+class TestServerCompilerSchemaSnapshot(tb.TestCase):
+
+    VERSION = '1.0-test'
+
+    def make_compiler(self):
+        compiler = make_compiler()
+        compiler._schema_pickler = schemacache.SchemaPickler(
+            tb_lang._load_std_schema())
+        compiler._snapshot_version = self.VERSION
+        return compiler
+
+    def run_ddl(self, compiler, base, ddl):
+        schema = tb_lang.BaseSchemaTest.run_ddl(base, ddl)
+        state = dbstate.CompilerConnectionState(
+            1, base, immutables.Map(), immutables.Map(),
+            edbcompiler.Capability.ALL)
+        ctx = edbcompiler_mod.CompileContext(
+            state=state,
+            output_format=None,
+            expected_cardinality_one=False,
+            stmt_mode=None)
+        unit = dbstate.QueryUnit(
+            dbver=1, sql=(b'SELECT 1;',), status=b'CREATE', has_ddl=True)
+        compiler._publish_schema_changes(
+            ctx, unit, implicit=True, schema=schema)
+        self.assertIs(state.base_schema, schema)
+        return unit
+
+    async def test_server_compiler_schema_snapshot_01(self):
+        compiler = self.make_compiler()
+        base = tb_lang.BaseSchemaTest.load_schema("""
+            type Object1;
+        """)
+        unit = self.run_ddl(compiler, base, """
+            CREATE TYPE test::Object2;
+        """)
+
+        # The hash of the snapshot and the version of the server are
+        # written in the DDL transaction, the snapshot itself is saved
+        # by the server after the commit.
+        self.assertEqual(
+            unit.schema_hash, hashlib.sha256(unit.schema_snapshot).digest())
+        self.assertEqual(unit.sql[0], b'SELECT 1;')
+        # The system event version of the database is advanced in
+        # the same transaction.
+        self.assertIn(b"nextval", unit.sql[1])
+        self.assertIn(b"'edgedb._sysevent_version'", unit.sql[1])
+        snapshot_sql = unit.sql[-1].decode()
+        self.assertIn('edgedb._schema_snapshot', snapshot_sql)
+        self.assertIn(repr(self.VERSION), snapshot_sql)
+        self.assertIn(repr(unit.schema_hash.hex()), snapshot_sql)
+
+        schema = await compiler._load_schema_snapshot(FakeConnection({
+            'version': self.VERSION,
+            'hash': unit.schema_hash,
+            'snapshot': unit.schema_snapshot,
+        }))
+        self.assertIsNotNone(schema.get('test::Object1', None))
+        self.assertIsNotNone(schema.get('test::Object2', None))
+
+    async def test_server_compiler_schema_snapshot_02(self):
+        compiler = self.make_compiler()
+        base = tb_lang.BaseSchemaTest.load_schema("""
+            type Object1;
+        """)
+        unit = self.run_ddl(compiler, base, """
+            CREATE TYPE test::Object2;
+        """)
+        row = {
+            'version': self.VERSION,
+            'hash': unit.schema_hash,
+            'snapshot': unit.schema_snapshot,
+        }
+
+        # No DDL was executed in the database yet.
+        self.assertIsNone(
+            await compiler._load_schema_snapshot(FakeConnection(None)))
+
+        # The snapshot was written by a different build.
+        self.assertIsNone(await compiler._load_schema_snapshot(
+            FakeConnection({**row, 'version': '0.9'})))
+
+        # The server didn't save the snapshot after the commit.
+        self.assertIsNone(await compiler._load_schema_snapshot(
+            FakeConnection({**row, 'snapshot': None})))
+
+        # The snapshot is not the one of the committed schema.
+        self.assertIsNone(await compiler._load_schema_snapshot(
+            FakeConnection({**row, 'hash': b'\x00' * 32})))
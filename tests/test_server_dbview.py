@@ -0,0 +1,339 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os.path
+import pickle
+import tempfile
+import unittest.mock
+
+from edb.testbase import lang as tb
+from edb.testbase import server as tb_server
+
+from edb.edgeql import compiler as ql_compiler
+from edb.ir import utils as irutils
+from edb.server import compiler as edbcompiler
+from edb.server import defines
+from edb.server.compiler import dbstate
+from edb.server.dbview import dbview
+
+
+class FakeConnection:
+
+    def __init__(self, server):
+        self.server = server
+
+    async def simple_query(self, sql, ignore_data):
+        if b'_sysevent_version' in sql:
+            return [[str(self.server.sys_event_ver).encode()]]
+        return self.server.snapshot_rows
+
+
+class FakeServer:
+
+    def __init__(self, datadir, *, persistent_cache=False):
+        self._datadir = datadir
+        self._persistent_cache = persistent_cache
+        self.warmed_up = []
+        self.snapshot_rows = []
+        self.sys_event_ver = 0
+
+    def get_datadir(self):
+        return self._datadir
+
+    def persistent_query_cache_enabled(self):
+        return self._persistent_cache
+
+    async def acquire_pgcon(self, dbname):
+        return FakeConnection(self)
+
+    def release_pgcon(self, dbname, conn):
+        pass
+
+    def propagate_schema_delta(self, dbname, base_dbver, dbver, delta):
+        pass
+
+    def signal_sys_event(self, event, **kwargs):
+        pass
+
+    def warm_up_queries(self, dbname, dbver, keys):
+        self.warmed_up.append((dbname, dbver, keys))
+
+
+def make_datadir():
+    tmpdir = tempfile.TemporaryDirectory()
+    for fn in ('queries.pickle', 'instance_data.pickle'):
+        with open(os.path.join(tmpdir.name, fn), 'wb') as f:
+            pickle.dump({}, f)
+    return tmpdir
+
+
+class TestServerDBView(tb.BaseSchemaLoadTest):
+
+    def setUp(self):
+        self.tmpdir = make_datadir()
+        self.server = FakeServer(self.tmpdir.name)
+        self.index = dbview.DatabaseIndex(self.server)
+        self.db = self.index._get_db('db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _cache_query(self, schema, key, query):
+        ir = ql_compiler.compile_to_ir(query, schema)
+        unit = dbstate.QueryUnit(
+            dbver=self.db._dbver,
+            sql=(b'',),
+            status=b'SELECT',
+            cacheable=True,
+            schema_deps=irutils.get_schema_object_ids(ir),
+        )
+        self.index.cache_compiled_query('db', key, unit)
+
+    def _run_ddl(self, base, ddl):
+        schema = self.run_ddl(base, ddl)
+        changes = schema.get_changes_since(base)
+        unit = dbstate.QueryUnit(
+            dbver=self.db._dbver,
+            sql=(b'',),
+            status=b'DDL',
+            has_ddl=True,
+            schema_delta=b'',
+            changed_schema_objects=edbcompiler.get_changed_schema_objects(
+                base, schema, changes),
+        )
+        self.db._signal_ddl(unit)
+        return schema
+
+    def _get_cached_dbvers(self):
+        return {
+            key: dbver
+            for key, (dbver, _) in self.db._eql_to_compiled.items()
+        }
+
+    def test_server_dbview_invalidate_01(self):
+        schema = self.load_schema("""
+            type Object1 {
+                property foo -> str;
+            };
+            type Object2 {
+                property bar -> str;
+            };
+        """)
+
+        self._cache_query(schema, 'q1', 'SELECT test::Object1 { foo }')
+        self._cache_query(schema, 'q2', 'SELECT test::Object2 { bar }')
+
+        # The DDL doesn't touch the first query: it stays cached,
+        # valid for the new version of the schema.
+        base_dbver = self.db._dbver
+        schema = self._run_ddl(schema, """
+            ALTER TYPE test::Object2 {
+                CREATE PROPERTY baz -> int64;
+            };
+        """)
+        self.assertNotEqual(self.db._dbver, base_dbver)
+        self.assertEqual(self._get_cached_dbvers(), {'q1': self.db._dbver})
+
+        # A query on a type covers its new subtypes.
+        self._run_ddl(schema, """
+            CREATE TYPE test::Object3 EXTENDING test::Object1;
+        """)
+        self.assertEqual(self._get_cached_dbvers(), {})
+
+    def test_server_dbview_invalidate_02(self):
+        schema = self.load_schema("""
+            type Object1 {
+                property foo -> str;
+            };
+            type Object2 {
+                link bar -> Object1;
+            };
+        """)
+
+        self._cache_query(schema, 'q1', 'SELECT test::Object2.bar')
+        self._cache_query(schema, 'q2', 'SELECT test::Object2 { id }')
+
+        # Annotations don't affect compiled queries.
+        schema = self._run_ddl(schema, """
+            ALTER TYPE test::Object1 {
+                SET ANNOTATION std::description := 'first';
+            };
+        """)
+        self.assertEqual(
+            self._get_cached_dbvers(),
+            {'q1': self.db._dbver, 'q2': self.db._dbver})
+
+        # The target of a link is a dependency of the queries
+        # following the link.
+        self._run_ddl(schema, """
+            ALTER TYPE test::Object1 {
+                DROP PROPERTY foo;
+            };
+        """)
+        self.assertEqual(self._get_cached_dbvers(), {'q2': self.db._dbver})
+
+    def test_server_dbview_warm_up_01(self):
+        schema = self.load_schema("""
+            type Object1 {
+                property foo -> str;
+            };
+            type Object2;
+        """)
+
+        for key in ('q1', 'q2', 'q3', 'q4'):
+            self._cache_query(schema, key, 'SELECT test::Object1 { foo }')
+        self._cache_query(schema, 'q5', 'SELECT test::Object2')
+
+        hits = self.db._query_hits
+        hits['q5'] = 100
+        hits['q1'] = 5
+        hits['q2'] = 1
+        hits['q3'] = 10
+        order = list(hits)
+
+        # The stale queries with the most hits are recompiled.
+        with unittest.mock.patch.object(defines, '_MAX_WARM_UP_QUERIES', 2):
+            self._run_ddl(schema, """
+                ALTER TYPE test::Object1 {
+                    CREATE PROPERTY bar -> str;
+                };
+            """)
+
+        self.assertEqual(
+            self.server.warmed_up, [('db', self.db._dbver, ['q3', 'q1'])])
+        # Looking up the hits doesn't promote the queries.
+        self.assertEqual(list(hits), order)
+
+    def test_server_dbview_warm_up_02(self):
+        schema = self.load_schema("""
+            type Object1 {
+                property foo -> str;
+            };
+        """)
+
+        self._cache_query(schema, 'q1', 'SELECT test::Object1 { foo }')
+        self.db._query_hits['q1'] = 1
+        base_dbver = self.db._dbver
+        self._run_ddl(schema, """
+            ALTER TYPE test::Object1 {
+                CREATE PROPERTY bar -> str;
+            };
+        """)
+        self.assertEqual(self._get_cached_dbvers(), {})
+        [(_, dbver, keys)] = self.server.warmed_up
+        self.assertEqual(keys, ['q1'])
+
+        def recompiled(dbver):
+            return dbstate.QueryUnit(
+                dbver=dbver, sql=(b'',), status=b'SELECT', cacheable=True)
+
+        # A query recompiled against an older version of the schema
+        # is not cached...
+        self.index.cache_compiled_query('db', 'q1', recompiled(base_dbver))
+        self.assertEqual(self._get_cached_dbvers(), {})
+
+        # ...the one compiled against the version of the warm-up is.
+        unit = recompiled(dbver)
+        self.index.cache_compiled_query('db', 'q1', unit)
+        self.assertEqual(self._get_cached_dbvers(), {'q1': dbver})
+        self.assertIs(self.db._eql_to_compiled['q1'][1], unit)
+
+
+class TestServerDBViewSchemaHash(tb_server.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = make_datadir()
+        self.server = FakeServer(self.tmpdir.name, persistent_cache=True)
+        with unittest.mock.patch(
+                'edb.server.buildmeta.get_version', return_value='1.0'):
+            self.index = dbview.DatabaseIndex(self.server)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    async def test_server_dbview_schema_hash_01(self):
+        # No DDL was executed in the database yet.
+        self.assertIsNone(await self.index._get_schema_hash('db'))
+
+        self.server.snapshot_rows = [[b'1.0', b'00ff']]
+        self.assertEqual(
+            await self.index._get_schema_hash('db'), b'\x00\xff')
+
+        # The snapshot was written by a different build: the
+        # persisted queries compiled against it are unusable.
+        self.server.snapshot_rows = [[b'0.9', b'00ff']]
+        self.assertIsNone(await self.index._get_schema_hash('db'))
+
+
+class TestServerDBViewSysEvents(tb_server.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = make_datadir()
+        self.server = FakeServer(self.tmpdir.name)
+        self.index = dbview.DatabaseIndex(self.server)
+        self.db = self.index._get_db('db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def _cache_query(self, key):
+        unit = dbstate.QueryUnit(
+            dbver=self.db._dbver, sql=(b'',), status=b'SELECT',
+            cacheable=True)
+        self.index.cache_compiled_query('db', key, unit)
+
+    async def test_server_dbview_sys_event_vers_01(self):
+        self._cache_query('q1')
+
+        # The first check only records the version of the database.
+        await self.index.check_sys_event_vers()
+        self.assertEqual(self.db._sys_event_ver, 0)
+        self.assertIn('q1', self.db._eql_to_compiled)
+
+        await self.index.check_sys_event_vers()
+        self.assertIn('q1', self.db._eql_to_compiled)
+
+        # Another server changed the schema and its notification
+        # was lost.
+        dbver = self.db._dbver
+        self.server.sys_event_ver = 1
+        await self.index.check_sys_event_vers()
+        self.assertEqual(self.db._sys_event_ver, 1)
+        self.assertNotIn('q1', self.db._eql_to_compiled)
+        self.assertGreater(self.db._dbver, dbver)
+
+    async def test_server_dbview_sys_event_vers_02(self):
+        await self.index.check_sys_event_vers()
+
+        # The schema changes made by this server advance the version
+        # too; the caches are not invalidated twice.
+        self.db._signal_ddl(dbstate.QueryUnit(
+            dbver=self.db._dbver, sql=(b'',), status=b'DDL',
+            has_ddl=True))
+        self.assertIsNone(self.db._sys_event_ver)
+        self.server.sys_event_ver = 1
+        self._cache_query('q1')
+
+        await self.index.check_sys_event_vers()
+        self.assertEqual(self.db._sys_event_ver, 1)
+        self.assertIn('q1', self.db._eql_to_compiled)
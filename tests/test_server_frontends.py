@@ -0,0 +1,114 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import glob
+import os
+import time
+
+import click.testing
+import edgedb
+
+from edb.server import cluster as edgedb_cluster
+from edb.server import defines as edgedb_defines
+from edb.server import main as server_main
+from edb.testbase import server as tb
+
+
+class TestServerFrontends(tb.TestCase):
+
+    def run_server_cli(self, *args):
+        runner = click.testing.CliRunner()
+        return runner.invoke(server_main.main, ['-D', '/nonexistent', *args])
+
+    def test_server_frontends_args_01(self):
+        result = self.run_server_cli('--frontends', '0')
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn('--frontends', result.output)
+
+        result = self.run_server_cli('--frontends', 'two')
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn('--frontends', result.output)
+
+    def test_server_frontends_args_02(self):
+        # Every frontend keeps a few backend connections outside of
+        # its pool.
+        result = self.run_server_cli(
+            '--frontends', '30', '--max-backend-connections', '100')
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn('--max-backend-connections is too low', result.output)
+
+    def test_server_frontends_01(self):
+        env = {}
+        if (not os.environ.get('EDGEDB_DEBUG_SERVER') and
+                not os.environ.get('EDGEDB_LOG_LEVEL')):
+            env['EDGEDB_LOG_LEVEL'] = 'silent'
+
+        cluster = edgedb_cluster.TempCluster(env=env, testmode=True)
+        try:
+            cluster.init()
+            cluster.start(port='dynamic', frontends=2)
+            try:
+                cluster.set_superuser_password('test')
+                self._test_frontends(cluster)
+            finally:
+                cluster.stop()
+        finally:
+            cluster.destroy()
+
+    def _test_frontends(self, cluster):
+        # Every frontend has its own internal runstate directory.
+        frontend_dirs = glob.glob(os.path.join(
+            cluster.get_data_dir(), 'internal-*', 'frontend-*'))
+        self.assertEqual(
+            sorted(os.path.basename(d) for d in frontend_dirs),
+            ['frontend-0', 'frontend-1'])
+
+        # The kernel distributes the connections between the
+        # frontends.
+        cons = []
+        try:
+            for _ in range(8):
+                cons.append(cluster.connect(
+                    user=edgedb_defines.EDGEDB_SUPERUSER,
+                    password='test',
+                    database=edgedb_defines.EDGEDB_SUPERUSER_DB))
+
+            for con in cons:
+                self.assertEqual(con.fetchone('SELECT 1'), 1)
+
+            cons[0].execute('CREATE TYPE default::FrontendsSmoke;')
+
+            # The other frontends learn about the schema change
+            # asynchronously.
+            for con in cons:
+                deadline = time.monotonic() + 10
+                while True:
+                    try:
+                        result = con.fetchall(
+                            'SELECT count(default::FrontendsSmoke)')
+                    except edgedb.InvalidReferenceError:
+                        if time.monotonic() > deadline:
+                            raise
+                        time.sleep(0.1)
+                    else:
+                        self.assertEqual(list(result), [0])
+                        break
+        finally:
+            for con in cons:
+                con.close()
@@ -0,0 +1,75 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import struct
+import unittest
+
+from edb.server.compiler import normalizer
+
+
+def arg(data):
+    return struct.pack('!i', len(data)) + data
+
+
+class TestNormalizer(unittest.TestCase):
+
+    def test_server_normalizer_01(self):
+        n1 = normalizer.normalize(
+            b"SELECT User FILTER .name = 'Alice' LIMIT 10")
+        n2 = normalizer.normalize(
+            b"SELECT User  FILTER .name = 'Bob'  # comment\n LIMIT 20")
+
+        self.assertEqual(n1.text, n2.text)
+        self.assertEqual(
+            n1.text,
+            b'SELECT User FILTER . name = <std::str>$0 '
+            b'LIMIT <std::int64>$1')
+        self.assertEqual(n1.first_extra, 0)
+        self.assertEqual(n1.extra_count, 2)
+        self.assertEqual(
+            n2.extra_blob,
+            arg(b'Bob') + arg(struct.pack('!q', 20)))
+
+    def test_server_normalizer_02(self):
+        n = normalizer.normalize(
+            b"SELECT (<str>$0, 1.5, 'a\\tb', r'a\\tb', b'\\x01').0")
+
+        # Extracted parameters are numbered after the query's own;
+        # tuple element references are kept.
+        self.assertEqual(
+            n.text,
+            b'SELECT ( < str > $ 0 , <std::float64>$1 , <std::str>$2 , '
+            b'<std::str>$3 , <std::bytes>$4 ) . 0')
+        self.assertEqual(n.first_extra, 1)
+        self.assertEqual(
+            n.extra_blob,
+            arg(struct.pack('!d', 1.5)) + arg(b'a\tb') + arg(b'a\\tb') +
+            arg(b'\x01'))
+
+    def test_server_normalizer_03(self):
+        for eql in [b'SELECT <str>$0',
+                    b"SELECT <str>$name ++ 'a'",
+                    b"SELECT 'a'; SELECT 'b'",
+                    b"CONFIGURE SESSION SET foo := 1",
+                    b"WITH MODULE test CREATE TYPE Foo { SET bar := 'a' }",
+                    b'SELECT 99999999999999999999',
+                    b'SELECT 1.5n',
+                    b"SELECT 'unterminated"]:
+            with self.subTest(eql=eql):
+                self.assertIsNone(normalizer.normalize(eql))
@@ -0,0 +1,97 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from edb.server.cache import persistent_cache
+
+
+class TestPersistentQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def new_cache(self, version='1.0', maxsize=10):
+        return persistent_cache.PersistentQueryCache(
+            self.tmpdir.name, version, maxsize=maxsize)
+
+    def test_server_persistent_cache_01(self):
+        cache = self.new_cache(maxsize=2)
+        self.assertEqual(cache.load('db', b'h1'), [])
+
+        entries = [(b'SELECT 1', 'q1'), (b'SELECT 2', 'q2'),
+                   (b'SELECT 3', 'q3')]
+        cache.store('db', b'h1', entries)
+
+        # Only the most recently used queries are persisted.
+        self.assertEqual(self.new_cache().load('db', b'h1'), entries[1:])
+        self.assertEqual(cache.load('other', b'h1'), [])
+
+        # Queries compiled against another schema or by another
+        # version of the server are ignored.
+        self.assertEqual(cache.load('db', b'h2'), [])
+        self.assertEqual(self.new_cache('2.0').load('db', b'h1'), [])
+
+    def test_server_persistent_cache_02(self):
+        cache = self.new_cache()
+        cache.store('db', b'h1', [(b'SELECT 1', 'q1')])
+
+        path, = (os.path.join(self.tmpdir.name, fn)
+                 for fn in os.listdir(self.tmpdir.name))
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+
+        with self.assertLogs('edb.server', level='WARNING'):
+            self.assertEqual(cache.load('db', b'h1'), [])
+        self.assertFalse(os.path.exists(path))
+
+    def test_server_persistent_cache_03(self):
+        cache = self.new_cache()
+
+        with mock.patch('os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                cache.store('db', b'h1', [(b'SELECT 1', 'q1')])
+        # The temporary file is removed.
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+        # Frontends storing the queries of the same database don't
+        # share temporary files.
+        tmp_paths = []
+        real_replace = os.replace
+
+        def replace(src, dst):
+            tmp_paths.append(src)
+            real_replace(src, dst)
+
+        with mock.patch('os.replace', side_effect=replace):
+            self.new_cache().store('db', b'h1', [(b'SELECT 1', 'q1')])
+            self.new_cache().store('db', b'h1', [(b'SELECT 2', 'q2')])
+        self.assertEqual(len(set(tmp_paths)), 2)
+
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 1)
+        self.assertEqual(cache.load('db', b'h1'), [(b'SELECT 2', 'q2')])
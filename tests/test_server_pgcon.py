@@ -0,0 +1,107 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+
+from edb.server.mng_port import edgecon
+from edb.server.pgcon import pgcon
+from edb.testbase import server as tb
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.reading = True
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+
+class FakeServer:
+
+    def get_trace_exporter(self):
+        return None
+
+    def get_query_stats(self):
+        return None
+
+
+class FakePort:
+
+    def __init__(self, loop):
+        self._loop = loop
+
+    def new_edgecon_id(self):
+        return 1
+
+    def get_loop(self):
+        return self._loop
+
+    def get_server(self):
+        return FakeServer()
+
+    def get_compiler_pool(self):
+        return None
+
+
+class TestServerPGConBackpressure(tb.TestCase):
+
+    def make_connections(self):
+        loop = asyncio.get_running_loop()
+        con = edgecon.EdgeConnection(FakePort(loop))
+        pgconn = pgcon.PGProto('db', loop, None)
+        transport = FakeTransport()
+        pgconn.connection_made(transport)
+        return con, pgconn, transport
+
+    async def test_server_pgcon_backpressure_01(self):
+        con, pgconn, transport = self.make_connections()
+
+        # The client is reading fast enough.
+        await asyncio.wait_for(pgconn.wait_for_client(con), 1)
+        self.assertTrue(transport.reading)
+
+        # The write buffer of the client connection is full: the
+        # results are not read from Postgres until it is drained.
+        con.pause_writing()
+        waiter = asyncio.create_task(pgconn.wait_for_client(con))
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiter.done())
+        self.assertFalse(transport.reading)
+
+        con.resume_writing()
+        await asyncio.wait_for(waiter, 1)
+        self.assertTrue(transport.reading)
+
+    async def test_server_pgcon_backpressure_02(self):
+        con, pgconn, transport = self.make_connections()
+
+        con.pause_writing()
+        waiter = asyncio.create_task(pgconn.wait_for_client(con))
+        await asyncio.sleep(0.01)
+        self.assertFalse(transport.reading)
+
+        # The client is gone; the query is aborted.
+        con.connection_lost(None)
+        with self.assertRaises(ConnectionAbortedError):
+            await asyncio.wait_for(waiter, 1)
+        self.assertTrue(transport.reading)
@@ -0,0 +1,160 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+
+from edb.server import pgpool
+from edb.testbase import server as tb
+
+
+class FakeConnection:
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+        self.connected = True
+        self.tx = False
+
+    def is_connected(self):
+        return self.connected
+
+    def in_tx(self):
+        return self.tx
+
+    def terminate(self):
+        self.connected = False
+
+
+class TestServerPgPool(tb.TestCase):
+
+    def make_pool(self, max_capacity):
+        async def connect(dbname):
+            await asyncio.sleep(0)
+            con = FakeConnection(dbname)
+            connected.append(con)
+            return con
+
+        connected = []
+        pool = pgpool.Pool(
+            connect=connect,
+            max_capacity=max_capacity,
+            loop=asyncio.get_running_loop())
+        return pool, connected
+
+    async def test_server_pgpool_01(self):
+        pool, connected = self.make_pool(2)
+
+        con1 = await pool.acquire('db1')
+        pool.release('db1', con1)
+
+        con2 = await pool.acquire('db1')
+        self.assertIs(con1, con2)
+        self.assertEqual(len(connected), 1)
+
+        con3 = await pool.acquire('db1')
+        self.assertIsNot(con2, con3)
+        self.assertEqual(pool.current_capacity, 2)
+
+        pool.release('db1', con2)
+        pool.release('db1', con3)
+        self.assertEqual(pool.idle_count, 2)
+
+        pool.close()
+        self.assertFalse(con2.is_connected())
+        self.assertFalse(con3.is_connected())
+
+    async def test_server_pgpool_02(self):
+        # Acquiring a connection to another database closes an idle one
+        # when the pool is at capacity.
+        pool, connected = self.make_pool(1)
+
+        con1 = await pool.acquire('db1')
+        pool.release('db1', con1)
+
+        con2 = await pool.acquire('db2')
+        self.assertEqual(con2.dbname, 'db2')
+        self.assertFalse(con1.is_connected())
+        self.assertEqual(pool.current_capacity, 1)
+
+        pool.release('db2', con2)
+        pool.close()
+
+    async def test_server_pgpool_03(self):
+        # Waiters are woken up when a connection is released.
+        pool, connected = self.make_pool(1)
+
+        con1 = await pool.acquire('db1')
+        waiter = asyncio.ensure_future(pool.acquire('db1'))
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiter.done())
+
+        pool.release('db1', con1)
+        con2 = await asyncio.wait_for(waiter, 1)
+        self.assertIs(con1, con2)
+
+        pool.release('db1', con2)
+        pool.close()
+
+    async def test_server_pgpool_04(self):
+        # Connections released in a transaction, or explicitly
+        # discarded, are not reused.
+        pool, connected = self.make_pool(2)
+
+        con1 = await pool.acquire('db1')
+        con1.tx = True
+        pool.release('db1', con1)
+        self.assertFalse(con1.is_connected())
+        self.assertEqual(pool.current_capacity, 0)
+
+        con2 = await pool.acquire('db1')
+        pool.release('db1', con2, discard=True)
+        self.assertFalse(con2.is_connected())
+        self.assertEqual(pool.current_capacity, 0)
+        self.assertEqual(pool.idle_count, 0)
+
+        pool.close()
+
+    async def test_server_pgpool_05(self):
+        # Lowering the limit closes the connections over it; raising
+        # it wakes up the waiters.
+        pool, connected = self.make_pool(2)
+
+        con1 = await pool.acquire('db1')
+        con2 = await pool.acquire('db1')
+        pool.release('db1', con1)
+
+        pool.set_max_capacity(1)
+        self.assertFalse(con1.is_connected())
+        self.assertEqual(pool.current_capacity, 1)
+
+        waiter = asyncio.ensure_future(pool.acquire('db1'))
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiter.done())
+
+        pool.set_max_capacity(2)
+        con3 = await asyncio.wait_for(waiter, 1)
+        self.assertEqual(pool.current_capacity, 2)
+
+        pool.set_max_capacity(1)
+        pool.release('db1', con2)
+        self.assertFalse(con2.is_connected())
+        self.assertEqual(pool.current_capacity, 1)
+
+        pool.release('db1', con3)
+        self.assertTrue(con3.is_connected())
+        pool.close()
@@ -0,0 +1,245 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+import os
+import tempfile
+import time
+
+import psutil
+
+from edb.server.procpool import pool as procpool
+from edb.testbase import server as tb
+
+
+class FakeWorker:
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._closed = False
+        self._requests = 0
+        self._pins = 0
+        self._last_used = time.monotonic()
+        self.rss = 0
+
+    async def call(self, method_name, *args):
+        await asyncio.sleep(0)
+        self._requests += 1
+        self._last_used = time.monotonic()
+        return method_name
+
+    def get_rss(self):
+        return self.rss
+
+    async def close(self):
+        self._closed = True
+        self._manager._stats_killed += 1
+        self._manager._workers.discard(self)
+
+
+class ForkedWorker:
+    # Instantiated once by the fork server, before the workers
+    # are forked.
+
+    def __init__(self, value):
+        self._value = value
+        self._created_by = os.getpid()
+
+    async def get_info(self):
+        return os.getpid(), self._created_by, self._value
+
+    async def crash(self):
+        os._exit(1)
+
+
+class FakePool(procpool.Pool):
+
+    async def _spawn_worker(self):
+        await asyncio.sleep(0)
+        self._stats_spawned += 1
+        return FakeWorker(self)
+
+
+class TestServerProcPool(tb.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._runstate_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._runstate_dir.cleanup()
+        super().tearDown()
+
+    async def make_pool(self, **kwargs):
+        pool = FakePool(
+            loop=asyncio.get_running_loop(),
+            runstate_dir=self._runstate_dir.name,
+            worker_cls=object,
+            worker_args=(),
+            name='test',
+            **kwargs)
+        await pool.start()
+        return pool
+
+    async def test_server_procpool_grow_01(self):
+        pool = await self.make_pool(min_size=1, pool_size=3)
+        self.assertEqual(pool.get_stats()['workers'], 1)
+
+        w1 = await pool.acquire()
+        # Waiting clients make the pool grow up to its maximum size.
+        waiters = [asyncio.ensure_future(pool.acquire()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(pool.get_stats()['workers'], 3)
+        self.assertEqual(sum(w.done() for w in waiters), 2)
+
+        pool.release(w1)
+        await asyncio.wait_for(asyncio.gather(*waiters), 1)
+        for w in waiters:
+            pool.release(w.result())
+
+        self.assertEqual(pool.get_stats()['spawned'], 3)
+        await pool.stop()
+
+    async def test_server_procpool_recycle_01(self):
+        pool = await self.make_pool(
+            min_size=1, pool_size=1, worker_max_requests=2)
+
+        w1 = await pool.acquire()
+        await w1.call('compile')
+        await w1.call('compile')
+        pool.release(w1)
+
+        w2 = await asyncio.wait_for(pool.acquire(), 1)
+        self.assertIsNot(w1, w2)
+        await asyncio.sleep(0.01)
+        self.assertTrue(w1._closed)
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['recycled'], 1)
+        self.assertEqual(stats['killed'], 1)
+        self.assertEqual(stats['workers'], 1)
+
+        pool.release(w2)
+        await pool.stop()
+
+    async def test_server_procpool_recycle_02(self):
+        # Pinned workers keep the state of their clients and are not
+        # recycled until unpinned.
+        pool = await self.make_pool(
+            min_size=1, pool_size=1, worker_max_requests=1)
+
+        w1 = await pool.acquire()
+        await w1.call('compile')
+        pool.pin(w1)
+        pool.release(w1)
+
+        w2 = await pool.acquire()
+        self.assertIs(w1, w2)
+        pool.unpin(w2)
+        pool.release(w2)
+
+        w3 = await asyncio.wait_for(pool.acquire(), 1)
+        self.assertIsNot(w1, w3)
+        self.assertEqual(pool.get_stats()['recycled'], 1)
+
+        pool.release(w3)
+        await pool.stop()
+
+    async def test_server_procpool_recycle_03(self):
+        pool = await self.make_pool(
+            min_size=2, pool_size=2, worker_max_rss=100)
+
+        w1 = await pool.acquire()
+        w1.rss = 200 * 1024 * 1024
+        pool.release(w1)
+
+        pool._check_workers()
+        await asyncio.sleep(0.01)
+
+        self.assertTrue(w1._closed)
+        stats = pool.get_stats()
+        self.assertEqual(stats['recycled'], 1)
+        self.assertEqual(stats['workers'], 2)
+        await pool.stop()
+
+    async def test_server_procpool_idle_01(self):
+        pool = await self.make_pool(
+            min_size=1, pool_size=3, worker_idle_timeout=0.01)
+
+        workers = [await pool.acquire() for _ in range(3)]
+        for w in workers:
+            pool.release(w)
+        self.assertEqual(pool.get_stats()['workers'], 3)
+
+        await asyncio.sleep(0.02)
+        pool._check_workers()
+        await asyncio.sleep(0.01)
+
+        # Idle workers are stopped down to the minimum size.
+        stats = pool.get_stats()
+        self.assertEqual(stats['workers'], 1)
+        self.assertEqual(stats['killed'], 2)
+        await pool.stop()
+
+    async def test_server_procpool_forkserver_01(self):
+        pool = procpool.Pool(
+            loop=asyncio.get_running_loop(),
+            runstate_dir=self._runstate_dir.name,
+            worker_cls=ForkedWorker,
+            worker_args=('forked',),
+            name='test-forkserver',
+            min_size=1,
+            pool_size=1,
+            use_forkserver=True)
+        await pool.start()
+
+        try:
+            template_pid = pool._forkserver._proc.pid
+
+            pid, created_by, value = await pool.call('get_info')
+            self.assertEqual(value, 'forked')
+            self.assertEqual(created_by, template_pid)
+            self.assertEqual(psutil.Process(pid).ppid(), template_pid)
+
+            # The crashed worker is forked again on the next call.
+            with self.assertRaises(ConnectionError):
+                await pool.call('crash')
+
+            pid2, created_by, _ = await pool.call('get_info')
+            self.assertNotEqual(pid2, pid)
+            self.assertEqual(created_by, template_pid)
+            self.assertEqual(psutil.Process(pid2).ppid(), template_pid)
+
+            # So is the fork server itself.
+            pool._forkserver._proc.kill()
+            await pool._forkserver._proc.wait()
+            with self.assertRaises(ConnectionError):
+                await pool.call('crash')
+
+            pid3, created_by, _ = await pool.call('get_info')
+            self.assertNotEqual(pid3, pid2)
+            self.assertNotEqual(created_by, template_pid)
+            self.assertEqual(created_by, pool._forkserver._proc.pid)
+
+            stats = pool.get_stats()
+            self.assertEqual(stats['spawned'], 3)
+            self.assertEqual(stats['workers'], 1)
+        finally:
+            await pool.stop()
@@ -18,14 +18,39 @@
 
 import asyncio
 import json
+import struct
 
 import edgedb
 
 from edb.common import taskgroup as tg
+from edb.testbase import protocol
 from edb.testbase import server as tb
 from edb.tools import test
 
 
+def get_int64_results(messages):
+    # Return the int64 rows of every completed (or suspended)
+    # command in the messages received from the server.
+    results = []
+    rows = []
+    for msg in messages:
+        if msg.mtype == b'D':
+            el, = protocol.parse_data(msg)
+            rows.append(struct.unpack('!q', el)[0])
+        elif msg.mtype in (b'C', b's'):
+            results.append(rows)
+            rows = []
+        elif msg.mtype == b'E':
+            raise protocol.parse_error(msg)
+    return results
+
+
+def get_tx_status(messages):
+    msg = messages[-1]
+    assert msg.mtype == b'Z', msg
+    return msg.data[-1:]
+
+
 class TestServerProto(tb.QueryTestCase):
 
     ISOLATED_METHODS = False
@@ -1738,6 +1763,345 @@ class TestServerProto(tb.QueryTestCase):
                     SELECT <test::upper_str>'123_hello';
                 """)
 
+    async def test_server_proto_tx_19(self):
+        # The compilers are shared: the ROLLBACK TO SAVEPOINT after
+        # an error, and the commands of the other connection, can be
+        # compiled by any compiler, while the state of each
+        # transaction is kept by the one that compiled its START.
+        con1 = self.con
+        con2 = await self.connect(database=con1.dbname)
+
+        async def worker(con, n):
+            for i in range(3):
+                await con.execute(f'''
+                    START TRANSACTION;
+                    INSERT test::TransactionTest {{
+                        name := 'tx_19_{n}_{i}_a'
+                    }};
+                    DECLARE SAVEPOINT t1;
+                    INSERT test::TransactionTest {{
+                        name := 'tx_19_{n}_{i}_b'
+                    }};
+                ''')
+
+                with self.assertRaises(edgedb.DivisionByZeroError):
+                    await con.fetchall('SELECT 1 // 0')
+
+                await con.execute('ROLLBACK TO SAVEPOINT t1')
+                await con.execute(f'''
+                    INSERT test::TransactionTest {{
+                        name := 'tx_19_{n}_{i}_c'
+                    }};
+                ''')
+                await con.execute('COMMIT')
+
+        try:
+            await asyncio.gather(worker(con1, 1), worker(con2, 2))
+        finally:
+            await con2.close()
+
+        self.assertEqual(
+            await con1.fetchall('''
+                SELECT test::TransactionTest.name
+                FILTER test::TransactionTest.name LIKE 'tx_19_%'
+                ORDER BY test::TransactionTest.name
+            '''),
+            [
+                f'tx_19_{n}_{i}_{s}'
+                for n in (1, 2) for i in range(3) for s in 'ac'
+            ])
+
+    async def test_server_proto_named_stmt_01(self):
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            con.send(
+                protocol.prepare('SELECT {1, 2}', stmt_name=b'a'),
+                protocol.prepare('SELECT 10', stmt_name=b'b'),
+                protocol.sync(),
+            )
+            self.assertEqual(
+                [msg.mtype for msg in await con.recv_until_sync()],
+                [b'1', b'1', b'Z'])
+
+            # Each statement is executed with its own query, whether
+            # the client waits for the results or not.
+            for _ in range(2):
+                results = []
+                for stmt_name in (b'a', b'b', b'a', b'b'):
+                    con.send(
+                        protocol.execute(stmt_name=stmt_name),
+                        protocol.sync(),
+                    )
+                    results.extend(get_int64_results(
+                        await con.recv_until_sync()))
+                self.assertEqual(
+                    [sorted(rows) for rows in results],
+                    [[1, 2], [10], [1, 2], [10]])
+
+                con.send(
+                    protocol.execute(stmt_name=b'b'),
+                    protocol.execute(stmt_name=b'a'),
+                    protocol.execute(stmt_name=b'a'),
+                    protocol.execute(stmt_name=b'b'),
+                    protocol.sync(),
+                )
+                results = get_int64_results(await con.recv_until_sync())
+                self.assertEqual(
+                    [sorted(rows) for rows in results],
+                    [[10], [1, 2], [1, 2], [10]])
+        finally:
+            con.close()
+
+    async def test_server_proto_named_stmt_02(self):
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            con.send(
+                protocol.prepare('SELECT 1', stmt_name=b'a'),
+                protocol.execute(stmt_name=b'a'),
+                protocol.sync(),
+            )
+            self.assertEqual(
+                get_int64_results(await con.recv_until_sync()), [[1]])
+
+            con.send(
+                protocol.prepare('SELECT 2', stmt_name=b'a'),
+                protocol.sync(),
+            )
+            with self.assertRaisesRegex(edgedb.BinaryProtocolError,
+                                        "'a' already exists"):
+                get_int64_results(await con.recv_until_sync())
+
+            con.send(
+                protocol.close(b'a'),
+                protocol.execute(stmt_name=b'a'),
+                protocol.sync(),
+            )
+            with self.assertRaisesRegex(edgedb.TypeSpecNotFoundError,
+                                        "'a' does not exist"):
+                get_int64_results(await con.recv_until_sync())
+
+            # Closing a statement that doesn't exist is not an error,
+            # and the name of a closed statement can be reused.
+            con.send(
+                protocol.close(b'a'),
+                protocol.prepare('SELECT 2', stmt_name=b'a'),
+                protocol.execute(stmt_name=b'a'),
+                protocol.sync(),
+            )
+            self.assertEqual(
+                get_int64_results(await con.recv_until_sync()), [[2]])
+        finally:
+            con.close()
+
+    async def test_server_proto_pipeline_01(self):
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            con.send(
+                protocol.prepare('SELECT 1', stmt_name=b'one'),
+                protocol.prepare('SELECT 1 // 0', stmt_name=b'div'),
+                protocol.prepare('SELECT 2', stmt_name=b'two'),
+                protocol.sync(),
+            )
+            await con.recv_until_sync()
+
+            # The queries following the failed one are not executed
+            # and the error is reported once.
+            con.send(
+                protocol.execute(stmt_name=b'one'),
+                protocol.execute(stmt_name=b'div'),
+                protocol.execute(stmt_name=b'two'),
+                protocol.execute(stmt_name=b'one'),
+                protocol.sync(),
+            )
+            messages = await con.recv_until_sync()
+            self.assertEqual(
+                [msg.mtype for msg in messages],
+                [b'D', b'C', b'E', b'Z'])
+            self.assertEqual(get_int64_results(messages[:2]), [[1]])
+            self.assertIsInstance(protocol.parse_error(messages[2]),
+                                  edgedb.DivisionByZeroError)
+            self.assertEqual(get_tx_status(messages), b'I')
+
+            con.send(
+                protocol.execute(stmt_name=b'two'),
+                protocol.execute(stmt_name=b'one'),
+                protocol.sync(),
+            )
+            self.assertEqual(
+                get_int64_results(await con.recv_until_sync()),
+                [[2], [1]])
+        finally:
+            con.close()
+
+    async def test_server_proto_pipeline_02(self):
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            con.send(
+                protocol.prepare('SELECT 1', stmt_name=b'one'),
+                protocol.prepare('SELECT 2', stmt_name=b'two'),
+                protocol.sync(),
+            )
+            await con.recv_until_sync()
+
+            # More queries than are sent to Postgres at once.
+            stmt_names = [b'one', b'two'] * 125
+            con.send(
+                *(protocol.execute(stmt_name=stmt_name)
+                  for stmt_name in stmt_names),
+                protocol.sync(),
+            )
+            messages = await con.recv_until_sync()
+            self.assertEqual(
+                [msg.mtype for msg in messages].count(b'Z'), 1)
+            self.assertEqual(
+                get_int64_results(messages),
+                [[1], [2]] * 125)
+        finally:
+            con.close()
+
+    async def test_server_proto_backpressure_01(self):
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            # 20MB of data: much more than the socket buffers hold.
+            con.send(
+                protocol.prepare(
+                    "SELECT re_match_all('.{10000}', "
+                    "str_repeat('.', 20000000))[0]"),
+                protocol.execute(),
+                protocol.sync(),
+            )
+
+            # The client doesn't read the result for a while, so the
+            # server stops reading it from Postgres; the other
+            # connections are served meanwhile.
+            await asyncio.sleep(1)
+            self.assertEqual(await self.con.fetchone('SELECT 1'), 1)
+
+            messages = await con.recv_until_sync()
+            self.assertEqual(
+                [msg.mtype for msg in messages if msg.mtype != b'D'],
+                [b'1', b'C', b'Z'])
+            rows = [protocol.parse_data(msg)
+                    for msg in messages if msg.mtype == b'D']
+            self.assertEqual(len(rows), 2000)
+            self.assertTrue(all(row == [b'.' * 10000] for row in rows))
+        finally:
+            con.close()
+
+    async def test_server_proto_row_limit_01(self):
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            con.send(protocol.execute_script('START TRANSACTION'))
+            await con.recv_until_sync()
+
+            con.send(
+                protocol.prepare('SELECT {1, 2, 3, 4, 5}'),
+                protocol.execute(row_limit=2),
+                protocol.sync(),
+            )
+            messages = await con.recv_until_sync()
+            self.assertEqual(
+                [msg.mtype for msg in messages],
+                [b'1', b'D', b'D', b's', b'Z'])
+            rows, = get_int64_results(messages)
+
+            con.send(protocol.fetch_more(2), protocol.sync())
+            messages = await con.recv_until_sync()
+            self.assertEqual(
+                [msg.mtype for msg in messages],
+                [b'D', b'D', b's', b'Z'])
+            rows += get_int64_results(messages)[0]
+
+            # The rows run out before the limit.
+            con.send(protocol.fetch_more(2), protocol.sync())
+            messages = await con.recv_until_sync()
+            self.assertEqual(
+                [msg.mtype for msg in messages],
+                [b'D', b'C', b'Z'])
+            rows += get_int64_results(messages)[0]
+
+            self.assertEqual(sorted(rows), [1, 2, 3, 4, 5])
+            self.assertEqual(get_tx_status(messages), b'T')
+
+            con.send(protocol.fetch_more(2), protocol.sync())
+            with self.assertRaisesRegex(edgedb.BinaryProtocolError,
+                                        'no suspended result'):
+                get_int64_results(await con.recv_until_sync())
+        finally:
+            con.close()
+
+    async def test_server_proto_row_limit_02(self):
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            con.send(protocol.execute_script('START TRANSACTION'))
+            await con.recv_until_sync()
+
+            con.send(
+                protocol.prepare('SELECT {1, 2, 3, 4, 5}'),
+                protocol.execute(row_limit=2),
+                protocol.sync(),
+            )
+            self.assertEqual(
+                [len(rows) for rows in get_int64_results(
+                    await con.recv_until_sync())],
+                [2])
+
+            # The end of the transaction closes the suspended result.
+            con.send(protocol.execute_script('COMMIT'))
+            messages = await con.recv_until_sync()
+            self.assertEqual(get_tx_status(messages), b'I')
+
+            con.send(protocol.fetch_more(2), protocol.sync())
+            with self.assertRaisesRegex(edgedb.BinaryProtocolError,
+                                        'no suspended result'):
+                get_int64_results(await con.recv_until_sync())
+        finally:
+            con.close()
+
+    async def test_server_proto_row_limit_03(self):
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            con.send(
+                protocol.prepare('SELECT {1, 2, 3, 4, 5}'),
+                protocol.execute(row_limit=2),
+                protocol.sync(),
+            )
+            with self.assertRaisesRegex(edgedb.BinaryProtocolError,
+                                        'in transaction blocks'):
+                get_int64_results(await con.recv_until_sync())
+
+            # The whole result can be fetched.
+            con.send(protocol.execute(), protocol.sync())
+            results = get_int64_results(await con.recv_until_sync())
+            self.assertEqual([sorted(rows) for rows in results],
+                             [[1, 2, 3, 4, 5]])
+        finally:
+            con.close()
+
+    async def test_server_proto_anon_stmt_01(self):
+        # Outside of transactions the backend connection is returned
+        # to the pool on Sync, so the anonymous statement is executed
+        # on whichever connection is lent for the Execute.
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            for i in range(3):
+                # The first time the query is compiled, then it is
+                # served from the cache.
+                con.send(protocol.prepare('SELECT 1 + 41'), protocol.sync())
+                await con.recv_until_sync()
+
+                # Another client connection borrows a backend
+                # connection in between.
+                await self.con.query('SELECT 1')
+
+                con.send(protocol.execute(), protocol.sync())
+                self.assertEqual(
+                    get_int64_results(await con.recv_until_sync()),
+                    [[42]],
+                    f'iteration {i}')
+        finally:
+            con.close()
+
 
 class TestServerProtoDDL(tb.NonIsolatedDDLTestCase):
 
@@ -2197,3 +2561,129 @@ class TestServerProtoDDL(tb.NonIsolatedDDLTestCase):
 
         finally:
             await self.con.execute('ROLLBACK')
+
+    async def test_server_proto_query_cache_invalidate_10(self):
+        typename = 'CacheInv_10'
+
+        await self.con.execute('START TRANSACTION')
+        try:
+            await self.con.execute(f'''
+                CREATE TYPE test::{typename} {{
+                    CREATE REQUIRED PROPERTY prop1 -> std::str;
+                }};
+
+                INSERT test::{typename} {{
+                    prop1 := 'aaa'
+                }};
+            ''')
+
+            query = f'SELECT test::{typename}.prop1'
+
+            for _ in range(5):
+                self.assertEqual(
+                    await self.con.fetchall(query),
+                    edgedb.Set(['aaa']))
+
+            await self.con.execute('DECLARE SAVEPOINT t1')
+
+            await self.con.execute(f'''
+                DELETE (SELECT test::{typename});
+
+                ALTER TYPE test::{typename} {{
+                    DROP PROPERTY prop1;
+                }};
+
+                ALTER TYPE test::{typename} {{
+                    CREATE REQUIRED PROPERTY prop1 -> std::int64;
+                }};
+
+                INSERT test::{typename} {{
+                    prop1 := 123
+                }};
+            ''')
+
+            for _ in range(5):
+                self.assertEqual(
+                    await self.con.fetchall(query),
+                    edgedb.Set([123]))
+
+            await self.con.execute('ROLLBACK TO SAVEPOINT t1')
+
+            for _ in range(5):
+                self.assertEqual(
+                    await self.con.fetchall(query),
+                    edgedb.Set(['aaa']))
+
+        finally:
+            await self.con.execute('ROLLBACK')
+
+    async def test_server_proto_named_stmt_ddl_01(self):
+        typename = 'NamedStmt_01'
+
+        await self.con.execute(f'''
+            CREATE TYPE test::{typename} {{
+                CREATE PROPERTY prop1 -> std::int64;
+            }};
+
+            INSERT test::{typename} {{
+                prop1 := 1
+            }};
+        ''')
+
+        con = await self.connect_protocol(database=self.con.dbname)
+        try:
+            con.send(
+                protocol.prepare(f'SELECT test::{typename}.prop1',
+                                 stmt_name=b'q'),
+                protocol.execute(stmt_name=b'q'),
+                protocol.sync(),
+            )
+            self.assertEqual(
+                get_int64_results(await con.recv_until_sync()), [[1]])
+
+            # The statement is compiled again for the new schema.
+            await self.con.execute(f'''
+                ALTER TYPE test::{typename} {{
+                    CREATE PROPERTY prop2 -> std::str;
+                }};
+
+                INSERT test::{typename} {{
+                    prop1 := 2
+                }};
+            ''')
+
+            con.send(protocol.execute(stmt_name=b'q'), protocol.sync())
+            results = get_int64_results(await con.recv_until_sync())
+            self.assertEqual([sorted(rows) for rows in results], [[1, 2]])
+
+            await self.con.execute(f'''
+                ALTER TYPE test::{typename} {{
+                    DROP PROPERTY prop1;
+                }};
+
+                ALTER TYPE test::{typename} {{
+                    CREATE PROPERTY prop1 -> std::str;
+                }};
+            ''')
+
+            # The type of the result has changed: the statement
+            # must be described again before it can be executed.
+            for _ in range(2):
+                con.send(protocol.execute(stmt_name=b'q'), protocol.sync())
+                with self.assertRaisesRegex(edgedb.TypeSpecNotFoundError,
+                                            'has changed'):
+                    get_int64_results(await con.recv_until_sync())
+
+            con.send(
+                protocol.describe(stmt_name=b'q'),
+                protocol.execute(stmt_name=b'q'),
+                protocol.sync(),
+            )
+            self.assertEqual(
+                [msg.mtype for msg in await con.recv_until_sync()],
+                [b'T', b'C', b'Z'])
+        finally:
+            con.close()
+            await self.con.execute(f'''
+                DROP TYPE test::{typename};
+            ''')
@@ -0,0 +1,97 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import unittest
+
+from edb.server import cache
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def test_server_querycache_01(self):
+        with self.assertRaisesRegex(ValueError, 'greater than 0'):
+            cache.QueryCache(maxsize=0)
+
+    def test_server_querycache_02(self):
+        qc = cache.QueryCache(maxsize=2)
+
+        qc.put('a', 1, 'A')
+        qc.put('b', 1, 'B')
+        # "a" becomes the most recently used entry.
+        self.assertEqual(qc.get('a', 1), 'A')
+
+        qc.put('c', 1, 'C')
+        self.assertEqual(len(qc), 2)
+        self.assertIsNone(qc.get('b', 1))
+        self.assertEqual(qc.get('a', 1), 'A')
+        self.assertEqual(qc.get('c', 1), 'C')
+        self.assertEqual(qc.evictions, 1)
+
+    def test_server_querycache_03(self):
+        qc = cache.QueryCache(maxsize=10)
+
+        qc.put('a', 1, 'A')
+        qc.put('b', 1, 'B')
+
+        # Caching a query compiled against a newer version of the
+        # schema purges the older entries.
+        qc.put('c', 2, 'C')
+        self.assertEqual(len(qc), 1)
+        self.assertEqual(qc.purges, 2)
+        self.assertEqual(qc.get('c', 2), 'C')
+        self.assertIsNone(qc.get('a', 1))
+
+        # Purging drops the entries of all other versions.
+        qc.purge(3)
+        self.assertEqual(qc.purges, 3)
+        self.assertEqual(len(qc), 0)
+
+    def test_server_querycache_04(self):
+        qc = cache.QueryCache(maxsize=10)
+
+        qc.put('a', 2, 'A2')
+
+        # The query was compiled before the schema was changed; it
+        # must not replace the newer entry.
+        qc.put('a', 1, 'A1')
+        qc.put('b', 1, 'B1')
+        self.assertEqual(len(qc), 1)
+        self.assertEqual(qc.get('a', 2), 'A2')
+        self.assertIsNone(qc.get('b', 1))
+
+    def test_server_querycache_05(self):
+        qc = cache.QueryCache(maxsize=1)
+
+        self.assertIsNone(qc.get('a', 1))
+        qc.put('a', 1, 'A')
+        self.assertEqual(qc.get('a', 1), 'A')
+        qc.put('b', 1, 'B')
+
+        # A lookup with a different version drops the entry.
+        self.assertIsNone(qc.get('b', 2))
+        self.assertEqual(len(qc), 0)
+
+        self.assertEqual(qc.get_stats(), {
+            'size': 0,
+            'maxsize': 1,
+            'hits': 1,
+            'misses': 2,
+            'evictions': 1,
+            'purges': 1,
+        })
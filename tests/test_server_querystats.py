@@ -0,0 +1,149 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import os.path
+import re
+import tempfile
+
+from edb.pgsql import metaschema
+from edb.server import querystats
+from edb.testbase import lang as tb_lang
+from edb.testbase import server as tb
+
+
+class TestServerQueryStats(tb.TestCase):
+
+    def test_server_querystats_01(self):
+        stats = querystats.QueryStats(maxsize=10)
+        stats.record_compile('db', b'aa', b'SELECT 1', 0.5)
+        stats.record_execute('db', b'aa', 0.25, 1)
+        stats.record_cache_hit('db', b'aa', b'SELECT 1')
+        stats.record_execute('db', b'aa', 0.75, 1)
+        # The same query in another database is counted separately.
+        stats.record_compile('other', b'aa', b'SELECT 1', 0.1)
+
+        entries = {
+            e['database']: e for e in stats.as_list()
+        }
+        self.assertEqual(set(entries), {'db', 'other'})
+        self.assertEqual(entries['db'], {
+            'database': 'db',
+            'sql_hash': 'aa',
+            'query': 'SELECT 1',
+            'calls': 2,
+            'cache_hits': 1,
+            'compilations': 1,
+            'total_compile_time': 0.5,
+            'max_compile_time': 0.5,
+            'total_exec_time': 1.0,
+            'max_exec_time': 0.75,
+            'rows': 2,
+        })
+        self.assertEqual(entries['other']['calls'], 0)
+
+    def test_server_querystats_02(self):
+        stats = querystats.QueryStats(maxsize=2)
+        stats.record_compile('db', b'aa', b'SELECT 1', 0.1)
+        stats.record_compile('db', b'bb', b'SELECT 2', 0.1)
+        stats.record_cache_hit('db', b'aa', b'SELECT 1')
+        stats.record_compile('db', b'cc', b'SELECT 3', 0.1)
+
+        # The least recently used query is discarded, and its
+        # executions are not recorded anymore.
+        stats.record_execute('db', b'bb', 0.1, 1)
+        self.assertEqual(
+            sorted(e['sql_hash'] for e in stats.as_list()), ['aa', 'cc'])
+
+    def test_server_querystats_slow_log_01(self):
+        stats = querystats.QueryStats(maxsize=10)
+        stats.record_compile('db', b'aa', b'SELECT 1', 1.0)
+        with self.assertLogs('edb.server', level='INFO') as cm:
+            stats.slow_query_threshold = 0.5
+            stats.record_execute('db', b'aa', 0.1, 1)
+            stats.record_execute('db', b'aa', 0.6, 1)
+        self.assertEqual(len(cm.output), 1)
+        self.assertIn('slow query execution', cm.output[0])
+        self.assertIn('SELECT 1', cm.output[0])
+
+    async def test_server_querystats_save_01(self):
+        stats = querystats.QueryStats(maxsize=10)
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, '0.json')
+
+            await stats.save(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), [])
+
+            stats.record_compile('db', b'aa', b'SELECT 1', 0.1)
+            await stats.save(path)
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)), 1)
+
+            # Unchanged statistics are not saved again.
+            os.unlink(path)
+            await stats.save(path)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(os.listdir(td), [])
+
+    async def test_server_querystats_save_02(self):
+        stats = querystats.QueryStats(maxsize=10)
+        stats.record_compile('db', b'aa', b'SELECT 1', 0.1)
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'missing', '0.json')
+            with self.assertRaises(FileNotFoundError):
+                await stats.save(path)
+
+            # The statistics are saved again after a failure.
+            os.mkdir(os.path.dirname(path))
+            await stats.save(path)
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)), 1)
+
+    async def test_server_querystats_view_01(self):
+        # The sys::QueryStats view reads the saved files with the
+        # Postgres JSON functions; every field it reads must be
+        # saved, with a value its cast accepts.
+        view = metaschema._generate_query_stats_view(
+            tb_lang._load_std_schema())
+        fields = set(re.findall(r"v->>'(\w+)'", view.query))
+        casts = dict(re.findall(r"\(v->>'(\w+)'\)::(\w+)", view.query))
+        self.assertEqual(
+            fields - set(casts), {'database', 'sql_hash', 'query'})
+
+        stats = querystats.QueryStats(maxsize=10)
+        stats.record_compile('db', b'aa', b'SELECT 1', 0.5)
+        stats.record_execute('db', b'aa', 0.25, 1)
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, '0.json')
+            await stats.save(path)
+            with open(path) as f:
+                entries = json.load(f)
+
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(set(entries[0]), fields)
+        for field, value in entries[0].items():
+            cast = casts.get(field)
+            if cast == 'int8':
+                self.assertIsInstance(value, int, field)
+            elif cast == 'float8':
+                self.assertIsInstance(value, (int, float), field)
+            else:
+                self.assertIsNone(cast, field)
+                self.assertIsInstance(value, str, field)
@@ -0,0 +1,92 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from edb.server import server as edbserver
+from edb.testbase import server as tb
+
+
+class FakeConnection:
+
+    def __init__(self, row):
+        self.row = row
+
+    async def simple_query(self, sql, ignore_data):
+        return [self.row]
+
+
+def make_server(num_replicas):
+    server = edbserver.Server.__new__(edbserver.Server)
+    server._replicas = [
+        edbserver._Replica(('localhost', 5433 + i), f'pool{i}')
+        for i in range(num_replicas)
+    ]
+    server._replica_max_lag = 0.0
+    server._replica_min_lsn = 0
+    server._next_replica = 0
+    return server
+
+
+class TestServerReplicas(tb.TestCase):
+
+    async def test_server_replicas_lsn_01(self):
+        self.assertEqual(edbserver._parse_lsn('0/0'), 0)
+        self.assertEqual(edbserver._parse_lsn('16/B374D848'), 0x16B374D848)
+
+    async def test_server_replicas_check_01(self):
+        server = make_server(1)
+        replica = server._replicas[0]
+
+        replica.monitor_con = FakeConnection([b'1/3000060', b'0'])
+        self.assertTrue(await server._check_replica(replica))
+        self.assertEqual(replica.replay_lsn, 0x103000060)
+
+        # The standby hasn't replayed the last schema change yet.
+        server._replica_min_lsn = 0x103000100
+        self.assertFalse(await server._check_replica(replica))
+
+        replica.monitor_con = FakeConnection([b'1/3000100', b'0.5'])
+        self.assertFalse(await server._check_replica(replica))
+        server._replica_max_lag = 1.0
+        self.assertTrue(await server._check_replica(replica))
+
+        # The server is not a standby.
+        replica.monitor_con = FakeConnection([None, b'0'])
+        self.assertFalse(await server._check_replica(replica))
+
+    async def test_server_replicas_pool_01(self):
+        server = make_server(2)
+        replica1, replica2 = server._replicas
+        replica1.available = replica2.available = True
+        replica1.replay_lsn = 100
+        replica2.replay_lsn = 200
+
+        self.assertEqual(
+            [server.get_replica_pool() for _ in range(3)],
+            ['pool0', 'pool1', 'pool0'])
+
+        # A connection only reads from the replicas that have
+        # replayed its writes.
+        self.assertEqual(
+            [server.get_replica_pool(150) for _ in range(2)],
+            ['pool1', 'pool1'])
+        self.assertIsNone(server.get_replica_pool(201))
+
+        replica2.available = False
+        self.assertIsNone(server.get_replica_pool(150))
+        self.assertEqual(server.get_replica_pool(100), 'pool0')
@@ -0,0 +1,93 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+import os
+import tempfile
+import unittest
+import uuid
+
+from edb.server.compiler import schemacache
+
+
+class FakeSchema:
+
+    def __init__(self, id_to_data):
+        self._id_to_data = id_to_data
+
+
+class TestSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.std_schema = FakeSchema({
+            uuid.uuid4(): {'name': 'std::str'},
+            uuid.uuid4(): {'name': 'std::int64'},
+        })
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_server_schemacache_01(self):
+        cache = schemacache.SchemaCache(
+            self.tmpdir.name, schemacache.SchemaPickler(self.std_schema))
+
+        self.assertIsNone(cache.load('db', 1))
+
+        id_to_data = dict(self.std_schema._id_to_data)
+        id_to_data[uuid.uuid4()] = {'name': 'default::User'}
+        cache.store('db', 1, FakeSchema(id_to_data))
+
+        # Another process loading the schema shares std objects
+        # with its own std schema.
+        cache2 = schemacache.SchemaCache(
+            self.tmpdir.name, schemacache.SchemaPickler(self.std_schema))
+        schema = cache2.load('db', 1)
+        self.assertEqual(schema._id_to_data, id_to_data)
+        for obj_id, data in self.std_schema._id_to_data.items():
+            self.assertIs(schema._id_to_data[obj_id], data)
+
+        # Storing a newer version removes the older ones.
+        cache.store('db', 2, FakeSchema(id_to_data))
+        self.assertIsNone(cache.load('db', 1))
+        self.assertIsNotNone(cache.load('db', 2))
+        self.assertIsNone(cache.load('other', 2))
+
+    def test_server_schemacache_02(self):
+        cache = schemacache.SchemaCache(
+            self.tmpdir.name, schemacache.SchemaPickler(self.std_schema))
+        events = []
+
+        async def locked(n):
+            async with cache.lock('db'):
+                events.append(('enter', n))
+                await asyncio.sleep(0.02)
+                events.append(('exit', n))
+
+        async def main():
+            await asyncio.gather(locked(1), locked(2))
+
+        asyncio.run(main())
+
+        self.assertEqual(len(events), 4)
+        self.assertEqual(events[0][0], 'enter')
+        self.assertEqual(events[1], ('exit', events[0][1]))
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir.name)),
+            [f'{cache._get_prefix("db")}.lock'])
@@ -0,0 +1,126 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+import json
+
+from edb.server import sysevents
+from edb.server.pgcon import errors as pgerror
+from edb.testbase import server as tb
+
+
+class FakeConnection:
+
+    def __init__(self, *, has_sequence=True):
+        self.connected = True
+        self.has_sequence = has_sequence
+        self.version = 0
+        self.notifications = []
+        self.fail = False
+
+    async def simple_query(self, sql, ignore_data):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise ConnectionAbortedError
+        if b'_sysevent_version' in sql:
+            if not self.has_sequence:
+                raise pgerror.BackendError(fields={'C': '42P01'})
+            if b'nextval' in sql:
+                self.version += 1
+            return [[str(self.version).encode()]]
+        self.notifications.append(sql.decode())
+
+    def terminate(self):
+        self.connected = False
+
+
+class TestServerSysEvents(tb.TestCase):
+
+    def make_sender(self, **kwargs):
+        async def connect():
+            con = FakeConnection(**kwargs)
+            connected.append(con)
+            return con
+
+        connected = []
+        sender = sysevents.SysEventSender(
+            connect=connect, channel='__events__')
+        return sender, connected
+
+    def get_events(self, con):
+        events = []
+        for sql in con.notifications:
+            self.assertTrue(sql.startswith("SELECT pg_notify('__events__', "))
+            payload = sql[len("SELECT pg_notify('__events__', '"):-2]
+            events.append(json.loads(payload.replace("''", "'")))
+        return events
+
+    async def test_server_sysevents_01(self):
+        sender, connected = self.make_sender()
+
+        # The events are sent one at a time on the same connection.
+        versions = await asyncio.gather(*(
+            sender.send({'event': 'schema-changes', 'dbname': f'db{i}'})
+            for i in range(3)
+        ))
+        self.assertEqual(versions, [1, 2, 3])
+        self.assertEqual(len(connected), 1)
+        self.assertEqual(self.get_events(connected[0]), [
+            {'event': 'schema-changes', 'dbname': 'db0', 'version': 1},
+            {'event': 'schema-changes', 'dbname': 'db1', 'version': 2},
+            {'event': 'schema-changes', 'dbname': 'db2', 'version': 3},
+        ])
+
+        sender.close()
+        self.assertFalse(connected[0].connected)
+
+    async def test_server_sysevents_02(self):
+        sender, connected = self.make_sender()
+
+        await sender.send({'event': 'system-config-changes'})
+        connected[0].fail = True
+        with self.assertRaises(ConnectionAbortedError):
+            await sender.send({'event': 'system-config-changes'})
+        self.assertFalse(connected[0].connected)
+
+        # A new connection is opened for the next event.
+        self.assertEqual(
+            await sender.send({'event': 'system-config-changes'}), 1)
+        self.assertEqual(len(connected), 2)
+        self.assertEqual(len(self.get_events(connected[1])), 1)
+
+    async def test_server_sysevents_03(self):
+        sender, connected = self.make_sender(has_sequence=False)
+
+        self.assertIsNone(await sender.send({'event': 'schema-changes'}))
+        self.assertEqual(self.get_events(connected[0]), [
+            {'event': 'schema-changes', 'version': None},
+        ])
+
+    async def test_server_sysevents_04(self):
+        con = FakeConnection()
+        self.assertEqual(await sysevents.get_version(con), 0)
+
+        # The version is advanced by the DDL transactions and by
+        # the notifications of system config changes.
+        con.version = 2
+        self.assertEqual(await sysevents.get_version(con), 2)
+
+        con = FakeConnection(has_sequence=False)
+        self.assertIsNone(await sysevents.get_version(con))
@@ -0,0 +1,72 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import os.path
+import tempfile
+import time
+import unittest
+
+from edb.server import tracing
+
+
+class TestServerTracing(unittest.TestCase):
+
+    def test_server_tracing_01(self):
+        trace = tracing.Trace('execute', reply=True)
+        start = time.monotonic()
+        trace.add_span('compile', start, start + 0.5)
+        trace.add_compile_spans(start, (
+            ('parse', 0.0, 0.1),
+            ('ir', 0.1, 0.2),
+        ))
+        trace.attrs['cached'] = False
+        trace.finish()
+
+        data = json.loads(trace.as_json())
+        self.assertEqual(data['name'], 'execute')
+        self.assertEqual(data['attrs'], {'cached': False})
+        self.assertGreaterEqual(data['duration'], 0)
+
+        spans = {span['name']: span for span in data['spans']}
+        self.assertEqual(
+            list(spans), ['compile', 'compile.parse', 'compile.ir'])
+        self.assertAlmostEqual(spans['compile']['duration'], 0.5)
+        self.assertAlmostEqual(
+            spans['compile.ir']['start'],
+            spans['compile']['start'] + 0.1)
+        self.assertAlmostEqual(spans['compile.ir']['duration'], 0.2)
+
+    def test_server_tracing_file_exporter_01(self):
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'traces.json')
+            exporter = tracing.FileExporter(path)
+            try:
+                for name in ('parse', 'execute'):
+                    trace = tracing.Trace(name, reply=False)
+                    trace.finish()
+                    exporter.export(trace)
+            finally:
+                exporter.close()
+
+            with open(path) as f:
+                traces = [json.loads(line) for line in f]
+
+        self.assertEqual([t['name'] for t in traces], ['parse', 'execute'])
+        self.assertNotEqual(traces[0]['trace_id'], traces[1]['trace_id'])